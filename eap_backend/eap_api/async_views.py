@@ -0,0 +1,83 @@
+"""
+Async variants of the read-heavy views, used instead of those in views.py when
+settings.ASYNC_VIEWS is on, and the API is served as an ASGI application (see
+asgi.py).
+
+Under ASGI, Django runs every synchronous view in the same thread, one request at a
+time, so a single slow case_detail holds up every other request to the process.
+Django 3.2 has no async ORM, so these views run the views of views.py in a pool of
+settings.ASYNC_VIEW_THREADS threads of their own instead, each with its own
+database connection, and the process can serve as many requests at a time, e.g.
+from the editors polling their cases, while waiting on the database.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from . import views
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_VIEW_THREADS, thread_name_prefix="eap-view"
+            )
+    return _pool
+
+
+def _run_in_thread(view, request, *args, **kwargs):
+    # Done by the request_started and request_finished signals for the connections
+    # of the thread Django runs synchronous code in, and needed for those of the
+    # threads of the pool too, so that they are closed or reused as configured.
+    close_old_connections()
+    try:
+        return view(request, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def run_in_pool(view):
+    """
+    Make an async view out of a synchronous view, running it in the pool of threads
+    of the async views. With ASYNC_VIEW_THREADS set to 0, it is run in the thread
+    Django runs synchronous code in instead, as without this, e.g. for tests.
+    """
+
+    @functools.wraps(view)
+    async def async_view(request, *args, **kwargs):
+        if not settings.ASYNC_VIEW_THREADS:
+            return await sync_to_async(view)(request, *args, **kwargs)
+        call = functools.partial(_run_in_thread, view, request, *args, **kwargs)
+        # Copied, for RequestMetricsMiddleware to see the queries of the view.
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_pool(), context.run, call)
+
+    return async_view
+
+
+case_list = run_in_pool(views.case_list)
+case_detail = run_in_pool(views.case_detail)
+goal_list = run_in_pool(views.goal_list)
+goal_detail = run_in_pool(views.goal_detail)
+context_list = run_in_pool(views.context_list)
+context_detail = run_in_pool(views.context_detail)
+description_list = run_in_pool(views.description_list)
+description_detail = run_in_pool(views.description_detail)
+property_claim_list = run_in_pool(views.property_claim_list)
+property_claim_detail = run_in_pool(views.property_claim_detail)
+evidential_claim_list = run_in_pool(views.evidential_claim_list)
+evidential_claim_detail = run_in_pool(views.evidential_claim_detail)
+evidence_list = run_in_pool(views.evidence_list)
+evidence_detail = run_in_pool(views.evidence_detail)
+parents = run_in_pool(views.parents)
@@ -0,0 +1,432 @@
+"""
+Benchmarks of the hot paths of the API, run by `python manage.py benchmark`, on
+synthetic assurance cases of a configurable shape.
+
+Every request goes through the Django test client, with the whole middleware
+stack, against the database in the settings, so running the command once with
+SQLite and once with Postgres (DBHOST etc. set) compares the two. Everything is
+done in a transaction that is rolled back at the end, so nothing is left behind.
+
+run_load instead measures the throughput of a running server, e.g. one started by
+run_production.sh, with many clients polling a case at once, and run_query_plans
+checks that the database plans the lookups of the views with the indexes made for
+them.
+"""
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from .models import (
+    AssuranceCase,
+    EAPGroup,
+    EAPUser,
+    PropertyClaim,
+    EvidentialClaim,
+    Evidence,
+)
+from .view_utils import (
+    delete_case,
+    get_allowed_cases,
+    invalidate_case_trees,
+    save_json_tree,
+)
+
+
+def make_case_json(
+    goals=2, depth=3, fan_out=3, evidential_claims=2, evidence=2, owner=None
+):
+    """
+    Return the JSON of a synthetic case, as POSTed to /api/cases/.
+
+    Params
+    ======
+    goals: number of TopLevelNormativeGoals, each with a Context and a
+        SystemDescription
+    depth: number of levels of PropertyClaims under each goal
+    fan_out: number of PropertyClaims under each goal and under each PropertyClaim
+        above the last level
+    evidential_claims: number of EvidentialClaims under each PropertyClaim of the
+        last level
+    evidence: number of Evidence under each EvidentialClaim
+    owner: id of the EAPUser owning the case, if any
+    """
+
+    def text(kind, i):
+        return {
+            "name": f"{kind} {i}",
+            "short_description": f"A short description of {kind} {i}",
+            "long_description": f"A longer description of {kind} {i}",
+        }
+
+    def claims(level):
+        items = []
+        for i in range(fan_out):
+            claim = text("PropertyClaim", i)
+            if level < depth:
+                claim["property_claims"] = claims(level + 1)
+            else:
+                claim["evidential_claims"] = [
+                    dict(
+                        text("EvidentialClaim", j),
+                        evidence=[
+                            dict(text("Evidence", k), URL=f"http://evidence{k}.com")
+                            for k in range(evidence)
+                        ],
+                    )
+                    for j in range(evidential_claims)
+                ]
+            items.append(claim)
+        return items
+
+    return {
+        "name": "Benchmark case",
+        "description": "A synthetic case for benchmarks",
+        "owner": owner,
+        "goals": [
+            dict(
+                text("TopLevelNormativeGoal", i),
+                keywords="benchmark",
+                context=[text("Context", 0)],
+                system_description=[text("SystemDescription", 0)],
+                property_claims=claims(1) if depth else [],
+            )
+            for i in range(goals)
+        ],
+    }
+
+
+def make_case(case_json, shared_by=1, seed=0):
+    """
+    Write a synthetic case, and link each of its EvidentialClaims to more
+    PropertyClaims of the case, as when evidence backs several claims.
+
+    Params
+    ======
+    case_json: JSON of the case, as returned by make_case_json
+    shared_by: number of PropertyClaims each EvidentialClaim is under
+    seed: seed of the random choice of the extra PropertyClaims
+
+    Returns
+    =======
+    id of the new AssuranceCase
+    """
+    response = save_json_tree(case_json, "assurance_case")
+    case_id = json.loads(response.content)["id"]
+    claim_ids = list(
+        PropertyClaim.objects.filter(assurance_case_id=case_id).values_list(
+            "id", flat=True
+        )
+    )
+    through = EvidentialClaim.property_claim.through
+    links = through.objects.filter(evidentialclaim__assurance_case_id=case_id)
+    parents = {}
+    for evidential_claim_id, claim_id in links.values_list(
+        "evidentialclaim_id", "propertyclaim_id"
+    ):
+        parents.setdefault(evidential_claim_id, set()).add(claim_id)
+    rng = random.Random(seed)
+    extra_links = []
+    for evidential_claim_id, claim_ids_above in parents.items():
+        others = [pk for pk in claim_ids if pk not in claim_ids_above]
+        count = min(shared_by - len(claim_ids_above), len(others))
+        for claim_id in rng.sample(others, max(count, 0)):
+            extra_links.append(
+                through(
+                    evidentialclaim_id=evidential_claim_id, propertyclaim_id=claim_id
+                )
+            )
+    through.objects.bulk_create(extra_links)
+    invalidate_case_trees([case_id])
+    return case_id
+
+
+def percentile(times, p):
+    """The p-th percentile of a list of times, by the nearest-rank method."""
+    ordered = sorted(times)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+class Benchmark:
+    """A request to time, with an optional untimed setup before each run."""
+
+    def __init__(self, name, request, setup=None):
+        self.name = name
+        self.request = request
+        self.setup = setup
+
+    def run(self, runs):
+        """
+        Make the request `runs` times.
+
+        Returns
+        =======
+        dict with the name, the minimum and maximum numbers of queries of a run,
+        and the p50 and p95 times in milliseconds.
+        """
+        times = []
+        query_counts = []
+        for _ in range(runs):
+            if self.setup is not None:
+                self.setup()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = self.request()
+                times.append((time.perf_counter() - start) * 1000)
+            query_counts.append(len(queries))
+            if response.status_code >= 400:
+                raise RuntimeError(f"{self.name}: status {response.status_code}")
+        return {
+            "name": self.name,
+            "queries": (min(query_counts), max(query_counts)),
+            "p50": percentile(times, 50),
+            "p95": percentile(times, 95),
+        }
+
+
+def _read(response):
+    """Read the whole of a streamed response, for its time to count."""
+    for _ in response.streaming_content:
+        pass
+    return response
+
+
+def get_benchmarks(client, case_id, case_json):
+    """The Benchmarks of the hot paths, on the case with the given id."""
+    case_url = reverse("case_detail", kwargs={"pk": case_id})
+    export_url = reverse("case_export", kwargs={"pk": case_id})
+    claim = PropertyClaim.objects.filter(assurance_case_id=case_id).latest("level")
+    evidential_claim = EvidentialClaim.objects.filter(assurance_case_id=case_id)[0]
+    evidence = Evidence.objects.filter(assurance_case_id=case_id)[0]
+    case_cache = caches[settings.CASE_CACHE]
+    body = json.dumps(case_json)
+
+    def get(url, **params):
+        return lambda: client.get(url, params)
+
+    benchmarks = [
+        Benchmark("case_detail (uncached)", get(case_url), setup=case_cache.clear),
+        Benchmark("case_detail (cached)", get(case_url)),
+        Benchmark("case_export", lambda: _read(client.get(export_url))),
+        Benchmark("case_list", get(reverse("case_list"))),
+    ]
+    for name in (
+        "goal_list",
+        "property_claim_list",
+        "evidential_claim_list",
+        "evidence_list",
+    ):
+        benchmarks.append(Benchmark(name, get(reverse(name), case_id=case_id)))
+    benchmarks += [
+        Benchmark(
+            "import (save_json_tree)",
+            lambda: client.post(
+                reverse("case_list"), body, content_type="application/json"
+            ),
+        ),
+        Benchmark(
+            "case_clone",
+            lambda: client.post(reverse("case_clone", kwargs={"pk": case_id})),
+        ),
+        Benchmark(
+            "import (streamed)",
+            lambda: client.post(
+                reverse("case_import"), body, content_type="application/json"
+            ),
+        ),
+        Benchmark(
+            "parents (deepest property_claim)",
+            get(reverse("parents", args=["property_claim", claim.pk])),
+        ),
+        Benchmark(
+            "parents (ancestors of deepest property_claim)",
+            get(
+                reverse("parents", args=["property_claim", claim.pk]),
+                ancestors="true",
+            ),
+        ),
+        Benchmark(
+            "parents (evidential_claim)",
+            get(reverse("parents", args=["evidential_claim", evidential_claim.pk])),
+        ),
+        Benchmark(
+            "parents (evidence)",
+            get(reverse("parents", args=["evidence", evidence.pk])),
+        ),
+    ]
+    return benchmarks
+
+
+def run_benchmarks(cases=1, runs=20, shared_by=1, seed=0, **shape):
+    """
+    Make `cases` synthetic cases of the given shape (see make_case_json), and run
+    the Benchmarks on the last one, then roll everything back.
+
+    Returns
+    =======
+    list of the results of the Benchmarks, as returned by Benchmark.run
+    """
+    with transaction.atomic():
+        user = EAPUser.objects.create(username=f"benchmark-{time.time_ns()}")
+        token = Token.objects.create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+        case_json = make_case_json(owner=user.pk, **shape)
+        for i in range(cases):
+            case_id = make_case(case_json, shared_by=shared_by, seed=seed + i)
+        results = [
+            benchmark.run(runs)
+            for benchmark in get_benchmarks(client, case_id, case_json)
+        ]
+        transaction.set_rollback(True)
+    return results
+
+
+def _reverse_index(field):
+    """Name of the index of migration 0013 on the table of a many-to-many field."""
+    return f"{field.remote_field.through._meta.db_table}_reverse_idx"
+
+
+def get_query_plans(case_id, user):
+    """
+    The lookups of the views that the indexes of migration 0013 are for, on the
+    case with the given id.
+
+    Returns
+    =======
+    list of (name, queryset, name of the index that the plan of the queryset
+    should use)
+    """
+    claims = PropertyClaim.objects.filter(assurance_case_id=case_id)
+    claim_ids = list(claims.values_list("id", flat=True))
+    evidential_claim_ids = list(
+        EvidentialClaim.objects.filter(assurance_case_id=case_id).values_list(
+            "id", flat=True
+        )
+    )
+    property_claim = EvidentialClaim._meta.get_field("property_claim")
+    evidential_claim = Evidence._meta.get_field("evidential_claim")
+    member = EAPGroup._meta.get_field("member")
+    edit_groups = AssuranceCase._meta.get_field("edit_groups")
+    return [
+        (
+            "case_list (groups of the user)",
+            get_allowed_cases(user).values("id", "name")[:50],
+            _reverse_index(member),
+        ),
+        (
+            "EvidentialClaims of PropertyClaims",
+            property_claim.remote_field.through.objects.filter(
+                propertyclaim_id__in=claim_ids
+            ).values("evidentialclaim_id"),
+            _reverse_index(property_claim),
+        ),
+        (
+            "Evidence of EvidentialClaims",
+            evidential_claim.remote_field.through.objects.filter(
+                evidentialclaim_id__in=evidential_claim_ids
+            ).values("evidence_id"),
+            _reverse_index(evidential_claim),
+        ),
+        (
+            "cases editable by a group",
+            edit_groups.remote_field.through.objects.filter(eapgroup_id=1).values(
+                "assurancecase_id"
+            ),
+            _reverse_index(edit_groups),
+        ),
+    ]
+
+
+def run_query_plans(shared_by=1, seed=0, **shape):
+    """
+    Make a synthetic case of the given shape (see make_case_json), and get the
+    plans of the database for the lookups of get_query_plans, then roll everything
+    back. On Postgres, sequential scans are turned off for the plans, since the
+    tables are too small for indexes to pay off, so that the plans show whether
+    the indexes can be used.
+
+    Returns
+    =======
+    list of dicts with the name of each lookup, the index it should use, its plan,
+    and whether the plan uses the index
+    """
+    with transaction.atomic():
+        user = EAPUser.objects.create(username=f"benchmark-{time.time_ns()}")
+        case_id = make_case(
+            make_case_json(owner=user.pk, **shape), shared_by=shared_by, seed=seed
+        )
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        results = []
+        for name, queryset, index in get_query_plans(case_id, user):
+            plan = queryset.explain()
+            results.append(
+                {"name": name, "index": index, "plan": plan, "used": index in plan}
+            )
+        transaction.set_rollback(True)
+    return results
+
+
+def run_load(server, concurrency=32, duration=10, shared_by=1, seed=0, **shape):
+    """
+    Make a synthetic case of the given shape (see make_case_json), and have
+    `concurrency` clients poll it through case_detail on a running server, as the
+    open editors of a case do, for `duration` seconds. The server must use the same
+    database as this process. The case is deleted at the end.
+
+    Returns
+    =======
+    dict with the numbers of requests made and failed, the throughput in requests
+    per second, and the p50 and p95 times of the requests in milliseconds
+    """
+    user = EAPUser.objects.create(username=f"benchmark-{time.time_ns()}")
+    token = Token.objects.create(user=user)
+    case_id = make_case(
+        make_case_json(owner=user.pk, **shape), shared_by=shared_by, seed=seed
+    )
+    request = Request(
+        server.rstrip("/") + reverse("case_detail", kwargs={"pk": case_id}),
+        headers={"Authorization": f"Token {token.key}"},
+    )
+
+    def poll(deadline):
+        times = []
+        errors = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                with urlopen(request, timeout=60) as response:
+                    response.read()
+            except OSError:
+                errors += 1
+                continue
+            times.append((time.perf_counter() - start) * 1000)
+        return times, errors
+
+    try:
+        start = time.perf_counter()
+        deadline = start + duration
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(poll, [deadline] * concurrency))
+        elapsed = time.perf_counter() - start
+    finally:
+        delete_case(case_id)
+        user.delete()
+    times = [t for client_times, _ in results for t in client_times]
+    return {
+        "requests": len(times),
+        "errors": sum(errors for _, errors in results),
+        "throughput": len(times) / elapsed,
+        "p50": percentile(times, 50) if times else None,
+        "p95": percentile(times, 95) if times else None,
+    }
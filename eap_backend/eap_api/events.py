@@ -0,0 +1,369 @@
+"""
+Live feed of the changes made to assurance cases, streamed to the browser as
+server-sent events, so that open editors don't need to poll for changes.
+
+Changes are published by the signal handlers in signals.py, through a
+broadcaster that fans them out to the streams open in this process. Which
+broadcaster is used is set by `settings.EVENTS_BROADCASTER`:
+* InMemoryBroadcaster only reaches streams in the process that made the change,
+  which is enough for a single process, and for tests.
+* PostgresBroadcaster sends the changes through Postgres LISTEN/NOTIFY, so that
+  they reach the streams open in every process using the same database.
+
+The stream itself, at /api/cases/<int:case_id>/events/, is served by
+CaseEventsMiddleware, which wraps the Django application in eap_backend/asgi.py.
+"""
+import asyncio
+import json
+import logging
+import re
+import select
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import close_old_connections, connection, connections, transaction
+from django.utils.module_loading import import_string
+from rest_framework.authtoken.models import Token
+from .models import AssuranceCase
+from .view_utils import get_case_permissions
+
+# Path of the stream of events of a case.
+CASE_EVENTS_PATH = re.compile(r"^/api/cases/(?P<pk>\d+)/events/$")
+# Seconds between comments sent to keep idle connections open, and to notice
+# clients that have gone away.
+KEEPALIVE_INTERVAL = 15
+# Events that a slow client can fall behind by, before we close its stream. It
+# should then reconnect, and catch up with the changes since the last version it saw.
+MAX_QUEUED_EVENTS = 1000
+# Seconds to wait before LISTENing again after a failure, doubled after each failure
+# in a row, up to the maximum.
+LISTEN_MIN_RETRY_DELAY = 1
+LISTEN_MAX_RETRY_DELAY = 60
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryBroadcaster:
+    """Fans out the events about each case to the streams open in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, case_id):
+        """
+        Start listening to the events of a case. Must be called from the event loop
+        of the stream.
+
+        Returns
+        =======
+        asyncio.Queue, which gets a dict for each event, or None if the stream has
+        fallen too far behind and should be closed.
+        """
+        queue = asyncio.Queue(maxsize=MAX_QUEUED_EVENTS)
+        with self._lock:
+            self._subscribers[case_id].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, case_id, queue):
+        with self._lock:
+            self._subscribers[case_id] = {
+                (loop, q) for loop, q in self._subscribers[case_id] if q is not queue
+            }
+            if not self._subscribers[case_id]:
+                del self._subscribers[case_id]
+
+    def publish(self, case_id, event):
+        """Send an event about a case to everyone listening to it."""
+        self.deliver(case_id, event)
+
+    def deliver(self, case_id, event):
+        """Send an event to the streams in this process. Safe to call from any
+        thread."""
+        with self._lock:
+            subscribers = tuple(self._subscribers.get(case_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_put_event, queue, event)
+
+
+def _put_event(queue, event):
+    if queue.full():
+        return
+    if queue.qsize() == queue.maxsize - 1:
+        # Falling behind, tell the stream to close.
+        event = None
+    queue.put_nowait(event)
+
+
+class PostgresBroadcaster(InMemoryBroadcaster):
+    """
+    Sends the events through Postgres NOTIFY, and delivers the events LISTENed to
+    on a dedicated connection to the streams in this process.
+
+    The connection is opened again whenever it fails, waiting longer after each
+    failure in a row, up to LISTEN_MAX_RETRY_DELAY seconds. Events may have been
+    missed in between, so the streams open are then closed, for their clients to
+    reconnect and catch up.
+    """
+
+    channel = "eap_case_events"
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def subscribe(self, case_id):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+        return super().subscribe(case_id)
+
+    def publish(self, case_id, event):
+        payload = json.dumps({"case_id": case_id, "event": event})
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, payload])
+
+    def close_streams(self):
+        """Tell every stream open in this process to close."""
+        with self._lock:
+            subscribers = [
+                subscriber
+                for case_subscribers in self._subscribers.values()
+                for subscriber in case_subscribers
+            ]
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_close_queue, queue)
+
+    def _listen(self):
+        delay = LISTEN_MIN_RETRY_DELAY
+        connected_before = False
+        while True:
+            try:
+                conn = self._connect()
+            except Exception:
+                logger.exception("Failed to LISTEN for the events of cases.")
+            else:
+                delay = LISTEN_MIN_RETRY_DELAY
+                if connected_before:
+                    self.close_streams()
+                connected_before = True
+                try:
+                    self._receive(conn)
+                except Exception:
+                    logger.exception("Lost the connection LISTENing for events.")
+                finally:
+                    conn.close()
+            time.sleep(delay)
+            delay = min(delay * 2, LISTEN_MAX_RETRY_DELAY)
+
+    def _connect(self):
+        import psycopg2
+
+        # With the OPTIONS of the database (e.g. sslmode), as Django connects.
+        params = connections["default"].get_connection_params()
+        conn = psycopg2.connect(**params)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel}")
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _receive(self, conn):
+        """Deliver the events received on a connection, until it fails."""
+        while True:
+            if select.select([conn], [], [], KEEPALIVE_INTERVAL) == ([], [], []):
+                # Fails if the connection was lost without a word.
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            else:
+                conn.poll()
+            while conn.notifies:
+                notification = json.loads(conn.notifies.pop(0).payload)
+                self.deliver(notification["case_id"], notification["event"])
+
+
+def _close_queue(queue):
+    # A full queue already ends with None, see _put_event.
+    if not queue.full():
+        queue.put_nowait(None)
+
+
+_broadcaster = None
+
+
+def get_broadcaster():
+    """Return the broadcaster of this process, as set in settings.EVENTS_BROADCASTER."""
+    global _broadcaster
+    if _broadcaster is None:
+        _broadcaster = import_string(settings.EVENTS_BROADCASTER)()
+    return _broadcaster
+
+
+def publish_case_event(case_id, event, **data):
+    """
+    Publish an event about a case, once the current transaction (if any) has been
+    committed.
+
+    Params
+    ======
+    case_id: id of the AssuranceCase
+    event: name of the event, e.g. "created", "updated", "deleted" or "lock"
+    data: the data of the event, e.g. the type and id of an item
+    """
+    if case_id is None:
+        return
+    data["event"] = event
+    transaction.on_commit(lambda: get_broadcaster().publish(case_id, data))
+
+
+def format_event(data):
+    """Format an event dict as a server-sent event."""
+    return f"event: {data['event']}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+class CaseEventsMiddleware:
+    """
+    ASGI middleware serving the streams of events of cases, and passing every other
+    request on to the wrapped application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        match = None
+        if scope["type"] == "http":
+            match = CASE_EVENTS_PATH.match(scope["path"])
+        if match is None:
+            return await self.app(scope, receive, send)
+        return await stream_case_events(scope, receive, send, int(match["pk"]))
+
+
+def _get_user(scope):
+    """Find the user from the token in the Authorization header, or in the query
+    string, since browsers' EventSource can't set headers. Tokens in query strings
+    are hidden from the access log of the server by RedactTokens."""
+    headers = dict(scope["headers"])
+    keyword, _, key = headers.get(b"authorization", b"").decode("latin1").partition(" ")
+    if keyword != "Token":
+        query = parse_qs(scope.get("query_string", b"").decode("latin1"))
+        key = query.get("token", [None])[0]
+    if key is None:
+        return AnonymousUser()
+    try:
+        return Token.objects.select_related("user").get(key=key).user
+    except Token.DoesNotExist:
+        return AnonymousUser()
+
+
+class RedactTokens(logging.Filter):
+    """
+    Logging filter hiding the values of `token` parameters in the query strings of
+    logged requests, e.g. in the access log of gunicorn.conf.py.
+    """
+
+    pattern = re.compile(r"\b(token=)[^&\s\"]+")
+
+    def _redact(self, arg):
+        if isinstance(arg, str):
+            return self.pattern.sub(r"\1[redacted]", arg)
+        return arg
+
+    def filter(self, record):
+        if isinstance(record.args, dict):
+            record.args = {key: self._redact(arg) for key, arg in record.args.items()}
+        elif isinstance(record.args, tuple):
+            record.args = tuple(self._redact(arg) for arg in record.args)
+        return True
+
+
+def _check_access(scope, case_id):
+    """Return the HTTP status code with which to answer a request for the events
+    of a case: 200 if the user is allowed to view the case."""
+    if scope["method"] != "GET":
+        return 405
+    # Outside Django's request cycle, whose signals would otherwise close or reuse
+    # the connections of the thread as configured, as in async_views._run_in_thread.
+    close_old_connections()
+    try:
+        try:
+            case = AssuranceCase.objects.get(pk=case_id)
+        except AssuranceCase.DoesNotExist:
+            return 404
+        if not get_case_permissions(case, _get_user(scope)):
+            return 403
+        return 200
+    finally:
+        close_old_connections()
+
+
+def _response_headers(scope):
+    headers = [
+        (b"content-type", b"text/event-stream"),
+        (b"cache-control", b"no-cache"),
+        # Stop proxies buffering the stream.
+        (b"x-accel-buffering", b"no"),
+    ]
+    # The Django middleware is skipped, so deal with CORS here.
+    origin = dict(scope["headers"]).get(b"origin", b"").decode("latin1")
+    if origin in settings.CORS_ORIGIN_WHITELIST:
+        headers.append((b"access-control-allow-origin", origin.encode("latin1")))
+    return headers
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def stream_case_events(scope, receive, send, case_id):
+    """
+    ASGI application streaming the events of a case, until the client disconnects.
+    """
+    status = await sync_to_async(_check_access)(scope, case_id)
+    if status != 200:
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    broadcaster = get_broadcaster()
+    queue = broadcaster.subscribe(case_id)
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": _response_headers(scope),
+            }
+        )
+        body = b": connected\n\n"
+        while body is not None:
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+            next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnect},
+                timeout=KEEPALIVE_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnect in done:
+                next_event.cancel()
+                return
+            if next_event in done:
+                event = next_event.result()
+                body = None if event is None else format_event(event)
+            else:
+                next_event.cancel()
+                body = b": keepalive\n\n"
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnect.cancel()
+        broadcaster.unsubscribe(case_id, queue)
@@ -0,0 +1,137 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from eap_api.benchmark import run_benchmarks, run_load, run_query_plans
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the hot paths of the API on synthetic assurance cases, and report the "
+        "number of queries and the p50 and p95 latencies of each, then check that "
+        "the database plans their lookups with the indexes made for them. Runs "
+        "against the configured database, and leaves nothing behind."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cases", type=int, default=5, help="Cases to make.")
+        parser.add_argument("--goals", type=int, default=2, help="Goals per case.")
+        parser.add_argument(
+            "--depth", type=int, default=3, help="Levels of PropertyClaims per goal."
+        )
+        parser.add_argument(
+            "--fan-out",
+            type=int,
+            default=3,
+            help="PropertyClaims under each goal and PropertyClaim.",
+        )
+        parser.add_argument(
+            "--evidential-claims",
+            type=int,
+            default=2,
+            help="EvidentialClaims under each PropertyClaim of the last level.",
+        )
+        parser.add_argument(
+            "--shared-by",
+            type=int,
+            default=5,
+            help="PropertyClaims each EvidentialClaim is under.",
+        )
+        parser.add_argument(
+            "--evidence", type=int, default=2, help="Evidence per EvidentialClaim."
+        )
+        parser.add_argument(
+            "--runs", type=int, default=20, help="Runs of each benchmark."
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--server",
+            default=None,
+            help=(
+                "URL of a running server using the same database, e.g. "
+                "http://localhost:8000, to measure the throughput of instead."
+            ),
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=32,
+            help="Clients polling the case at once, with --server.",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=10,
+            help="Seconds to poll for, with --server.",
+        )
+
+    def handle(self, *args, **options):
+        shape = {
+            name: options[name]
+            for name in ("goals", "depth", "fan_out", "evidential_claims", "evidence")
+        }
+        if options["server"]:
+            return self.handle_load(options, shape)
+        self.stdout.write(
+            f"Benchmarks on {connection.vendor}, {options['runs']} runs each, with "
+            f"{options['cases']} cases of {shape['goals']} goals, PropertyClaims "
+            f"{shape['depth']} levels deep with a fan-out of {shape['fan_out']}, "
+            f"{shape['evidential_claims']} EvidentialClaims under each PropertyClaim "
+            f"of the last level, each under {options['shared_by']} PropertyClaims "
+            f"and with {shape['evidence']} Evidence.\n"
+        )
+        results = run_benchmarks(
+            cases=options["cases"],
+            runs=options["runs"],
+            shared_by=options["shared_by"],
+            seed=options["seed"],
+            **shape,
+        )
+        width = max(len(result["name"]) for result in results)
+        self.stdout.write(
+            f"{'benchmark':<{width}}  {'queries':>9}  {'p50 ms':>9}  {'p95 ms':>9}"
+        )
+        for result in results:
+            low, high = result["queries"]
+            queries = str(low) if low == high else f"{low}-{high}"
+            self.stdout.write(
+                f"{result['name']:<{width}}  {queries:>9}  "
+                f"{result['p50']:>9.2f}  {result['p95']:>9.2f}"
+            )
+        self.handle_query_plans(options, shape)
+
+    def handle_query_plans(self, options, shape):
+        results = run_query_plans(
+            shared_by=options["shared_by"], seed=options["seed"], **shape
+        )
+        width = max(len(result["name"]) for result in results)
+        self.stdout.write(f"\n{'lookup':<{width}}  index")
+        for result in results:
+            used = "" if result["used"] else " (NOT USED)"
+            self.stdout.write(f"{result['name']:<{width}}  {result['index']}{used}")
+        unused = [result for result in results if not result["used"]]
+        if unused:
+            plans = "\n\n".join(f"{r['name']}:\n{r['plan']}" for r in unused)
+            raise CommandError(f"Lookups not using their indexes:\n\n{plans}")
+
+    def handle_load(self, options, shape):
+        self.stdout.write(
+            f"Throughput of {options['server']} on {connection.vendor}, with "
+            f"{options['concurrency']} clients polling a case of {shape['goals']} "
+            f"goals, PropertyClaims {shape['depth']} levels deep with a fan-out of "
+            f"{shape['fan_out']}, for {options['duration']:g} seconds.\n"
+        )
+        result = run_load(
+            options["server"],
+            concurrency=options["concurrency"],
+            duration=options["duration"],
+            shared_by=options["shared_by"],
+            seed=options["seed"],
+            **shape,
+        )
+        self.stdout.write(
+            f"requests: {result['requests']}, errors: {result['errors']}, "
+            f"throughput: {result['throughput']:.1f} requests/s"
+        )
+        if result["requests"]:
+            self.stdout.write(
+                f"p50: {result['p50']:.2f} ms, p95: {result['p95']:.2f} ms"
+            )
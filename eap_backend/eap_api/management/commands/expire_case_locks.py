@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from eap_api.view_utils import expire_case_locks
+
+
+class Command(BaseCommand):
+    help = (
+        "Release the edit locks on cases that have expired, e.g. those of browser "
+        "tabs that were closed without releasing them. Run from cron, or with "
+        "--every to keep sweeping."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--every",
+            type=float,
+            default=None,
+            help="Seconds between sweeps, to keep sweeping until interrupted.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = expire_case_locks()
+            self.stdout.write(f"Released {released} expired locks.")
+            if options["every"] is None:
+                return
+            time.sleep(options["every"])
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from eap_api.models import AssuranceCase
+from eap_api.view_utils import delete_case
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the cases hidden by a deferred delete (DELETE /api/cases/<id>/"
+        "?defer=true) that haven't been deleted yet, e.g. because the server was "
+        "restarted first."
+    )
+
+    def handle(self, *args, **options):
+        hidden = AssuranceCase.all_objects.filter(deleted_date__isnull=False)
+        case_ids = list(hidden.values_list("pk", flat=True))
+        for case_id in case_ids:
+            delete_case(case_id)
+        self.stdout.write(f"Deleted {len(case_ids)} cases.")
@@ -0,0 +1,213 @@
+"""
+Per-request performance metrics, to see why a request is slow.
+
+RequestMetricsMiddleware, enabled by setting the REQUEST_METRICS environment
+variable to "1" (see settings.py), records for every request the number of SQL
+queries, the time spent in the database and in the serializers, and the size of
+the response. These are sent back in a Server-Timing header, which browsers show
+with the request in their developer tools, and aggregated into histograms by URL
+name (e.g. case_detail), served in the Prometheus text format at /api/metrics/ to
+staff users.
+
+The histograms are kept in the memory of each server process.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# The metrics of the request being handled, if they are being recorded.
+_current_metrics = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """What a single request has cost so far."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+
+
+class Histogram:
+    """
+    A Prometheus histogram, with one series per value of a label, by default the
+    URL name of the requests.
+    """
+
+    def __init__(self, name, description, buckets, label="view"):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label = label
+        self._lock = threading.Lock()
+        # For each value of the label: [count in each bucket, sum, count].
+        self._series = {}
+
+    def observe(self, view, value):
+        with self._lock:
+            series = self._series.get(view)
+            if series is None:
+                series = self._series[view] = [[0] * len(self.buckets), 0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """Return the lines of the histogram in the Prometheus text format."""
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = sorted(self._series.items())
+            for value, (bucket_counts, total, count) in series:
+                labels = f'{self.label}="{value}"'
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(
+                        f'{self.name}_bucket{{{labels},le="{bound}"}} {bucket_count}'
+                    )
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{labels}}} {total}")
+                lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+HISTOGRAMS = {
+    "duration": Histogram(
+        "eap_request_duration_seconds", "Time taken to handle requests.", _SECONDS
+    ),
+    "db_time": Histogram(
+        "eap_request_db_seconds", "Time spent in SQL queries per request.", _SECONDS
+    ),
+    "serializer_time": Histogram(
+        "eap_request_serializer_seconds",
+        "Time spent in serializers per request.",
+        _SECONDS,
+    ),
+    "queries": Histogram(
+        "eap_request_queries",
+        "Number of SQL queries per request.",
+        (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+    ),
+    "size": Histogram(
+        "eap_response_size_bytes",
+        "Size of the response bodies.",
+        (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000),
+    ),
+}
+
+
+def render_metrics(extra_lines=()):
+    """Return all the metrics of this process in the Prometheus text format."""
+    lines = []
+    for histogram in HISTOGRAMS.values():
+        lines += histogram.render()
+    lines += extra_lines
+    return "\n".join(lines) + "\n"
+
+
+class TimedSerializerMixin:
+    """Adds the time spent serializing objects to the metrics of the request."""
+
+    def to_representation(self, instance):
+        metrics = _current_metrics.get()
+        if metrics is None:
+            return super().to_representation(instance)
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+
+
+def _time_query(execute, sql, params, many, context):
+    metrics = _current_metrics.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if metrics is not None:
+            metrics.queries += 1
+            metrics.db_time += time.perf_counter() - start
+
+
+def _install_query_timer(connection, **kwargs):
+    # On the connections of every thread, since views may run their queries in
+    # other threads than the middleware, see async_views.py.
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the metrics of every request, adds them to the response as a
+    Server-Timing header, and to the histograms of the URL name of the request.
+    Works both under WSGI and under ASGI, without holding up async views.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Tell Django to call this asynchronously, as MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        connection_created.connect(_install_query_timer)
+        for connection in connections.all():
+            _install_query_timer(connection)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.record(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.record(request, response, metrics, start)
+
+    def record(self, request, response, metrics, start):
+        duration = time.perf_counter() - start
+        size = None if response.streaming else len(response.content)
+        response["Server-Timing"] = self.server_timing(metrics, duration, size)
+        match = request.resolver_match
+        view = match.url_name if match is not None and match.url_name else "other"
+        HISTOGRAMS["duration"].observe(view, duration)
+        HISTOGRAMS["db_time"].observe(view, metrics.db_time)
+        HISTOGRAMS["serializer_time"].observe(view, metrics.serializer_time)
+        HISTOGRAMS["queries"].observe(view, metrics.queries)
+        if size is not None:
+            HISTOGRAMS["size"].observe(view, size)
+        return response
+
+    @staticmethod
+    def server_timing(metrics, duration, size):
+        timings = [
+            f"db;dur={metrics.db_time * 1000:.1f}",
+            f'queries;desc="{metrics.queries}"',
+            f"serializer;dur={metrics.serializer_time * 1000:.1f}",
+            f"total;dur={duration * 1000:.1f}",
+        ]
+        if size is not None:
+            timings.append(f'size;desc="{size}"')
+        return ", ".join(timings)
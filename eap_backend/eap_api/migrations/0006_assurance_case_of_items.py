@@ -0,0 +1,69 @@
+# Generated by Django 3.2.8 on 2026-10-17 19:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eap_api", "0005_alter_eapuser_is_active"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="context",
+            name="assurance_case",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="contexts",
+                to="eap_api.assurancecase",
+            ),
+        ),
+        migrations.AddField(
+            model_name="evidence",
+            name="assurance_case",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="evidence",
+                to="eap_api.assurancecase",
+            ),
+        ),
+        migrations.AddField(
+            model_name="evidentialclaim",
+            name="assurance_case",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="evidential_claims",
+                to="eap_api.assurancecase",
+            ),
+        ),
+        migrations.AddField(
+            model_name="propertyclaim",
+            name="assurance_case",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="property_claims",
+                to="eap_api.assurancecase",
+            ),
+        ),
+        migrations.AddField(
+            model_name="systemdescription",
+            name="assurance_case",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="system_descriptions",
+                to="eap_api.assurancecase",
+            ),
+        ),
+    ]
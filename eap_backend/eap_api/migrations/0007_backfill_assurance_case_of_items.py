@@ -0,0 +1,56 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_assurance_case(apps, schema_editor):
+    """Set the denormalised case of every existing item from its parents."""
+    TopLevelNormativeGoal = apps.get_model("eap_api", "TopLevelNormativeGoal")
+    Context = apps.get_model("eap_api", "Context")
+    SystemDescription = apps.get_model("eap_api", "SystemDescription")
+    PropertyClaim = apps.get_model("eap_api", "PropertyClaim")
+    EvidentialClaim = apps.get_model("eap_api", "EvidentialClaim")
+    Evidence = apps.get_model("eap_api", "Evidence")
+
+    goal_case = TopLevelNormativeGoal.objects.filter(pk=OuterRef("goal_id")).values(
+        "assurance_case_id"
+    )[:1]
+    for model in (Context, SystemDescription):
+        model.objects.update(assurance_case_id=Subquery(goal_case))
+    PropertyClaim.objects.filter(goal__isnull=False).update(
+        assurance_case_id=Subquery(goal_case)
+    )
+    # Nested claims get the case of their parent, one level of nesting at a time.
+    parent_case = PropertyClaim.objects.filter(pk=OuterRef("property_claim_id")).values(
+        "assurance_case_id"
+    )[:1]
+    while True:
+        updated = PropertyClaim.objects.filter(
+            assurance_case__isnull=True,
+            property_claim__assurance_case__isnull=False,
+        ).update(assurance_case_id=Subquery(parent_case))
+        if not updated:
+            break
+    # Items with several parents get the case of the first one.
+    first_claim_case = (
+        PropertyClaim.objects.filter(evidential_claims=OuterRef("pk"))
+        .order_by("id")
+        .values("assurance_case_id")[:1]
+    )
+    EvidentialClaim.objects.update(assurance_case_id=Subquery(first_claim_case))
+    first_eclaim_case = (
+        EvidentialClaim.objects.filter(evidence=OuterRef("pk"))
+        .order_by("id")
+        .values("assurance_case_id")[:1]
+    )
+    Evidence.objects.update(assurance_case_id=Subquery(first_eclaim_case))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eap_api", "0006_assurance_case_of_items"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_assurance_case, migrations.RunPython.noop),
+    ]
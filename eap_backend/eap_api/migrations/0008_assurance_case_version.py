@@ -0,0 +1,24 @@
+# Generated by Django 3.2.8 on 2026-10-17 19:44
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eap_api", "0007_backfill_assurance_case_of_items"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="assurancecase",
+            name="updated_date",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="assurancecase",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
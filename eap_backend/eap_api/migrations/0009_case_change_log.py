@@ -0,0 +1,59 @@
+# Generated by Django 3.2.8 on 2026-10-17 19:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eap_api", "0008_assurance_case_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CaseChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.PositiveIntegerField()),
+                ("item_type", models.CharField(max_length=32)),
+                ("item_id", models.BigIntegerField()),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("created", "Created"),
+                            ("updated", "Updated"),
+                            ("deleted", "Deleted"),
+                        ],
+                        max_length=8,
+                    ),
+                ),
+                ("created_date", models.DateTimeField(auto_now_add=True)),
+                (
+                    "assurance_case",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="changes",
+                        to="eap_api.assurancecase",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="casechange",
+            index=models.Index(
+                fields=["assurance_case", "version"],
+                name="eap_api_cas_assuran_a80074_idx",
+            ),
+        ),
+    ]
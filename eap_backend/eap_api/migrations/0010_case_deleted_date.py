@@ -0,0 +1,30 @@
+# Generated by Django 3.2.8 on 2026-10-17 20:12
+
+from django.db import migrations, models
+import django.db.models.manager
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eap_api", "0009_case_change_log"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="assurancecase",
+            options={"base_manager_name": "all_objects"},
+        ),
+        migrations.AlterModelManagers(
+            name="assurancecase",
+            managers=[
+                ("objects", django.db.models.manager.Manager()),
+                ("all_objects", django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="assurancecase",
+            name="deleted_date",
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.8 on 2026-10-17 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eap_api", "0010_case_deleted_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="context",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="evidence",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="evidentialclaim",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="propertyclaim",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="systemdescription",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="toplevelnormativegoal",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
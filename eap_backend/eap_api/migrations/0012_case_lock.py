@@ -0,0 +1,41 @@
+# Generated by Django 3.2.8 on 2026-10-17 20:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eap_api", "0011_item_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CaseLock",
+            fields=[
+                (
+                    "assurance_case",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="lease",
+                        serialize=False,
+                        to="eap_api.assurancecase",
+                    ),
+                ),
+                ("lock_uuid", models.CharField(max_length=50)),
+                ("expires_date", models.DateTimeField(db_index=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.8 on 2026-10-17 20:38
+
+from django.db import migrations
+
+# The tables of the many-to-many relations only have an index on each column, and
+# the unique index of the pair in the direction of the relation. These cover the
+# lookups in the other direction, e.g. the EvidentialClaims of PropertyClaims, so
+# that they are answered from the index alone.
+REVERSE_INDEXES = [
+    ("eap_api_eapgroup_member", "eapuser_id", "eapgroup_id"),
+    ("eap_api_assurancecase_edit_groups", "eapgroup_id", "assurancecase_id"),
+    ("eap_api_assurancecase_view_groups", "eapgroup_id", "assurancecase_id"),
+    (
+        "eap_api_evidentialclaim_property_claim",
+        "propertyclaim_id",
+        "evidentialclaim_id",
+    ),
+    ("eap_api_evidence_evidential_claim", "evidentialclaim_id", "evidence_id"),
+]
+
+
+def _create_index_sql(schema_editor):
+    # On Postgres, without locking the tables against writes while the indexes are
+    # built. If interrupted, this leaves an invalid index behind, to be dropped
+    # before migrating again.
+    if schema_editor.connection.vendor == "postgresql":
+        return 'CREATE INDEX CONCURRENTLY "{0}_reverse_idx" ON "{0}" ("{1}", "{2}")'
+    return 'CREATE INDEX "{0}_reverse_idx" ON "{0}" ("{1}", "{2}")'
+
+
+def create_reverse_indexes(apps, schema_editor):
+    sql = _create_index_sql(schema_editor)
+    for table, first, second in REVERSE_INDEXES:
+        schema_editor.execute(sql.format(table, first, second))
+
+
+def drop_reverse_indexes(apps, schema_editor):
+    for table, _, _ in REVERSE_INDEXES:
+        schema_editor.execute(f'DROP INDEX "{table}_reverse_idx"')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("eap_api", "0012_case_lock"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_reverse_indexes, drop_reverse_indexes),
+    ]
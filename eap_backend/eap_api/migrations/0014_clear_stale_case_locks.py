@@ -0,0 +1,47 @@
+from django.db import migrations
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+
+def clear_stale_lock_uuids(apps, schema_editor):
+    """
+    Unlock the cases locked before CaseLock existed, which have no lease to expire,
+    so would otherwise show as being edited forever.
+    """
+    AssuranceCase = apps.get_model("eap_api", "AssuranceCase")
+    CaseChange = apps.get_model("eap_api", "CaseChange")
+    CaseLock = apps.get_model("eap_api", "CaseLock")
+    unexpired = CaseLock.objects.filter(
+        assurance_case=OuterRef("pk"), expires_date__gt=timezone.now()
+    )
+    stale = AssuranceCase.objects.filter(lock_uuid__isnull=False).exclude(
+        Exists(unexpired)
+    )
+    cases = AssuranceCase.objects.filter(
+        pk__in=list(stale.values_list("pk", flat=True))
+    )
+    # A new version, logged as record_case_changes does, for the clients catching up
+    # with /changes/ to see the change, and the cached JSON of the cases to be made
+    # again.
+    cases.update(lock_uuid=None, version=F("version") + 1, updated_date=timezone.now())
+    CaseChange.objects.bulk_create(
+        CaseChange(
+            assurance_case_id=case_id,
+            version=version,
+            item_type="assurance_case",
+            item_id=case_id,
+            action="updated",
+        )
+        for case_id, version in cases.values_list("pk", "version")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eap_api", "0013_query_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_stale_lock_uuids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.8 on 2026-10-17 21:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eap_api", "0014_clear_stale_case_locks"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="evidence",
+            name="assurance_case",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="evidence",
+                to="eap_api.assurancecase",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="evidentialclaim",
+            name="assurance_case",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="evidential_claims",
+                to="eap_api.assurancecase",
+            ),
+        ),
+    ]
@@ -1,5 +1,10 @@
+from collections import defaultdict
+from contextlib import nullcontext
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models, transaction
+from django.db.models.expressions import RawSQL
+from django.dispatch import Signal
 from django.utils import timezone
 import datetime
 from enum import Enum
@@ -36,6 +41,15 @@ class Shape(Enum):
     CYLINDER = 3
 
 
+class VersionConflict(Exception):
+    """Raised when saving an item, or a case, that has changed since the version
+    the changes were made to (its expected_version)."""
+
+
+def _atomic_if(condition):
+    return transaction.atomic() if condition else nullcontext()
+
+
 class CaseItem(models.Model):
     """A class that all the assurance case items inherit from.
 
@@ -48,10 +62,71 @@ class CaseItem(models.Model):
     long_description = models.CharField(max_length=3000)
     shape = Shape
     created_date = models.DateTimeField(auto_now_add=True)
+    # Bumped in SQL by every save, for optimistic concurrency control.
+    version = models.PositiveIntegerField(default=1)
+    # Set to the version the changes were made to, to make the next save raise
+    # VersionConflict instead, if the item has changed since.
+    expected_version = None
 
     class Meta:
         abstract = True
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember which case the item was stored in, to spot moves between cases.
+        instance._loaded_case_id = instance.__dict__.get("assurance_case_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        try:
+            # In a savepoint of its own, so that a VersionConflict doesn't break
+            # the transaction the save is made in.
+            with _atomic_if(self.expected_version is not None):
+                super().save(*args, **kwargs)
+        finally:
+            self.expected_version = None
+        self._loaded_case_id = self.assurance_case_id
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected_version = self.expected_version
+        if expected_version is not None:
+            base_qs = base_qs.filter(version=expected_version)
+        values = [
+            (
+                field,
+                model,
+                models.F("version") + 1 if field.name == "version" else value,
+            )
+            for field, model, value in values
+        ]
+        updated = super()._do_update(
+            base_qs, using, pk_val, values, update_fields, forced_update
+        )
+        if expected_version is not None:
+            if not updated:
+                raise VersionConflict
+            self.version = expected_version + 1
+        elif updated and any(field.name == "version" for field, _, _ in values):
+            # Without reading it back: if another save came in between, the
+            # version is behind, and a save expecting it fails rather than
+            # overwriting the other changes.
+            self.version += 1
+        return updated
+
+    def moved_case(self):
+        """Whether this item was stored in the database with a different case."""
+        if not hasattr(self, "_loaded_case_id"):
+            return False
+        return self._loaded_case_id != self.assurance_case_id
+
+
+class AssuranceCaseManager(models.Manager):
+    """Hides the cases waiting to be deleted, see delete_case."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_date__isnull=True)
+
 
 class AssuranceCase(models.Model):
     name = models.CharField(max_length=200)
@@ -67,14 +142,67 @@ class AssuranceCase(models.Model):
     view_groups = models.ManyToManyField(
         EAPGroup, related_name="viewable_cases", blank=True
     )
+    # Bumped by every change to the case or any of its items, see signals.py.
+    version = models.PositiveIntegerField(default=1)
+    updated_date = models.DateTimeField(default=timezone.now)
+    # As for CaseItem.
+    expected_version = None
+    # Set when the case is hidden, to be deleted in the background.
+    deleted_date = models.DateTimeField(null=True, blank=True, default=None)
     shape = None
 
+    objects = AssuranceCaseManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        base_manager_name = "all_objects"
+
     def __str__(self):
         return self.name
 
     def was_published_recently(self):
         return self.created_date >= timezone.now() - datetime.timedelta(days=1)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the lock, to spot it changing.
+        instance._loaded_lock_uuid = instance.__dict__.get("lock_uuid")
+        return instance
+
+    def save(self, *args, **kwargs):
+        try:
+            with _atomic_if(self.expected_version is not None):
+                self._save(*args, **kwargs)
+        finally:
+            self.expected_version = None
+
+    def _save(self, *args, **kwargs):
+        if self._state.adding or "update_fields" in kwargs:
+            super().save(*args, **kwargs)
+            return
+        # The version is only ever bumped in SQL, by record_case_changes (called by
+        # the post_save handler), so as not to lose concurrent bumps from changes to
+        # items. Never write it from here.
+        kwargs["update_fields"] = [
+            f.name
+            for f in self._meta.concrete_fields
+            if not f.primary_key and f.name not in ("version", "updated_date")
+        ]
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=["version", "updated_date"])
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected_version = self.expected_version
+        if expected_version is not None:
+            base_qs = base_qs.filter(version=expected_version)
+        updated = super()._do_update(
+            base_qs, using, pk_val, values, update_fields, forced_update
+        )
+        if expected_version is not None and not updated:
+            raise VersionConflict
+        return updated
+
 
 class TopLevelNormativeGoal(CaseItem):
     keywords = models.CharField(max_length=3000)
@@ -86,12 +214,30 @@ class TopLevelNormativeGoal(CaseItem):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        moved = self.moved_case()
+        super().save(*args, **kwargs)
+        if moved:
+            set_case_of_descendants(self.assurance_case_id, goal_ids=[self.pk])
+
 
 class Context(CaseItem):
     shape = Shape.DIAMOND
     goal = models.ForeignKey(
         TopLevelNormativeGoal, related_name="context", on_delete=models.CASCADE
     )
+    # Denormalised from the goal, so that items can be filtered by case in SQL.
+    assurance_case = models.ForeignKey(
+        AssuranceCase,
+        null=True,
+        blank=True,
+        related_name="contexts",
+        on_delete=models.CASCADE,
+    )
+
+    def save(self, *args, **kwargs):
+        self.assurance_case_id = self.goal.assurance_case_id
+        super().save(*args, **kwargs)
 
 
 class SystemDescription(CaseItem):
@@ -101,6 +247,106 @@ class SystemDescription(CaseItem):
         related_name="system_description",
         on_delete=models.CASCADE,
     )
+    assurance_case = models.ForeignKey(
+        AssuranceCase,
+        null=True,
+        blank=True,
+        related_name="system_descriptions",
+        on_delete=models.CASCADE,
+    )
+
+    def save(self, *args, **kwargs):
+        self.assurance_case_id = self.goal.assurance_case_id
+        super().save(*args, **kwargs)
+
+
+class PropertyClaimQuerySet(models.QuerySet):
+    """
+    Queries over the hierarchy of PropertyClaims, however deeply nested, each a
+    single SQL statement with a recursive common table expression.
+    """
+
+    # UNION rather than UNION ALL, so that the recursion terminates even if the
+    # claims in the database form a cycle.
+    _SUBTREE_QUERY = """
+        WITH RECURSIVE claim_tree(id) AS (
+            SELECT id FROM {table} WHERE {roots}
+            UNION
+            SELECT child.id FROM {table} AS child
+            JOIN claim_tree ON child.property_claim_id = claim_tree.id
+        )
+        SELECT id FROM claim_tree
+    """
+    _ANCESTORS_QUERY = """
+        WITH RECURSIVE ancestors(id) AS (
+            SELECT property_claim_id FROM {table} WHERE id = %s
+            UNION
+            SELECT parent.property_claim_id FROM {table} AS parent
+            JOIN ancestors ON parent.id = ancestors.id
+        )
+        SELECT id FROM ancestors
+    """
+
+    # The depth of each claim of a queryset below the claims of the queryset whose
+    # parents aren't in it (e.g. the top of a subtree), counting them as 1, from the
+    # links between the claims rather than their stored levels.
+    _DEPTHS_QUERY = """
+        WITH RECURSIVE members(id, parent_id) AS ({members}),
+        claim_depth(id, depth) AS (
+            SELECT id, 1 FROM members
+            WHERE parent_id IS NULL OR parent_id NOT IN (SELECT id FROM members)
+            UNION
+            SELECT members.id, claim_depth.depth + 1 FROM members
+            JOIN claim_depth ON members.parent_id = claim_depth.id
+        )
+        SELECT id, MAX(depth) FROM claim_depth GROUP BY id
+    """
+
+    def subtree(self, goal_ids=(), claim_ids=()):
+        """
+        Filter to the claims under the given goals, and the given claims along with
+        all the claims under them.
+        """
+        roots = []
+        params = []
+        for column, ids in (("goal_id", goal_ids), ("id", claim_ids)):
+            ids = list(ids)
+            if ids:
+                roots.append(f"{column} IN ({', '.join(['%s'] * len(ids))})")
+                params += ids
+        if not roots:
+            return self.none()
+        table = self.model._meta.db_table
+        query = self._SUBTREE_QUERY.format(table=table, roots=" OR ".join(roots))
+        return self.filter(id__in=RawSQL(query, params))
+
+    def ancestors(self, claim_id):
+        """
+        Filter to the claims above the given one, from the top level down to its
+        parent.
+        """
+        query = self._ANCESTORS_QUERY.format(table=self.model._meta.db_table)
+        return self.filter(id__in=RawSQL(query, [claim_id])).order_by("level")
+
+    def depths(self):
+        """
+        Return a dict mapping the ids of the claims in the queryset to their depths
+        in it, e.g. 1 for the top of a subtree, in a single query. Found from the
+        parents of the claims, since the stored levels of older claims may be
+        wrong.
+        """
+        query = self.order_by().values("id", "property_claim_id").query
+        try:
+            members, params = query.get_compiler(using=self.db).as_sql()
+        except EmptyResultSet:
+            return {}
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(self._DEPTHS_QUERY.format(members=members), params)
+            return dict(cursor.fetchall())
+
+    def depth(self):
+        """Return the number of levels of claims in the queryset, e.g. a subtree."""
+        return max(self.depths().values(), default=0)
 
 
 class PropertyClaim(CaseItem):
@@ -129,6 +375,23 @@ class PropertyClaim(CaseItem):
         on_delete=models.CASCADE,
     )
     level = models.PositiveIntegerField()
+    assurance_case = models.ForeignKey(
+        AssuranceCase,
+        null=True,
+        blank=True,
+        related_name="property_claims",
+        on_delete=models.CASCADE,
+    )
+
+    objects = PropertyClaimQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember where the claim was stored, to spot moves.
+        instance._loaded_parent_id = instance.__dict__.get("property_claim_id")
+        instance._loaded_level = instance.__dict__.get("level")
+        return instance
 
     def save(self, *args, **kwargs):
         try:
@@ -145,7 +408,59 @@ class PropertyClaim(CaseItem):
             raise ValueError("A PropertyClaim shouldn't have two parents.")
         if not (has_claim_parent or has_goal_parent):
             raise ValueError("A PropertyClaim should have a parent.")
-        super().save(*args, **kwargs)
+        stored = not self._state.adding
+        loaded_parent_id = getattr(self, "_loaded_parent_id", self.property_claim_id)
+        if stored and has_claim_parent and self.property_claim_id != loaded_parent_id:
+            below = PropertyClaim.objects.subtree(claim_ids=[self.pk])
+            if below.filter(pk=self.property_claim_id).exists():
+                raise ValueError("A PropertyClaim can't be moved under itself.")
+        parent = self.property_claim if has_claim_parent else self.goal
+        self.assurance_case_id = parent.assurance_case_id
+        moved = self.moved_case()
+        moved_level = stored and self.level != getattr(
+            self, "_loaded_level", self.level
+        )
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if moved:
+                set_case_of_descendants(self.assurance_case_id, claim_ids=[self.pk])
+            if moved_level:
+                self.set_levels_below()
+        self._loaded_parent_id = self.property_claim_id
+        self._loaded_level = self.level
+
+    def set_levels_below(self):
+        """
+        Bring the levels of all the claims under this one in line with its own, with
+        one query to fetch them and one bulk update, and log the changes.
+        """
+        claims = (
+            PropertyClaim.objects.subtree(claim_ids=[self.pk])
+            .exclude(pk=self.pk)
+            .only("id", "property_claim_id", "level", "assurance_case_id")
+        )
+        children = defaultdict(list)
+        for claim in claims:
+            children[claim.property_claim_id].append(claim)
+        changed = []
+        parents = [self]
+        while parents:
+            parent = parents.pop()
+            for claim in children[parent.pk]:
+                if claim.level != parent.level + 1:
+                    claim.level = parent.level + 1
+                    changed.append(claim)
+                parents.append(claim)
+        PropertyClaim.objects.bulk_update(changed, ["level"])
+        record_case_changes(
+            (
+                claim.assurance_case_id,
+                "property_claim",
+                claim.pk,
+                CaseChange.Action.UPDATED,
+            )
+            for claim in changed
+        )
 
 
 class EvidentialClaim(CaseItem):
@@ -153,9 +468,200 @@ class EvidentialClaim(CaseItem):
     property_claim = models.ManyToManyField(
         PropertyClaim, related_name="evidential_claims"
     )
+    # The case of the first (lowest id) parent, kept up to date by the m2m_changed
+    # handlers in signals.py. When the case is deleted, those with parents in other
+    # cases are moved there, and the others deleted, by case_deleted in signals.py.
+    assurance_case = models.ForeignKey(
+        AssuranceCase,
+        null=True,
+        blank=True,
+        related_name="evidential_claims",
+        on_delete=models.SET_NULL,
+    )
 
 
 class Evidence(CaseItem):
     URL = models.CharField(max_length=3000)
     shape = Shape.CYLINDER
     evidential_claim = models.ManyToManyField(EvidentialClaim, related_name="evidence")
+    assurance_case = models.ForeignKey(
+        AssuranceCase,
+        null=True,
+        blank=True,
+        related_name="evidence",
+        # As for EvidentialClaim.assurance_case.
+        on_delete=models.SET_NULL,
+    )
+
+
+class CaseLock(models.Model):
+    """
+    Lease on editing an assurance case, held by a single editor (a browser tab,
+    identified by its lock_uuid) until expires_date, unless it is renewed before.
+    Once expired, it no longer stops anyone else editing the case, and it is
+    deleted by `python manage.py expire_case_locks`.
+
+    The lock_uuid of the case is kept the same as that of its lease, for clients
+    showing who is editing the case.
+    """
+
+    assurance_case = models.OneToOneField(
+        AssuranceCase,
+        primary_key=True,
+        related_name="lease",
+        on_delete=models.CASCADE,
+    )
+    lock_uuid = models.CharField(max_length=50)
+    user = models.ForeignKey(EAPUser, null=True, blank=True, on_delete=models.SET_NULL)
+    expires_date = models.DateTimeField(db_index=True)
+
+
+class CaseChange(models.Model):
+    """
+    Log of the changes to each assurance case and its items, by version of the
+    case, so that clients can catch up with the changes since the version they
+    have.
+    """
+
+    class Action(models.TextChoices):
+        CREATED = "created"
+        UPDATED = "updated"
+        DELETED = "deleted"
+
+    # No database constraint, since items deleted along with their case log their
+    # deletion just before the case goes. The log of a case is deleted with it by
+    # the post_delete handler in signals.py.
+    assurance_case = models.ForeignKey(
+        AssuranceCase,
+        related_name="changes",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    version = models.PositiveIntegerField()
+    # One of the values of ITEM_TYPE_NAMES.
+    item_type = models.CharField(max_length=32)
+    item_id = models.BigIntegerField()
+    action = models.CharField(max_length=8, choices=Action.choices)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["assurance_case", "version"])]
+
+
+# The names of the types of items, as in the TYPE_DICT of view_utils.py.
+ITEM_TYPE_NAMES = {
+    AssuranceCase: "assurance_case",
+    TopLevelNormativeGoal: "goal",
+    Context: "context",
+    SystemDescription: "system_description",
+    PropertyClaim: "property_claim",
+    EvidentialClaim: "evidential_claim",
+    Evidence: "evidence",
+}
+
+# Sent by record_case_changes, with the list of CaseChanges logged as `changes`.
+case_changed = Signal()
+
+
+def record_case_changes(changes):
+    """
+    Bump the versions of some cases, and log the changes made to them.
+
+    Params
+    ======
+    changes: iterable of (case_id, item_type, item_id, action) tuples, where
+        item_type is one of the values of ITEM_TYPE_NAMES and action one of the
+        values of CaseChange.Action. Changes with no case_id are ignored.
+
+    Returns
+    =======
+    dict mapping the id of each case changed to its new version.
+    """
+    changes = [change for change in changes if change[0] is not None]
+    case_ids = {case_id for case_id, _, _, _ in changes}
+    if not case_ids:
+        return {}
+    with transaction.atomic():
+        cases = AssuranceCase.objects.filter(pk__in=case_ids)
+        cases.update(version=models.F("version") + 1, updated_date=timezone.now())
+        # The rows of the cases are locked until the end of the transaction, so
+        # these are the versions we just set.
+        versions = dict(cases.values_list("pk", "version"))
+        logged = CaseChange.objects.bulk_create(
+            CaseChange(
+                assurance_case_id=case_id,
+                version=versions[case_id],
+                item_type=item_type,
+                item_id=item_id,
+                action=action,
+            )
+            for case_id, item_type, item_id, action in changes
+            if case_id in versions
+        )
+    case_changed.send(sender=CaseChange, changes=logged)
+    return versions
+
+
+def _update_case(items, case_id):
+    """
+    Set the case of a queryset of items, to a value or an expression, and log the
+    moves of those whose case changes.
+    """
+    model = items.model
+    old_cases = dict(items.values_list("pk", "assurance_case"))
+    items = model.objects.filter(pk__in=old_cases)
+    items.update(assurance_case_id=case_id)
+    type_name = ITEM_TYPE_NAMES[model]
+    changes = []
+    for pk, new_case_id in items.values_list("pk", "assurance_case"):
+        old_case_id = old_cases[pk]
+        if old_case_id != new_case_id:
+            changes.append((old_case_id, type_name, pk, CaseChange.Action.DELETED))
+            changes.append((new_case_id, type_name, pk, CaseChange.Action.CREATED))
+    record_case_changes(changes)
+
+
+def update_evidential_claims_case(evidential_claims):
+    """
+    Set the case of each of a queryset of EvidentialClaims, and of their Evidence, to
+    the case of their first parent PropertyClaim.
+    """
+    first_parent_case = PropertyClaim.objects.filter(
+        evidential_claims=models.OuterRef("pk")
+    ).order_by("id")
+    _update_case(
+        evidential_claims,
+        models.Subquery(first_parent_case.values("assurance_case_id")[:1]),
+    )
+    update_evidence_case(
+        Evidence.objects.filter(evidential_claim__in=evidential_claims)
+    )
+
+
+def update_evidence_case(evidence):
+    """
+    Set the case of each of a queryset of Evidence to the case of their first parent
+    EvidentialClaim.
+    """
+    first_parent_case = EvidentialClaim.objects.filter(
+        evidence=models.OuterRef("pk")
+    ).order_by("id")
+    _update_case(
+        evidence.distinct(),
+        models.Subquery(first_parent_case.values("assurance_case_id")[:1]),
+    )
+
+
+def set_case_of_descendants(case_id, goal_ids=(), claim_ids=()):
+    """
+    Move everything under the given goals and PropertyClaims to the given case. Used
+    when a goal or a PropertyClaim is reparented into another case.
+    """
+    _update_case(Context.objects.filter(goal_id__in=goal_ids), case_id)
+    _update_case(SystemDescription.objects.filter(goal_id__in=goal_ids), case_id)
+    claims = PropertyClaim.objects.subtree(goal_ids=goal_ids, claim_ids=claim_ids)
+    claim_ids = list(claims.values_list("id", flat=True))
+    _update_case(PropertyClaim.objects.filter(id__in=claim_ids), case_id)
+    update_evidential_claims_case(
+        EvidentialClaim.objects.filter(property_claim__in=claim_ids)
+    )
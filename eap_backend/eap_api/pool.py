@@ -0,0 +1,191 @@
+"""
+An in-process pool of database connections, used by the Postgres backend of
+eap_api/postgresql when the POOL setting of a database is set (see settings.py).
+
+Django keeps one connection per thread, opened when a request first queries the
+database, and either closed at the end of the request, or kept for CONN_MAX_AGE
+seconds. With many threads, e.g. those of the async views, that is either a new
+connection for every request, or one open connection per thread. With a pool, the
+threads of a process share at most POOL["MAX_SIZE"] connections: the connection of
+a thread goes back to the pool when Django closes it at the end of a request, and
+the next request, of any thread, takes it from there, waiting for at most
+POOL["TIMEOUT"] seconds when all of them are in use.
+"""
+import threading
+import time
+
+from .metrics import Histogram
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection of a pool became free in time."""
+
+
+class ConnectionPool:
+    """
+    A pool of at most `max_size` connections, shared by the threads of the process.
+
+    Params
+    ======
+    name: name of the pool in the metrics, e.g. the alias of the database
+    max_size: maximum number of connections open at a time
+    timeout: seconds to wait for a connection when all of them are in use
+    check: optional function, called with a connection before it is reused, which
+        returns False if the connection is broken and must be dropped
+    """
+
+    def __init__(self, name, max_size, timeout=10, check=None):
+        self.name = name
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check = check
+        self._condition = threading.Condition()
+        # Most recently used last, so that idle connections are reused first.
+        self._idle = []
+        self.size = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+
+    @property
+    def in_use(self):
+        return self.size - len(self._idle)
+
+    def get(self, connect):
+        """
+        Take a connection from the pool, or open one with `connect` if none is idle
+        and the pool is not full.
+
+        Raises
+        ======
+        PoolTimeout if none became free within the timeout
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        try:
+            while True:
+                with self._condition:
+                    while not self._idle and self.size >= self.max_size:
+                        waited = True
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            raise PoolTimeout(
+                                f"No connection of the pool {self.name} became free "
+                                f"in {self.timeout} seconds."
+                            )
+                        self._condition.wait(remaining)
+                    if self._idle:
+                        conn = self._idle.pop()
+                    else:
+                        # Counted before connecting, for no other thread to also
+                        # take the last place in the pool.
+                        self.size += 1
+                        conn = None
+                if conn is None:
+                    try:
+                        return connect()
+                    except BaseException:
+                        self._drop()
+                        raise
+                if self.check is None or self.check(conn):
+                    return conn
+                self._close(conn)
+                self._drop()
+        finally:
+            if waited:
+                self._record_wait(time.monotonic() - start)
+
+    def put(self, conn, broken=False):
+        """Give a connection back to the pool, or drop it from the pool if broken."""
+        if broken:
+            self._close(conn)
+            self._drop()
+            return
+        with self._condition:
+            self._idle.append(conn)
+            self._condition.notify()
+
+    def close_idle(self):
+        """Close every idle connection, e.g. before the process forks or exits."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self.size -= len(idle)
+            self._condition.notify(len(idle))
+        for conn in idle:
+            self._close(conn)
+
+    def _drop(self):
+        with self._condition:
+            self.size -= 1
+            self._condition.notify()
+
+    def _record_wait(self, seconds):
+        with self._condition:
+            self.waits += 1
+            self.wait_time += seconds
+        WAIT_HISTOGRAM.observe(self.name, seconds)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        """The numbers of connections of the pool, and of waits for one."""
+        with self._condition:
+            return {
+                "max_size": self.max_size,
+                "size": self.size,
+                "in_use": self.in_use,
+                "idle": len(self._idle),
+                "waits": self.waits,
+                "wait_seconds": self.wait_time,
+                "timeouts": self.timeouts,
+            }
+
+
+WAIT_HISTOGRAM = Histogram(
+    "eap_db_pool_wait_seconds",
+    "Time spent waiting for a connection of a pool to become free.",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    label="database",
+)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, max_size, timeout=10, check=None):
+    """The pool of the database with the given alias, made on first use."""
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(alias, max_size, timeout, check)
+        return pool
+
+
+def render_pool_metrics():
+    """Return the lines of the metrics of the pools in the Prometheus text format."""
+    with _pools_lock:
+        pools = sorted(_pools.items())
+    if not pools:
+        return []
+    all_stats = [(alias, pool.stats()) for alias, pool in pools]
+    lines = []
+    for stat, kind, description in (
+        ("max_size", "gauge", "Maximum number of connections of the pool."),
+        ("size", "gauge", "Number of open connections of the pool."),
+        ("in_use", "gauge", "Number of connections of the pool in use."),
+        ("idle", "gauge", "Number of idle connections of the pool."),
+        ("waits", "counter", "Number of waits for a connection to become free."),
+        ("timeouts", "counter", "Number of waits for a connection that timed out."),
+    ):
+        name = f"eap_db_pool_{stat}" + ("_total" if kind == "counter" else "")
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        for alias, stats in all_stats:
+            lines.append(f'{name}{{database="{alias}"}} {stats[stat]}')
+    return lines + WAIT_HISTOGRAM.render()
@@ -0,0 +1,107 @@
+"""
+The Postgres backend of Django, with health checks of persistent connections and
+an optional pool of connections, set with ENGINE "eap_api.postgresql" and these
+extra keys of the settings of a database (see settings.py):
+* CONN_HEALTH_CHECKS: check that a persistent connection still works, with a
+  "SELECT 1", before the first query of each request, and open a new one if not,
+  rather than failing the request, e.g. after the database server restarted. As
+  the setting of the same name of Django 4.1.
+* POOL: None, or {"MAX_SIZE": <int>, "TIMEOUT": <float>} to share at most MAX_SIZE
+  connections between the threads of each process (see eap_api/pool.py). Used with
+  CONN_MAX_AGE 0, for every connection to go back to the pool after each request.
+"""
+import psycopg2
+from django.db.backends.postgresql import base
+from ..pool import PoolTimeout, get_pool
+
+
+def _is_usable(conn):
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except psycopg2.Error:
+        return False
+    return True
+
+
+def _reset(conn):
+    """Roll back what a connection was doing, returning False if it is broken."""
+    if conn.closed:
+        return False
+    try:
+        status = conn.get_transaction_status()
+        if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        return False
+    return conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """The connection of a thread to Postgres, see the docstring of the module."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def pool(self):
+        options = self.settings_dict.get("POOL")
+        if not options:
+            return None
+        check = _is_usable if self.settings_dict.get("CONN_HEALTH_CHECKS") else None
+        return get_pool(
+            self.alias, options["MAX_SIZE"], options.get("TIMEOUT", 10), check
+        )
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        parent = super()
+        try:
+            connection = pool.get(lambda: parent.get_new_connection(conn_params))
+        except PoolTimeout as e:
+            raise base.Database.OperationalError(str(e)) from e
+        # Set by get_new_connection for new connections, as needed by
+        # set_autocommit, and likewise for those of the pool.
+        options = self.settings_dict["OPTIONS"]
+        self.isolation_level = options.get(
+            "isolation_level", connection.isolation_level
+        )
+        return connection
+
+    def connect(self):
+        super().connect()
+        # New connections, and those of the pool, which checks them, work.
+        self.health_check_done = True
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        # Closed in an atomic block, the connection stays with this thread until
+        # the block ends, so must not go back to the pool.
+        broken = self.in_atomic_block or not _reset(self.connection)
+        pool.put(self.connection, broken=broken)
+
+    def close_if_unusable_or_obsolete(self):
+        # Called at the start and end of each request.
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        if (
+            self.connection is None
+            or not self.settings_dict.get("CONN_HEALTH_CHECKS")
+            or self.health_check_done
+            or self.in_atomic_block
+        ):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
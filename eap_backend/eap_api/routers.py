@@ -0,0 +1,136 @@
+"""
+Routing of reads to the read replicas of the database, set with DBREPLICAHOSTS
+(see settings.py).
+
+ReplicaMiddleware lets the GET requests of the views in settings.REPLICA_VIEWS,
+those polled by the frontend, read from the replicas, and ReplicaRouter sends their
+queries to one of them at random. Every other query, including those of every
+write, goes to the primary database, "default".
+
+Replicas lag behind the primary, so after a client makes a write (any request
+other than GET, HEAD or OPTIONS), its reads go to the primary too for
+REPLICA_PIN_SECONDS, for it to see its own changes. Clients are told apart by their
+token, or else their session or address, and the times are kept in the cache of
+cases, which must be shared for them to cover several server processes.
+"""
+import asyncio
+import contextvars
+import hashlib
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# The routing of the request being handled, if ReplicaMiddleware is in use.
+_current_routing = contextvars.ContextVar("replica_routing", default=None)
+
+
+class RequestRouting:
+    """Whether the request being handled may read from the replicas."""
+
+    def __init__(self):
+        self.use_replicas = False
+
+
+class ReplicaRouter:
+    """Sends reads to the replicas when the request allows it, see the module."""
+
+    def db_for_read(self, model, **hints):
+        routing = _current_routing.get()
+        if (
+            settings.READ_REPLICAS
+            and routing is not None
+            and routing.use_replicas
+            # Reads in a transaction must see its writes.
+            and not connections["default"].in_atomic_block
+        ):
+            return random.choice(settings.READ_REPLICAS)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the tables of the primary through replication.
+        return db not in settings.READ_REPLICAS
+
+
+def _client_key(request):
+    client = (
+        request.META.get("HTTP_AUTHORIZATION")
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        or request.META.get("REMOTE_ADDR", "")
+    )
+    return "primary:" + hashlib.sha256(client.encode()).hexdigest()
+
+
+def pin_to_primary(request):
+    """Send the reads of the client of a request to the primary for a while."""
+    caches[settings.CASE_CACHE].set(
+        _client_key(request), True, settings.REPLICA_PIN_SECONDS
+    )
+
+
+def is_pinned_to_primary(request):
+    """Whether the client of a request made a write recently, see pin_to_primary."""
+    return caches[settings.CASE_CACHE].get(_client_key(request), False)
+
+
+class ReplicaMiddleware:
+    """
+    Lets the reads of GET requests to the views in settings.REPLICA_VIEWS go to the
+    replicas, unless the client made a write recently, and pins the clients making
+    writes to the primary. Works both under WSGI and under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Tell Django to call this asynchronously, as MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = _current_routing.set(RequestRouting())
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_routing.reset(token)
+        return self.record(request, response)
+
+    async def __acall__(self, request):
+        token = _current_routing.set(RequestRouting())
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_routing.reset(token)
+        return self.record(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The URL name is only known from here. The routing is changed in place,
+        # rather than set, to be seen by the view wherever it runs.
+        routing = _current_routing.get()
+        if (
+            routing is not None
+            and settings.READ_REPLICAS
+            and request.method in ("GET", "HEAD")
+            and request.resolver_match.url_name in settings.REPLICA_VIEWS
+            and not is_pinned_to_primary(request)
+        ):
+            routing.use_replicas = True
+
+    def record(self, request, response):
+        if settings.READ_REPLICAS and request.method not in SAFE_METHODS:
+            pin_to_primary(request)
+        return response
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from .metrics import TimedSerializerMixin
 from .models import (
     AssuranceCase,
     EAPUser,
@@ -12,7 +13,7 @@ from .models import (
 )
 
 
-class EAPUserSerializer(serializers.ModelSerializer):
+class EAPUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     all_groups = serializers.PrimaryKeyRelatedField(
         many=True, read_only=True, required=False
     )
@@ -34,7 +35,7 @@ class EAPUserSerializer(serializers.ModelSerializer):
         )
 
 
-class EAPGroupSerializer(serializers.ModelSerializer):
+class EAPGroupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     members = serializers.PrimaryKeyRelatedField(
         source="member", many=True, queryset=EAPUser.objects.all()
     )
@@ -56,7 +57,7 @@ class EAPGroupSerializer(serializers.ModelSerializer):
         )
 
 
-class AssuranceCaseSerializer(serializers.ModelSerializer):
+class AssuranceCaseSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     goals = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     type = serializers.CharField(default="AssuranceCase", read_only=True)
 
@@ -73,10 +74,15 @@ class AssuranceCaseSerializer(serializers.ModelSerializer):
             "owner",
             "edit_groups",
             "view_groups",
+            "version",
         )
+        # Set through the lock view, see acquire_case_lock.
+        read_only_fields = ("version", "lock_uuid")
 
 
-class TopLevelNormativeGoalSerializer(serializers.ModelSerializer):
+class TopLevelNormativeGoalSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     assurance_case_id = serializers.PrimaryKeyRelatedField(
         source="assurance_case", queryset=AssuranceCase.objects.all()
     )
@@ -98,10 +104,12 @@ class TopLevelNormativeGoalSerializer(serializers.ModelSerializer):
             "context",
             "system_description",
             "property_claims",
+            "version",
         )
+        read_only_fields = ("version",)
 
 
-class ContextSerializer(serializers.ModelSerializer):
+class ContextSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     goal_id = serializers.PrimaryKeyRelatedField(
         source="goal", queryset=TopLevelNormativeGoal.objects.all()
     )
@@ -117,10 +125,12 @@ class ContextSerializer(serializers.ModelSerializer):
             "long_description",
             "created_date",
             "goal_id",
+            "version",
         )
+        read_only_fields = ("version",)
 
 
-class SystemDescriptionSerializer(serializers.ModelSerializer):
+class SystemDescriptionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     goal_id = serializers.PrimaryKeyRelatedField(
         source="goal", queryset=TopLevelNormativeGoal.objects.all()
     )
@@ -135,10 +145,12 @@ class SystemDescriptionSerializer(serializers.ModelSerializer):
             "short_description",
             "long_description",
             "goal_id",
+            "version",
         )
+        read_only_fields = ("version",)
 
 
-class PropertyClaimSerializer(serializers.ModelSerializer):
+class PropertyClaimSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     goal_id = serializers.PrimaryKeyRelatedField(
         source="goal",
         queryset=TopLevelNormativeGoal.objects.all(),
@@ -169,10 +181,12 @@ class PropertyClaimSerializer(serializers.ModelSerializer):
             "claim_type",
             "evidential_claims",
             "property_claims",
+            "version",
         )
+        read_only_fields = ("version",)
 
 
-class EvidentialClaimSerializer(serializers.ModelSerializer):
+class EvidentialClaimSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     property_claim_id = serializers.PrimaryKeyRelatedField(
         source="property_claim",
         queryset=PropertyClaim.objects.all(),
@@ -191,10 +205,12 @@ class EvidentialClaimSerializer(serializers.ModelSerializer):
             "long_description",
             "property_claim_id",
             "evidence",
+            "version",
         )
+        read_only_fields = ("version",)
 
 
-class EvidenceSerializer(serializers.ModelSerializer):
+class EvidenceSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     evidential_claim_id = serializers.PrimaryKeyRelatedField(
         source="evidential_claim",
         queryset=EvidentialClaim.objects.all(),
@@ -212,4 +228,6 @@ class EvidenceSerializer(serializers.ModelSerializer):
             "long_description",
             "URL",
             "evidential_claim_id",
+            "version",
         )
+        read_only_fields = ("version",)
@@ -0,0 +1,217 @@
+"""
+Signal handlers keeping denormalised data about assurance cases up to date (the
+case of every item, the version and change log of every case, and the cache of
+the JSON of every case), and publishing the changes to the live feeds of events in
+events.py.
+"""
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .models import (
+    EAPGroup,
+    AssuranceCase,
+    TopLevelNormativeGoal,
+    Context,
+    SystemDescription,
+    PropertyClaim,
+    EvidentialClaim,
+    Evidence,
+    CaseChange,
+    ITEM_TYPE_NAMES,
+    case_changed,
+    record_case_changes,
+    update_evidential_claims_case,
+    update_evidence_case,
+)
+from .events import publish_case_event
+from .view_utils import invalidate_case_trees
+
+CASE_ITEM_MODELS = (
+    TopLevelNormativeGoal,
+    Context,
+    SystemDescription,
+    PropertyClaim,
+    EvidentialClaim,
+    Evidence,
+)
+
+
+def _links_changed(*items):
+    """
+    Log updates of the items on both sides of some changed m2m links.
+
+    Params
+    ======
+    items: (model, pks) pairs
+    """
+    changes = []
+    for model, pks in items:
+        case_field = "pk" if model is AssuranceCase else "assurance_case"
+        cases = model.objects.filter(pk__in=pks).values_list("pk", case_field)
+        for pk, case_id in cases:
+            changes.append(
+                (case_id, ITEM_TYPE_NAMES[model], pk, CaseChange.Action.UPDATED)
+            )
+    record_case_changes(changes)
+
+
+def _changed_pks(instance, action, reverse, pk_set, forward_name, reverse_name):
+    """
+    For an m2m_changed signal, return the pks of the items on the forward side of
+    the relation (the children), and of those on the reverse side (the parents),
+    whose links were changed. Return None if the signal doesn't change anything.
+
+    When clearing, pk_set isn't given, so we note down the pks before the clear.
+    """
+    related_name = reverse_name if reverse else forward_name
+    if action == "pre_clear":
+        related = getattr(instance, related_name)
+        instance._cleared_pks = set(related.values_list("pk", flat=True))
+        return None
+    if action == "post_clear":
+        pk_set = instance.__dict__.pop("_cleared_pks", set())
+    elif action not in ("post_add", "post_remove"):
+        return None
+    if reverse:
+        return pk_set, {instance.pk}
+    return {instance.pk}, pk_set
+
+
+@receiver(m2m_changed, sender=EvidentialClaim.property_claim.through)
+def evidential_claim_parents_changed(sender, instance, action, reverse, pk_set, **kw):
+    changed = _changed_pks(
+        instance, action, reverse, pk_set, "property_claim", "evidential_claims"
+    )
+    if changed is None:
+        return
+    child_pks, parent_pks = changed
+    update_evidential_claims_case(EvidentialClaim.objects.filter(pk__in=child_pks))
+    _links_changed((EvidentialClaim, child_pks), (PropertyClaim, parent_pks))
+
+
+@receiver(m2m_changed, sender=Evidence.evidential_claim.through)
+def evidence_parents_changed(sender, instance, action, reverse, pk_set, **kw):
+    changed = _changed_pks(
+        instance, action, reverse, pk_set, "evidential_claim", "evidence"
+    )
+    if changed is None:
+        return
+    child_pks, parent_pks = changed
+    update_evidence_case(Evidence.objects.filter(pk__in=child_pks))
+    _links_changed((Evidence, child_pks), (EvidentialClaim, parent_pks))
+
+
+@receiver(m2m_changed, sender=AssuranceCase.edit_groups.through)
+@receiver(m2m_changed, sender=AssuranceCase.view_groups.through)
+def case_groups_changed(sender, instance, action, reverse, pk_set, **kw):
+    if sender is AssuranceCase.edit_groups.through:
+        names = ("edit_groups", "editable_cases")
+    else:
+        names = ("view_groups", "viewable_cases")
+    changed = _changed_pks(instance, action, reverse, pk_set, *names)
+    if changed is not None:
+        _links_changed((AssuranceCase, changed[0]))
+
+
+@receiver(post_save, sender=AssuranceCase)
+def case_saved(sender, instance, created, **kwargs):
+    loaded_lock_uuid = getattr(instance, "_loaded_lock_uuid", instance.lock_uuid)
+    instance._loaded_lock_uuid = instance.lock_uuid
+    if created:
+        # In case the id is reused, e.g. after a rolled back transaction.
+        invalidate_case_trees([instance.pk])
+        return
+    versions = record_case_changes(
+        [(instance.pk, "assurance_case", instance.pk, CaseChange.Action.UPDATED)]
+    )
+    if loaded_lock_uuid != instance.lock_uuid:
+        publish_case_event(
+            instance.pk,
+            "lock",
+            type="assurance_case",
+            id=instance.pk,
+            version=versions[instance.pk],
+            lock_uuid=instance.lock_uuid,
+        )
+
+
+@receiver(pre_delete, sender=AssuranceCase)
+def case_deleting(sender, instance, **kwargs):
+    # Noted down before the cascade sets their case to null.
+    instance._evidential_claim_pks = list(
+        instance.evidential_claims.values_list("pk", flat=True)
+    )
+    instance._evidence_pks = list(instance.evidence.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=AssuranceCase)
+def case_deleted(sender, instance, **kwargs):
+    CaseChange.objects.filter(assurance_case_id=instance.pk).delete()
+    invalidate_case_trees([instance.pk])
+    # Deleted through the ORM (e.g. with its owner), rather than delete_case: the
+    # EvidentialClaims and Evidence of the case with parents left in other cases
+    # move to the case of the first of those, and the others are deleted.
+    evidential_claims = EvidentialClaim.objects.filter(
+        pk__in=instance.__dict__.pop("_evidential_claim_pks", [])
+    )
+    update_evidential_claims_case(evidential_claims)
+    evidential_claims.filter(assurance_case=None).delete()
+    evidence = Evidence.objects.filter(
+        pk__in=instance.__dict__.pop("_evidence_pks", [])
+    )
+    update_evidence_case(evidence)
+    evidence.filter(assurance_case=None).delete()
+
+
+@receiver(pre_delete, sender=EAPGroup)
+def group_deleted(sender, instance, **kwargs):
+    cases = AssuranceCase.objects.filter(
+        Q(edit_groups=instance) | Q(view_groups=instance)
+    )
+    _links_changed((AssuranceCase, cases.values_list("pk", flat=True)))
+
+
+@receiver(case_changed)
+def invalidate_cached_case_trees(sender, changes, **kwargs):
+    invalidate_case_trees({change.assurance_case_id for change in changes})
+
+
+@receiver(case_changed)
+def publish_case_changes(sender, changes, **kwargs):
+    for change in changes:
+        publish_case_event(
+            change.assurance_case_id,
+            change.action,
+            type=change.item_type,
+            id=change.item_id,
+            version=change.version,
+        )
+
+
+def item_saved(sender, instance, created, **kwargs):
+    action = CaseChange.Action.CREATED if created else CaseChange.Action.UPDATED
+    _item_changed(instance, action)
+
+
+def item_deleted(sender, instance, **kwargs):
+    _item_changed(instance, CaseChange.Action.DELETED)
+
+
+def _item_changed(instance, action):
+    case_id = instance.assurance_case_id
+    old_case_id = getattr(instance, "_loaded_case_id", case_id)
+    item = (ITEM_TYPE_NAMES[type(instance)], instance.pk)
+    changes = [(case_id, *item, action)]
+    # Items moved to another case are deleted from the old one, and created in the
+    # new one.
+    if old_case_id != case_id:
+        changes = [
+            (old_case_id, *item, CaseChange.Action.DELETED),
+            (case_id, *item, CaseChange.Action.CREATED),
+        ]
+    record_case_changes(changes)
+
+
+for model in CASE_ITEM_MODELS:
+    post_save.connect(item_saved, sender=model)
+    post_delete.connect(item_deleted, sender=model)
@@ -1,5 +1,10 @@
+from django.conf import settings
 from django.urls import path, include
-from . import views
+from . import async_views, views
+
+# The views polled by the frontend, async when served as an ASGI application, see
+# async_views.py.
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 
 urlpatterns = [
@@ -9,33 +14,54 @@ urlpatterns = [
     path("users/<int:pk>/", views.user_detail, name="user_detail"),
     path("groups/", views.group_list, name="group_list"),
     path("groups/<int:pk>/", views.group_detail, name="group_detail"),
-    path("cases/", views.case_list, name="case_list"),
-    path("cases/<int:pk>/", views.case_detail, name="case_detail"),
-    path("goals/", views.goal_list, name="goal_list"),
-    path("goals/<int:pk>/", views.goal_detail, name="goal_detail"),
-    path("contexts/", views.context_list, name="context_list"),
-    path("contexts/<int:pk>/", views.context_detail, name="context_detail"),
-    path("descriptions/", views.description_list, name="description_list"),
-    path("descriptions/<int:pk>/", views.description_detail, name="description_detail"),
-    path("propertyclaims/", views.property_claim_list, name="property_claim_list"),
+    path("cases/", read_views.case_list, name="case_list"),
+    path("cases/import/", views.case_import, name="case_import"),
+    path("cases/<int:pk>/", read_views.case_detail, name="case_detail"),
+    path("cases/<int:pk>/clone/", views.case_clone, name="case_clone"),
+    path("cases/<int:pk>/lock/", views.case_lock, name="case_lock"),
+    path("cases/<int:pk>/export/", views.case_export, name="case_export"),
+    path("cases/<int:pk>/changes/", views.case_changes, name="case_changes"),
+    path("cases/<int:pk>/events/", views.case_events, name="case_events"),
+    path("batch/", views.batch, name="batch"),
+    path("case-cache/stats/", views.case_cache_stats, name="case_cache_stats"),
+    path("metrics/", views.metrics, name="metrics"),
+    path("health/", views.health, name="health"),
+    path("goals/", read_views.goal_list, name="goal_list"),
+    path("goals/<int:pk>/", read_views.goal_detail, name="goal_detail"),
+    path("contexts/", read_views.context_list, name="context_list"),
+    path("contexts/<int:pk>/", read_views.context_detail, name="context_detail"),
+    path("descriptions/", read_views.description_list, name="description_list"),
+    path(
+        "descriptions/<int:pk>/",
+        read_views.description_detail,
+        name="description_detail",
+    ),
+    path("propertyclaims/", read_views.property_claim_list, name="property_claim_list"),
     path(
         "propertyclaims/<int:pk>/",
-        views.property_claim_detail,
+        read_views.property_claim_detail,
         name="property_claim_detail",
     ),
     path(
-        "evidentialclaims/", views.evidential_claim_list, name="evidential_claim_list"
+        "propertyclaims/<int:pk>/move/",
+        views.property_claim_move,
+        name="property_claim_move",
+    ),
+    path(
+        "evidentialclaims/",
+        read_views.evidential_claim_list,
+        name="evidential_claim_list",
     ),
     path(
         "evidentialclaims/<int:pk>/",
-        views.evidential_claim_detail,
+        read_views.evidential_claim_detail,
         name="evidential_claim_detail",
     ),
-    path("evidence/", views.evidence_list, name="evidence_list"),
-    path("evidence/<int:pk>/", views.evidence_detail, name="evidence_detail"),
+    path("evidence/", read_views.evidence_list, name="evidence_list"),
+    path("evidence/<int:pk>/", read_views.evidence_detail, name="evidence_detail"),
     path(
         "parents/<str:item_type>/<int:pk>",
-        views.parents,
+        read_views.parents,
         name="parents",
     ),
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
@@ -1,5 +1,31 @@
+import json
+import tempfile
+import threading
+from datetime import timedelta
 import warnings
-from django.http import JsonResponse
+from collections import defaultdict
+import ijson
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import BadRequest
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import (
+    Case,
+    CharField,
+    Exists,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Value,
+    When,
+    prefetch_related_objects,
+)
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework.exceptions import ParseError
 from .models import (
     EAPGroup,
     AssuranceCase,
@@ -9,6 +35,12 @@ from .models import (
     PropertyClaim,
     EvidentialClaim,
     Evidence,
+    CaseChange,
+    CaseItem,
+    CaseLock,
+    ITEM_TYPE_NAMES,
+    VersionConflict,
+    record_case_changes,
 )
 from . import models
 from .serializers import (
@@ -71,6 +103,12 @@ TYPE_DICT = {
         "parent_types": [("evidential_claim", True)],
     },
 }
+# Number of items inserted at a time by save_json_stream.
+IMPORT_BATCH_SIZE = 1000
+# Largest number of operations in a request to the batch view.
+MAX_BATCH_SIZE = 1000
+# Largest number of items on a page of a list view, see paginate.
+MAX_PAGE_SIZE = 1000
 # Pluralising the name of the type should be irrelevant.
 for k, v in tuple(TYPE_DICT.items()):
     TYPE_DICT[k + "s"] = v
@@ -85,29 +123,78 @@ def get_case_id(item):
         item = item.first()
     if isinstance(item, models.AssuranceCase):
         return item.id
-    for k, v in TYPE_DICT.items():
-        if isinstance(item, v["model"]):
-            for parent_type, _ in v["parent_types"]:
-                parent = getattr(item, parent_type)
-                if parent is not None:
-                    return get_case_id(parent)
-    # TODO This should probably be an error raise rather than a warning, but currently
-    # there are dead items in the database without parents which hit this branch.
-    msg = f"Can't figure out the case ID of {item}."
-    warnings.warn(msg)
-    return None
+    # Every item type stores the id of its case, see models.py.
+    case_id = getattr(item, "assurance_case_id", None)
+    if case_id is None:
+        # TODO This should probably be an error raise rather than a warning, but
+        # currently there are dead items in the database without parents which hit
+        # this branch.
+        msg = f"Can't figure out the case ID of {item}."
+        warnings.warn(msg)
+    return case_id
 
 
 def filter_by_case_id(items, request):
-    """Filter an iterable of case items, based on whether they are in the case specified
+    """Filter a queryset of case items, based on whether they are in the case specified
     in the request query string.
     """
     if "case_id" in request.GET:
         case_id = int(request.GET["case_id"])
-        items = [g for g in items if get_case_id(g) == case_id]
+        items = items.filter(assurance_case_id=case_id)
     return items
 
 
+def paginate(items, request):
+    """
+    Take a page of a queryset for a list view, by keyset on id: the items with ids
+    greater than the `cursor` parameter of the request, up to `limit` of them.
+    Each page is a single indexed query, however far into the list it is.
+    Requests with neither parameter get every item, as before pages were added,
+    since some clients (e.g. the selectors of the frontend) don't follow cursors.
+
+    Params
+    ======
+    items: queryset, of model instances or of values including "id"
+    request: the request, with optional `limit` and `cursor` parameters
+
+    Returns
+    =======
+    page: list of the items on the page, ordered by id
+    next_cursor: cursor of the next page, None if this is the last one
+    """
+    try:
+        limit = int(request.GET.get("limit", MAX_PAGE_SIZE))
+        cursor = int(request.GET.get("cursor", 0))
+    except ValueError:
+        raise BadRequest("limit and cursor should be integers.")
+    if limit < 1:
+        raise BadRequest("limit should be positive.")
+    if "limit" not in request.GET and "cursor" not in request.GET:
+        return list(items.order_by("id")), None
+    limit = min(limit, MAX_PAGE_SIZE)
+    page = list(items.filter(id__gt=cursor).order_by("id")[: limit + 1])
+    if len(page) <= limit:
+        return page, None
+    last = page[limit - 1]
+    page = page[:limit]
+    return page, last["id"] if isinstance(last, dict) else last.id
+
+
+def set_next_page_headers(response, request, next_cursor):
+    """
+    Point to the next page of a list view, if any, from a response: with the
+    cursor in the X-Next-Cursor header, and the full URL in the Link header. The
+    body stays the plain list of items.
+    """
+    if next_cursor is not None:
+        query = request.GET.copy()
+        query["cursor"] = next_cursor
+        url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+        response["Link"] = f'<{url}>; rel="next"'
+        response["X-Next-Cursor"] = str(next_cursor)
+    return response
+
+
 def make_summary(serialized_data):
     """
     Take in a full serialized object, and return dict containing just
@@ -130,15 +217,115 @@ def make_summary(serialized_data):
         return summarize_one(serialized_data)
 
 
-def get_json_tree(id_list, obj_type):
+def get_goal_trees(goals):
+    """
+    Populate the full JSON data for some goals and all their descendants, used
+    in the case_detail and goal_detail views (i.e. one API call returns the full
+    case data).
+
+    Every item below the goals is fetched with a fixed number of bulk queries,
+    regardless of the size of the case, and the nested JSON is then assembled in
+    memory.
+
+    Params
+    ======
+    goals: queryset of TopLevelNormativeGoals
+
+    Returns
+    =======
+    objs: list of json objects, one per goal, ordered by id
+    """
+    goals = list(
+        goals.order_by("id").prefetch_related(
+            "context",
+            "system_description",
+            Prefetch("property_claims", queryset=_id_queryset(PropertyClaim, "goal")),
+        )
+    )
+    claims = list(PropertyClaim.objects.subtree(goal_ids=[goal.id for goal in goals]))
+    prefetch_related_objects(
+        claims,
+        Prefetch(
+            "property_claims",
+            queryset=_id_queryset(PropertyClaim, "property_claim"),
+        ),
+        "evidential_claims",
+        Prefetch(
+            "evidential_claims__property_claim",
+            queryset=_id_queryset(PropertyClaim),
+        ),
+        "evidential_claims__evidence",
+        Prefetch(
+            "evidential_claims__evidence__evidential_claim",
+            queryset=_id_queryset(EvidentialClaim),
+        ),
+    )
+    contexts = [c for goal in goals for c in goal.context.all()]
+    descriptions = [d for goal in goals for d in goal.system_description.all()]
+    evidential_claims = {
+        e.id: e for claim in claims for e in claim.evidential_claims.all()
+    }
+    evidence = {
+        e.id: e for eclaim in evidential_claims.values() for e in eclaim.evidence.all()
+    }
+    serialized = {}
+    for obj_type, objs in (
+        ("goal", goals),
+        ("context", contexts),
+        ("system_description", descriptions),
+        ("property_claim", claims),
+        ("evidential_claim", evidential_claims.values()),
+        ("evidence", evidence.values()),
+    ):
+        serializer = TYPE_DICT[obj_type]["serializer"](objs, many=True)
+        serialized[TYPE_DICT[obj_type]["model"]] = {
+            obj_data["id"]: obj_data for obj_data in serializer.data
+        }
+    return _assemble_json_tree([goal.id for goal in goals], "goals", serialized)
+
+
+def get_claim_ancestors(claim):
+    """
+    Serialize every item above a PropertyClaim, with a fixed number of queries
+    however deeply it is nested.
+
+    Params
+    ======
+    claim: PropertyClaim
+
+    Returns
+    =======
+    objs: list of json objects, the goal at the top followed by the claims from the
+        top level down to the parent of `claim`
+    """
+    claims = list(
+        PropertyClaim.objects.ancestors(claim.pk)
+        .select_related("goal")
+        .prefetch_related("evidential_claims", "property_claims")
+    )
+    top_claim = claims[0] if claims else claim
+    objs = []
+    if top_claim.goal is not None:
+        objs.append(TopLevelNormativeGoalSerializer(top_claim.goal).data)
+    objs += PropertyClaimSerializer(claims, many=True).data
+    return objs
+
+
+def _id_queryset(model, *fields):
+    """Queryset for prefetching only the ids (and the given foreign keys, needed
+    to match them to their parents) of the related items."""
+    return model.objects.only("id", *fields)
+
+
+def _assemble_json_tree(id_list, obj_type, serialized):
     """
-    Recursive function for populating the full JSON data for goals, used
-    in the case_detail view (i.e. one API call returns the full case data).
+    Recursively nest the serialized items under their parents.
 
     Params
     ======
     id_list: list of object_ids from the parent serializer
     obj_type: key of the json object (also a key of 'TYPE_DICT')
+    serialized: dict mapping each model to a dict of serialized items by id
 
     Returns
     =======
@@ -146,75 +333,1418 @@ def get_json_tree(id_list, obj_type):
     """
     objs = []
     for obj_id in id_list:
-        obj = TYPE_DICT[obj_type]["model"].objects.get(pk=obj_id)
-        obj_serializer = TYPE_DICT[obj_type]["serializer"](obj)
-        obj_data = obj_serializer.data
+        # Copy, since items with several parents get nested more than once.
+        obj_data = serialized[TYPE_DICT[obj_type]["model"]][obj_id].copy()
         for child_type in TYPE_DICT[obj_type]["children"]:
             child_list = sorted(obj_data[child_type])
-            obj_data[child_type] = get_json_tree(child_list, child_type)
+            obj_data[child_type] = _assemble_json_tree(
+                child_list, child_type, serialized
+            )
         objs.append(obj_data)
     return objs
 
 
-def save_json_tree(data, obj_type, parent_id=None, parent_type=None):
-    """Recursively write items in an assurance case tree.
+# Number of items fetched at a time when streaming the JSON of a case.
+EXPORT_BATCH_SIZE = 500
+# Bytes of an exported case kept in memory, past which it is written to disk.
+EXPORT_SPOOL_SIZE = 1024 * 1024
+# Prefetches needed to serialize each type of item, with only the ids of the
+# related items.
+EXPORT_PREFETCHES = {
+    TopLevelNormativeGoal: lambda: [
+        Prefetch("context", queryset=_id_queryset(Context, "goal")),
+        Prefetch(
+            "system_description", queryset=_id_queryset(SystemDescription, "goal")
+        ),
+        Prefetch("property_claims", queryset=_id_queryset(PropertyClaim, "goal")),
+    ],
+    Context: lambda: [],
+    SystemDescription: lambda: [],
+    PropertyClaim: lambda: [
+        Prefetch(
+            "property_claims", queryset=_id_queryset(PropertyClaim, "property_claim")
+        ),
+        Prefetch("evidential_claims", queryset=_id_queryset(EvidentialClaim)),
+    ],
+    EvidentialClaim: lambda: [
+        Prefetch("property_claim", queryset=_id_queryset(PropertyClaim)),
+        Prefetch("evidence", queryset=_id_queryset(Evidence)),
+    ],
+    Evidence: lambda: [
+        Prefetch("evidential_claim", queryset=_id_queryset(EvidentialClaim)),
+    ],
+}
 
-    Create a new assurance case like the one described by data, including all
-    its items.
+
+def stream_case_tree(case, permissions):
+    """
+    Generate the full JSON of a case, the same as returned by case_detail, in
+    chunks, to be streamed without building the whole of it in memory.
+
+    Only the ids of the items, and of their children, are held for the whole case.
+    The items themselves are fetched and serialized EXPORT_BATCH_SIZE at a time,
+    in the order in which they are written out. Items with several parents are
+    written out under each of them, as in case_detail.
 
     Params
     ======
-    data: JSON for the assurance case and all its items. At the top level
-        includes the whole item tree, subtrees when recursing.
-    obj_type: Key of the json object (also a key of 'TYPE_DICT'). At the top
-        level this should be "assurance_case".
-    parent_id: None at the top level, id of the caller when recursing.
+    case: AssuranceCase instance
+    permissions: permissions of the user on the case, see get_case_permissions
 
     Returns
     =======
-    objs: JsonResponse describing failure/success.
-    """
-    # Create the top object in data. Only include some of the fields from data,
-    # so that e.g. the new object gets a unique ID even if `data` specifies an
-    # ID.
-    this_data = {k: data[k] for k in TYPE_DICT[obj_type]["fields"]}
-    if parent_id is not None and parent_type is not None:
-        for parent_type_tmp, plural in TYPE_DICT[obj_type]["parent_types"]:
-            # TODO This is silly. It's all because some parent_type names are written
-            # with a plural s in the end while others are not.
-            if (
-                parent_type not in parent_type_tmp
-                and parent_type_tmp not in parent_type
-            ):
+    generator of str
+    """
+    case_data = dict(AssuranceCaseSerializer(case).data, permissions=permissions)
+    del case_data["goals"]
+    yield json.dumps(case_data)[:-1] + ', "goals": ['
+    children = _get_case_skeleton(case)
+    # Each entry of the stack is either an item to write out, as (model, id, first)
+    # where first is whether it's the first item of its list, or a str to write.
+    stack = ["]}"]
+    stack += _child_entries(children[AssuranceCase, TopLevelNormativeGoal, case.pk])
+    while stack:
+        batch = []
+        while stack and len(batch) < EXPORT_BATCH_SIZE:
+            entry = stack.pop()
+            batch.append(entry)
+            if isinstance(entry, str):
                 continue
-            if plural:
-                parent_id = [parent_id]
-            this_data[parent_type_tmp + "_id"] = parent_id
-    serializer_class = TYPE_DICT[obj_type]["serializer"]
-    serializer = serializer_class(data=this_data)
-    if serializer.is_valid():
-        serializer.save()
-    else:
-        return JsonResponse(serializer.errors, status=400)
-
-    # Recurse into child types.
-    name = serializer.data["name"]
-    id = serializer.data["id"]
-    success_http_code = 201
-    child_types = TYPE_DICT[obj_type]["children"]
-    for child_type in child_types:
-        if child_type not in data:
+            model, obj_id, _ = entry
+            # Push the children of the item, to be written after its own fields.
+            stack.append("}")
+            for child_type in reversed(TYPE_DICT[ITEM_TYPE_NAMES[model]]["children"]):
+                child_model = TYPE_DICT[child_type]["model"]
+                stack.append("]")
+                stack += _child_entries(children[model, child_model, obj_id])
+                stack.append(f', "{child_type}": [')
+        yield "".join(_write_export_batch(batch))
+
+
+def spool_case_tree(case, permissions):
+    """
+    Write the full JSON of a case, from stream_case_tree, to a temporary file, kept
+    in memory up to EXPORT_SPOOL_SIZE bytes, and on disk past that.
+
+    The JSON is written in full before the response is sent, since under ASGI
+    Django 3.2 sends streamed responses from the event loop, where the ORM can't be
+    used, rather than from the thread of the view.
+
+    Params
+    ======
+    case: AssuranceCase instance
+    permissions: permissions of the user on the case, see get_case_permissions
+
+    Returns
+    =======
+    binary file object, positioned at its start
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    for chunk in stream_case_tree(case, permissions):
+        spool.write(chunk.encode())
+    spool.seek(0)
+    return spool
+
+
+def _child_entries(child_ids):
+    """Entries of the stack of stream_case_tree for a list of children, in the
+    reverse order, to be popped in order."""
+    return [
+        (model, child_id, i == 0)
+        for i, (model, child_id) in reversed(list(enumerate(child_ids)))
+    ]
+
+
+def _get_case_skeleton(case):
+    """
+    Fetch the ids of all the items of a case, and of their children.
+
+    Returns
+    =======
+    defaultdict mapping (model of the parent, model of the children, id of the
+    parent) to the list of the (model, id) of the children, ordered by id.
+    """
+    claims = PropertyClaim.objects.filter(assurance_case_id=case.pk)
+    evidential_claim_links = EvidentialClaim.property_claim.through.objects.filter(
+        propertyclaim__assurance_case_id=case.pk
+    )
+    evidence_links = Evidence.evidential_claim.through.objects.filter(
+        evidentialclaim_id__in=evidential_claim_links.values("evidentialclaim_id")
+    )
+    children = defaultdict(list)
+    for parent_model, model, rows in (
+        (
+            AssuranceCase,
+            TopLevelNormativeGoal,
+            case.goals.values_list("id", "assurance_case_id"),
+        ),
+        (
+            TopLevelNormativeGoal,
+            Context,
+            Context.objects.filter(assurance_case_id=case.pk).values_list(
+                "id", "goal_id"
+            ),
+        ),
+        (
+            TopLevelNormativeGoal,
+            SystemDescription,
+            SystemDescription.objects.filter(assurance_case_id=case.pk).values_list(
+                "id", "goal_id"
+            ),
+        ),
+        (
+            TopLevelNormativeGoal,
+            PropertyClaim,
+            claims.filter(goal__isnull=False).values_list("id", "goal_id"),
+        ),
+        (
+            PropertyClaim,
+            PropertyClaim,
+            claims.filter(property_claim__isnull=False).values_list(
+                "id", "property_claim_id"
+            ),
+        ),
+        (
+            PropertyClaim,
+            EvidentialClaim,
+            evidential_claim_links.values_list(
+                "evidentialclaim_id", "propertyclaim_id"
+            ),
+        ),
+        (
+            EvidentialClaim,
+            Evidence,
+            evidence_links.values_list("evidence_id", "evidentialclaim_id"),
+        ),
+    ):
+        child_field = rows.query.values_select[0]
+        for child_id, parent_id in rows.order_by(child_field).iterator():
+            children[parent_model, model, parent_id].append((model, child_id))
+    return children
+
+
+def _write_export_batch(batch):
+    """
+    Serialize a batch of the entries of stream_case_tree, fetching the items in it
+    with a query per type of item.
+
+    Returns
+    =======
+    generator of str
+    """
+    ids = defaultdict(set)
+    for entry in batch:
+        if not isinstance(entry, str):
+            ids[entry[0]].add(entry[1])
+    serialized = {}
+    for model, obj_ids in ids.items():
+        obj_type = ITEM_TYPE_NAMES[model]
+        objs = model.objects.filter(pk__in=obj_ids).prefetch_related(
+            *EXPORT_PREFETCHES[model]()
+        )
+        for obj_data in TYPE_DICT[obj_type]["serializer"](objs, many=True).data:
+            for child_type in TYPE_DICT[obj_type]["children"]:
+                del obj_data[child_type]
+            serialized[model, obj_data["id"]] = obj_data
+    for entry in batch:
+        if isinstance(entry, str):
+            yield entry
             continue
-        for child_data in data[child_type]:
-            retval = save_json_tree(
-                child_data, child_type, parent_id=id, parent_type=obj_type
+        model, obj_id, first = entry
+        if not first:
+            yield ", "
+        # Leave the object open, for its children.
+        yield json.dumps(serialized[model, obj_id])[:-1]
+
+
+def get_case_changes(case, since):
+    """
+    Gather the items of a case created, updated or deleted since the given version
+    of the case, from its change log.
+
+    Params
+    ======
+    case: AssuranceCase
+    since: version of the case the client has
+
+    Returns
+    =======
+    dict with the current "version" of the case, and the "created" and "updated"
+    items, as lists of json objects by type, and the ids of the "deleted" items
+    by type. None if the changes since that version aren't known, in which case
+    the client has to fetch the whole case again.
+    """
+    changes = list(
+        case.changes.filter(version__gt=since, version__lte=case.version)
+        .order_by("version", "id")
+        .values_list("version", "item_type", "item_id", "action")
+    )
+    # Every version since is logged by record_case_changes, unless the log was
+    # cut short, or the version was bumped some other way.
+    logged = {version for version, _, _, _ in changes}
+    if since > case.version or logged != set(range(since + 1, case.version + 1)):
+        return None
+    # The net change to each item: something created and then updated is still
+    # created, something created and then deleted never existed, and something
+    # deleted and then created (moved out of the case and back) was updated.
+    actions = {}
+    for _, item_type, item_id, action in changes:
+        net_action = actions.get((item_type, item_id), action)
+        if net_action == CaseChange.Action.CREATED:
+            if action == CaseChange.Action.DELETED:
+                action = None
+            else:
+                action = net_action
+        elif net_action == CaseChange.Action.DELETED:
+            if action == CaseChange.Action.CREATED:
+                action = CaseChange.Action.UPDATED
+        actions[(item_type, item_id)] = action
+    result = {
+        "version": case.version,
+        "created": {},
+        "updated": {},
+        "deleted": {},
+    }
+    ids = defaultdict(lambda: defaultdict(list))
+    for (item_type, item_id), action in sorted(actions.items()):
+        if action is not None:
+            ids[action][item_type].append(item_id)
+    for item_type, item_ids in ids[CaseChange.Action.DELETED].items():
+        result["deleted"][item_type] = item_ids
+    for action in (CaseChange.Action.CREATED, CaseChange.Action.UPDATED):
+        for item_type, item_ids in ids[action].items():
+            model = TYPE_DICT[item_type]["model"]
+            items = model.objects.filter(pk__in=item_ids)
+            if model is not AssuranceCase:
+                items = items.filter(assurance_case=case)
+            items = items.order_by("id").prefetch_related(
+                *TYPE_DICT[item_type]["children"],
+                *(field.name for field in model._meta.many_to_many),
             )
-            # If one of the subcalls returns an error, return.
-            if retval.status_code != success_http_code:
-                return retval
+            serializer = TYPE_DICT[item_type]["serializer"](items, many=True)
+            result[action][item_type] = serializer.data
+            # Items logged as changed that have since left the case.
+            missing = set(item_ids) - {obj_data["id"] for obj_data in serializer.data}
+            if missing:
+                result["deleted"].setdefault(item_type, []).extend(sorted(missing))
+    return result
+
+
+def _case_cache():
+    return caches[settings.CASE_CACHE]
+
+
+def _case_cache_key(case_id):
+    return f"case:{case_id}"
+
+
+def get_case_tree(case):
+    """
+    Return the full JSON of a case and all its items, as returned by case_detail
+    (other than the permissions of the user), from the cache if it's up to date.
+
+    The cache holds the JSON of each case along with the version of the case it
+    was made from, so that an entry written by a request that started before a
+    change can't be mistaken for the current one, nor replace a newer one, e.g.
+    when read from a replica lagging behind the primary.
 
-    summary = {"name": name, "id": id}
-    return JsonResponse(summary, status=success_http_code)
+    Params
+    ======
+    case: AssuranceCase instance
+
+    Returns
+    =======
+    case_data: json object
+    """
+    cache = _case_cache()
+    cached = cache.get(_case_cache_key(case.pk))
+    if cached is not None and cached[0] == case.version:
+        _count_case_cache("hits")
+        return cached[1]
+    _count_case_cache("misses")
+    case_data = AssuranceCaseSerializer(case).data
+    case_data["goals"] = get_goal_trees(case.goals.all())
+    if cached is None or cached[0] < case.version:
+        cache.set(_case_cache_key(case.pk), (case.version, case_data))
+    return case_data
+
+
+def invalidate_case_trees(case_ids):
+    """Drop the cached JSON of some cases, see get_case_tree."""
+    _case_cache().delete_many([_case_cache_key(case_id) for case_id in case_ids])
+
+
+def _count_case_cache(counter):
+    # Kept in the cache itself, so that the counts cover every server process
+    # sharing the cache.
+    cache = _case_cache()
+    key = f"stats:{counter}"
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted in between.
+        pass
+
+
+def get_case_cache_stats():
+    """Return the numbers of hits and misses of the cache of case JSON."""
+    counts = _case_cache().get_many(["stats:hits", "stats:misses"])
+    return {
+        "hits": counts.get("stats:hits", 0),
+        "misses": counts.get("stats:misses", 0),
+    }
+
+
+def get_expected_version(request, item, etag=None):
+    """
+    Read the version of an item (or case) that the changes in a request were made
+    to, from its If-Match header, for optimistic concurrency control. The header is
+    either the version itself, e.g. `If-Match: "3"`, or the ETag of the item's JSON
+    (see get_case_etag) that the client got with the item.
+
+    Params
+    ======
+    request: request with the changes
+    item: the item (or case) being changed, as loaded by the request
+    etag: the current ETag of the item's JSON, if its view sends one
+
+    Returns
+    =======
+    int, or None if the header is missing or "*", in which case the changes are
+    made whatever the current version
+
+    Raises
+    ======
+    ParseError if the header is malformed, or a weak ETag
+    VersionConflict if the header is an ETag other than the current one
+    """
+    header = request.headers.get("If-Match", "*").strip()
+    if header == "*":
+        return None
+    etags = parse_etags(header)
+    if not etags:
+        raise ParseError("If-Match should be the ETag or the version of the item.")
+    # Never equal to the ETag, which is strong, so rather than a conflict, e.g. if a
+    # proxy compressing the JSON made the ETag weak.
+    if any(tag.startswith("W/") for tag in etags):
+        raise ParseError(
+            "If-Match can't be a weak ETag (W/...), send the version of the item "
+            'instead, e.g. If-Match: "3".'
+        )
+    if etag is not None and etag in etags:
+        # Still as the client saw it, so it must not change before the save.
+        return item.version
+    for tag in etags:
+        try:
+            return int(tag.strip('"'))
+        except ValueError:
+            pass
+    raise VersionConflict
+
+
+def save_if_match(request, serializer, etag=None):
+    """
+    Save the changes to an item (or case) in a request, unless the item has changed
+    since the version in the If-Match header of the request (see
+    get_expected_version).
+
+    Params
+    ======
+    request: request with the changes
+    serializer: valid serializer of the item, with the changes
+    etag: the current ETag of the item's JSON, if its view sends one
+
+    Returns
+    =======
+    None if saved, or else the response to send: 412 if the item has changed, or
+    400 (with JSON, as from DRF) if the header is malformed
+    """
+    try:
+        expected_version = get_expected_version(request, serializer.instance, etag)
+        serializer.save(expected_version=expected_version)
+    except VersionConflict:
+        return HttpResponse(status=412)
+    except ParseError as e:
+        return JsonResponse({"detail": e.detail}, status=e.status_code)
+    return None
+
+
+def get_case_etag(case, *extra):
+    """
+    ETag for JSON that depends only on the given case and its items, and on the
+    values in `extra`, e.g. the permissions of the user on the case.
+
+    Params
+    ======
+    case: AssuranceCase instance
+    extra: any other values the JSON depends on
+
+    Returns
+    =======
+    str: quoted ETag, changing whenever the version of the case does
+    """
+    return quote_etag("-".join(str(part) for part in (case.pk, case.version) + extra))
+
+
+def get_not_modified_response(request, case, etag):
+    """
+    Check the If-None-Match and If-Modified-Since headers of a request for JSON
+    about a case, without looking at any of the items of the case.
+
+    Returns
+    =======
+    HttpResponse with status 304 if the client's cached copy is up to date, None
+    otherwise.
+    """
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(case.updated_date.timestamp())
+    )
+    if response is not None:
+        set_case_cache_headers(response, case, etag)
+    return response
+
+
+def set_case_cache_headers(response, case, etag):
+    """Add the ETag and Last-Modified headers for JSON about a case to a response."""
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(case.updated_date.timestamp())
+    # Browsers may keep the JSON, but must check with us that it's current before
+    # using it.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def save_json_tree(data, obj_type):
+    """Write a new assurance case tree.
+
+    Create a new assurance case like the one described by data, including all
+    its items. The whole tree is validated before anything is written, and then
+    written with a bulk insert per item type, in a single transaction, so that an
+    invalid tree doesn't leave a half-written case behind.
+
+    Params
+    ======
+    data: JSON for the assurance case and all its items.
+    obj_type: Key of the json object (also a key of 'TYPE_DICT'). This should be
+        "assurance_case".
+
+    Returns
+    =======
+    objs: JsonResponse describing failure/success. On failure, maps the path to
+        every invalid item in data (e.g. "assurance_case.goals[0]") to its errors.
+    """
+    items, errors = _validate_json_tree(data, obj_type)
+    if errors:
+        return JsonResponse(errors, status=400)
+    with transaction.atomic():
+        _bulk_create_json_tree(items)
+    _, case, _ = items[0]
+    summary = {"name": case.name, "id": case.id}
+    return JsonResponse(summary, status=201)
+
+
+def _validate_json_tree(data, obj_type):
+    """
+    Validate every item in a JSON tree with its serializer, without looking up the
+    parents of the items, which don't exist yet.
+
+    Returns
+    =======
+    items: list of (model, obj, parent) for every item in the tree, parents before
+        their children, where obj is an unsaved model instance, and parent the obj
+        of the parent item (None at the top level).
+    errors: dict mapping the path to each invalid item in data to its errors.
+    """
+    items = []
+    errors = {}
+    # Walk the tree with a stack rather than recursion, since PropertyClaims can be
+    # nested arbitrarily deep.
+    stack = [(data, obj_type, obj_type, None)]
+    while stack:
+        item_data, item_type, path, parent = stack.pop()
+        if not isinstance(item_data, dict):
+            errors[path] = {"non_field_errors": ["Expected an object."]}
+            continue
+        obj, item_errors = _validate_json_item(item_data, item_type)
+        if item_errors:
+            errors[path] = item_errors
+            continue
+        items.append((TYPE_DICT[item_type]["model"], obj, parent))
+        for child_type in reversed(TYPE_DICT[item_type]["children"]):
+            children = item_data.get(child_type, [])
+            if not isinstance(children, list):
+                errors[f"{path}.{child_type}"] = {
+                    "non_field_errors": ["Expected a list."]
+                }
+                continue
+            for i in reversed(range(len(children))):
+                child_path = f"{path}.{child_type}[{i}]"
+                stack.append((children[i], child_type, child_path, obj))
+    return items, errors
+
+
+def _validate_json_item(item_data, item_type):
+    """
+    Validate the fields of an item of a JSON tree with its serializer, without
+    its parents.
+
+    Returns
+    =======
+    obj: unsaved model instance, None if the item is invalid
+    errors: the errors of the serializer, empty if the item is valid
+    """
+    fields = TYPE_DICT[item_type]["fields"]
+    serializer = TYPE_DICT[item_type]["serializer"](
+        data={k: item_data[k] for k in fields if k in item_data}
+    )
+    for parent_type, _ in TYPE_DICT[item_type].get("parent_types", []):
+        del serializer.fields[parent_type + "_id"]
+    if not serializer.is_valid():
+        return None, serializer.errors
+    return TYPE_DICT[item_type]["model"](**serializer.validated_data), {}
+
+
+def save_json_stream(stream, obj_type, extra_fields):
+    """Write a new assurance case tree, as it's read from a stream.
+
+    Like save_json_tree, but the JSON is parsed one token at a time, and the items
+    are written with bulk inserts IMPORT_BATCH_SIZE at a time, so that only a
+    batch of items and their parents are held in memory, however large the tree.
+    The whole import is a single transaction, rolled back if any item is invalid.
+
+    Every item is validated and written as soon as its fields have been read, at
+    the start of its first list of children, so its fields must come before them
+    (as in the JSON returned by case_detail).
+
+    Params
+    ======
+    stream: file-like object, or request, to read the JSON from
+    obj_type: key of the top-level json object, "assurance_case"
+    extra_fields: dict of fields to set on the top-level item, e.g. its owner
+
+    Returns
+    =======
+    objs: JsonResponse describing failure/success, as for save_json_tree.
+    """
+    reader = _JsonTreeStreamReader(obj_type, extra_fields)
+    with transaction.atomic():
+        try:
+            for _, event, value in ijson.parse(stream, use_float=True):
+                reader.feed(event, value)
+        except ijson.JSONError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+        reader.flush()
+        if reader.errors:
+            transaction.set_rollback(True)
+            return JsonResponse(reader.errors, status=400)
+    summary = {"name": reader.root.name, "id": reader.root.id}
+    return JsonResponse(summary, status=201)
+
+
+class _JsonTreeStreamReader:
+    """
+    Builds the items of a JSON tree from the events of an ijson parser, for
+    save_json_stream.
+
+    The stack holds a frame for each JSON container the parser is in, as a dict
+    with the "kind" of the container:
+    * "item": an item of the tree, with its "type", "path", the "fields" read so
+      far, the "key" being read, its parent's frame, and its "obj" once written
+    * "list": a list of children, with their "type", the frame of their parent,
+      and the number of children read so far
+    * "skip": any other container, skipped
+    """
+
+    def __init__(self, obj_type, extra_fields):
+        self.obj_type = obj_type
+        self.extra_fields = extra_fields
+        self.stack = []
+        self.items = []
+        self.errors = {}
+        self.root = None
+
+    def feed(self, event, value):
+        frame = self.stack[-1] if self.stack else None
+        if frame is None:
+            if event == "start_map":
+                self._push_item(self.obj_type, self.obj_type, None)
+            else:
+                self.errors[self.obj_type] = {
+                    "non_field_errors": ["Expected an object."]
+                }
+                self._skip(event)
+        elif frame["kind"] == "skip":
+            if event in ("start_map", "start_array"):
+                frame["depth"] += 1
+            elif event in ("end_map", "end_array"):
+                frame["depth"] -= 1
+                if frame["depth"] == 0:
+                    self.stack.pop()
+        elif frame["kind"] == "list":
+            if event == "end_array":
+                self.stack.pop()
+                return
+            path = f"{frame['parent']['path']}.{frame['type']}[{frame['count']}]"
+            frame["count"] += 1
+            if event == "start_map":
+                self._push_item(frame["type"], path, frame["parent"])
+            else:
+                self.errors[path] = {"non_field_errors": ["Expected an object."]}
+                self._skip(event)
+        elif event == "map_key":
+            frame["key"] = value
+        elif event == "end_map":
+            self._write(frame)
+            self.stack.pop()
+        else:
+            self._read_value(frame, event, value)
+
+    def _read_value(self, frame, event, value):
+        key = frame["key"]
+        if key in TYPE_DICT[frame["type"]]["children"]:
+            if event == "start_array":
+                self._write(frame)
+                self.stack.append(
+                    {"kind": "list", "type": key, "parent": frame, "count": 0}
+                )
+                return
+            self.errors[f"{frame['path']}.{key}"] = {
+                "non_field_errors": ["Expected a list."]
+            }
+        elif frame["parent"] is None and key in self.extra_fields:
+            pass
+        elif key in TYPE_DICT[frame["type"]]["fields"]:
+            if frame["written"]:
+                self.errors[frame["path"]] = {
+                    key: ["Fields must come before the lists of children."]
+                }
+            elif event == "start_map":
+                frame["fields"][key] = {}
+            elif event == "start_array":
+                frame["fields"][key] = []
+            else:
+                frame["fields"][key] = value
+        self._skip(event)
+
+    def _skip(self, event):
+        if event in ("start_map", "start_array"):
+            self.stack.append({"kind": "skip", "depth": 1})
+
+    def _push_item(self, obj_type, path, parent):
+        self.stack.append(
+            {
+                "kind": "item",
+                "type": obj_type,
+                "path": path,
+                "fields": {},
+                "key": None,
+                "parent": parent,
+                "obj": None,
+                "written": False,
+            }
+        )
+
+    def _write(self, frame):
+        """Validate an item, and queue it to be inserted, if it hasn't been yet."""
+        if frame["written"]:
+            return
+        frame["written"] = True
+        if frame["parent"] is None:
+            frame["fields"].update(self.extra_fields)
+        obj, errors = _validate_json_item(frame["fields"], frame["type"])
+        frame["fields"] = None
+        if errors:
+            self.errors[frame["path"]] = errors
+            return
+        frame["obj"] = obj
+        if frame["parent"] is None:
+            self.root = obj
+        if self.errors:
+            # Nothing more will be written, just look for more errors.
+            return
+        model = TYPE_DICT[frame["type"]]["model"]
+        self.items.append((model, obj, frame["parent"] and frame["parent"]["obj"]))
+        if len(self.items) >= IMPORT_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Insert the items queued so far, unless any item was invalid."""
+        if not self.errors:
+            _bulk_create_json_tree(self.items)
+        self.items = []
+
+
+def _bulk_create_json_tree(items):
+    """
+    Insert the validated items of a tree, as returned by _validate_json_tree, with
+    a bulk insert per item type (and per level of PropertyClaims), and link them
+    to their parents.
+    """
+    by_model = defaultdict(list)
+    for model, obj, parent in items:
+        by_model[model].append((obj, parent))
+    for case, _ in by_model[AssuranceCase]:
+        case.save()
+    for goal, case in by_model[TopLevelNormativeGoal]:
+        goal.assurance_case = case
+    _bulk_insert(TopLevelNormativeGoal, by_model[TopLevelNormativeGoal])
+    for model in (Context, SystemDescription):
+        for obj, goal in by_model[model]:
+            obj.goal = goal
+            obj.assurance_case_id = goal.assurance_case_id
+        _bulk_insert(model, by_model[model])
+    # Each level of PropertyClaims needs the ids of the level above.
+    claims = by_model[PropertyClaim]
+    while claims:
+        this_level = []
+        for claim, parent in claims:
+            if isinstance(parent, TopLevelNormativeGoal):
+                claim.goal = parent
+                claim.level = 1
+            elif parent.pk is not None:
+                claim.property_claim = parent
+                claim.level = parent.level + 1
+            else:
+                continue
+            claim.assurance_case_id = parent.assurance_case_id
+            this_level.append((claim, parent))
+        _bulk_insert(PropertyClaim, this_level)
+        claims = [(claim, parent) for claim, parent in claims if claim.pk is None]
+    for model, parent_field in (
+        (EvidentialClaim, EvidentialClaim.property_claim.field),
+        (Evidence, Evidence.evidential_claim.field),
+    ):
+        for obj, parent in by_model[model]:
+            obj.assurance_case_id = parent.assurance_case_id
+        _bulk_insert(model, by_model[model])
+        through = parent_field.remote_field.through
+        through.objects.bulk_create(
+            through(
+                **{
+                    parent_field.m2m_field_name(): obj,
+                    parent_field.m2m_reverse_field_name(): parent,
+                }
+            )
+            for obj, parent in by_model[model]
+        )
+
+
+def _bulk_insert(model, items):
+    """
+    bulk_create the objs of some (obj, parent) pairs, making sure the objs get
+    their ids, even on databases that don't return the ids of bulk inserted rows.
+    """
+    objs = [obj for obj, _ in items]
+    model.objects.bulk_create(objs)
+    if objs and objs[0].pk is None:
+        # SQLite doesn't (with Django 3.2), but it locks the whole database for
+        # writing until the end of the transaction, so the rows we just inserted
+        # are the ones with the highest ids, in order.
+        count = len(objs)
+        ids = model.objects.order_by("-id").values_list("id", flat=True)[:count]
+        for obj, pk in zip(objs, reversed(ids)):
+            obj.pk = pk
+
+
+def clone_case(case, owner):
+    """
+    Copy a case and all its items, with a bulk insert per item type (and per level
+    of PropertyClaims), in a single transaction. Items with several parents in the
+    case, EvidentialClaims and Evidence, are copied once and linked to the copies of
+    all their parents, as in the original.
+
+    Params
+    ======
+    case: AssuranceCase to copy
+    owner: EAPUser to own the copy, or None
+
+    Returns
+    =======
+    AssuranceCase, the copy
+    """
+    with transaction.atomic():
+        new_case = AssuranceCase.objects.create(
+            name=case.name, description=case.description, owner=owner
+        )
+        case_map = {case.pk: new_case.pk}
+        goal_map = _clone_items(case.goals.all(), {"assurance_case_id": case_map})
+        for model in (Context, SystemDescription):
+            _clone_items(
+                model.objects.filter(assurance_case_id=case.pk),
+                {"assurance_case_id": case_map, "goal_id": goal_map},
+            )
+        # Each level of claims is copied after the one above it, for the ids of
+        # the copies of their parents. The levels are found from the parents of
+        # the claims, since the stored levels of older claims may be wrong, and
+        # the copies get the right ones.
+        claims = PropertyClaim.objects.filter(assurance_case_id=case.pk)
+        ids_by_level = defaultdict(list)
+        for claim_id, level in claims.depths().items():
+            ids_by_level[level].append(claim_id)
+        claim_map = {}
+        for level in sorted(ids_by_level):
+            claim_map.update(
+                _clone_items(
+                    claims.filter(id__in=ids_by_level[level]),
+                    {
+                        "assurance_case_id": case_map,
+                        "goal_id": goal_map,
+                        "property_claim_id": claim_map,
+                    },
+                    level=level,
+                )
+            )
+        # Only the links to parents in the case are copied.
+        evidential_claim_links = EvidentialClaim.property_claim.through.objects.filter(
+            propertyclaim__assurance_case_id=case.pk
+        )
+        evidence_links = Evidence.evidential_claim.through.objects.filter(
+            evidentialclaim_id__in=evidential_claim_links.values("evidentialclaim_id")
+        )
+        evidential_claim_map = _clone_links(
+            evidential_claim_links,
+            EvidentialClaim.property_claim.field,
+            claim_map,
+            new_case,
+        )
+        _clone_links(
+            evidence_links,
+            Evidence.evidential_claim.field,
+            evidential_claim_map,
+            new_case,
+        )
+    return new_case
+
+
+def _clone_links(links, m2m_field, parent_map, new_case):
+    """
+    Copy the children linked to their parents by the given rows of the through
+    table of a ManyToManyField, once each, and link the copies to the copies of
+    their parents.
+
+    Params
+    ======
+    links: queryset of rows of the through table of m2m_field
+    m2m_field: ManyToManyField from the children to their parents
+    parent_map: dict mapping the ids of the parents to the ids of their copies
+    new_case: AssuranceCase, the copy the children are in
+
+    Returns
+    =======
+    dict mapping the ids of the children to the ids of their copies
+    """
+    through = m2m_field.remote_field.through
+    child_field = m2m_field.m2m_field_name() + "_id"
+    parent_field = m2m_field.m2m_reverse_field_name() + "_id"
+    child_map = _clone_items(
+        m2m_field.model.objects.filter(pk__in=links.values(child_field)),
+        {},
+        assurance_case_id=new_case.pk,
+    )
+    through.objects.bulk_create(
+        through(
+            **{
+                child_field: child_map[child_id],
+                parent_field: parent_map[parent_id],
+            }
+        )
+        for child_id, parent_id in links.values_list(child_field, parent_field)
+    )
+    return child_map
+
+
+def _clone_items(items, id_maps, **values):
+    """
+    Bulk insert copies of a queryset of items.
+
+    Params
+    ======
+    items: queryset of the items to copy
+    id_maps: dict mapping the names of foreign key fields (e.g. "goal_id") to dicts
+        mapping the ids of the original parents to the ids of their copies
+    values: values of fields to set on every copy
+
+    Returns
+    =======
+    dict mapping the ids of the items to the ids of their copies
+    """
+    objs = list(items.order_by("id"))
+    old_ids = [obj.pk for obj in objs]
+    for obj in objs:
+        obj.pk = None
+        obj._state.adding = True
+        obj.version = 1
+        for field, id_map in id_maps.items():
+            parent_id = getattr(obj, field)
+            if parent_id is not None:
+                setattr(obj, field, id_map[parent_id])
+        for field, value in values.items():
+            setattr(obj, field, value)
+    _bulk_insert(items.model, [(obj, None) for obj in objs])
+    return dict(zip(old_ids, [obj.pk for obj in objs]))
+
+
+def delete_case(case_id):
+    """
+    Delete a case and all its items, with a DELETE statement per table, rather than
+    Django's cascade, which loads every item (and sends signals for it) first.
+
+    Items shared with other cases which still have parents in those cases are kept,
+    and moved to the case of the first of those parents (see _move_shared_items).
+    Every other item of the case is deleted, and the items of other cases are
+    unlinked from it, which is logged as an update of those items in their cases.
+    No signals are sent for the deleted items.
+
+    Params
+    ======
+    case_id: id of the AssuranceCase, which may be hidden
+    """
+    with transaction.atomic():
+        moved = _move_shared_items(case_id)
+        moved_items = {(item_type, pk) for _, item_type, pk, _ in moved}
+        unlinked = [
+            change
+            for change in _unlinked_items(case_id)
+            if change[1:3] not in moved_items
+        ]
+        # Children before their parents. Nested PropertyClaims go in a single
+        # statement, since foreign keys are only checked at the end of the
+        # transaction.
+        statements = [
+            _links_in_case(Evidence._meta.get_field("evidential_claim"), case_id),
+            _links_in_case(EvidentialClaim._meta.get_field("property_claim"), case_id),
+        ]
+        for model in (
+            Evidence,
+            EvidentialClaim,
+            PropertyClaim,
+            Context,
+            SystemDescription,
+            TopLevelNormativeGoal,
+            CaseChange,
+            CaseLock,
+        ):
+            statements.append((model._meta.db_table, "assurance_case_id = %s", case_id))
+        for name in ("edit_groups", "view_groups"):
+            field = AssuranceCase._meta.get_field(name)
+            statements.append(
+                (
+                    field.remote_field.through._meta.db_table,
+                    f"{field.m2m_column_name()} = %s",
+                    case_id,
+                )
+            )
+        statements.append((AssuranceCase._meta.db_table, "id = %s", case_id))
+        # Through the cursor, since QuerySet.delete() would load the rows of most of
+        # these tables, and send signals for them, before deleting them.
+        with connection.cursor() as cursor:
+            for table, where, param in statements:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE {where}", [param] * where.count("%s")
+                )
+        record_case_changes(moved + unlinked)
+    invalidate_case_trees([case_id])
+
+
+def _links_in_case(field, case_id):
+    """
+    For delete_case, the table of an m2m field between items, the condition of a
+    DELETE of its links with either side in a case, and its parameter.
+    """
+    sides = []
+    for column, model in (
+        (field.m2m_column_name(), field.model),
+        (field.m2m_reverse_name(), field.related_model),
+    ):
+        sides.append(
+            f"{column} IN (SELECT id FROM {model._meta.db_table} "
+            "WHERE assurance_case_id = %s)"
+        )
+    return field.remote_field.through._meta.db_table, " OR ".join(sides), case_id
+
+
+def _unlinked_items(case_id):
+    """
+    For delete_case, the changes to log for the items of other cases which lose
+    parents in a case: the EvidentialClaims under its PropertyClaims, and the
+    Evidence under its EvidentialClaims.
+
+    Params
+    ======
+    case_id: id of the AssuranceCase being deleted
+
+    Returns
+    =======
+    list of the changes to the other cases, as taken by record_case_changes
+    """
+    changes = []
+    for model, parents_field in (
+        (EvidentialClaim, "property_claim"),
+        (Evidence, "evidential_claim"),
+    ):
+        field = model._meta.get_field(parents_field)
+        child = field.m2m_field_name()
+        links = (
+            field.remote_field.through.objects.filter(
+                **{f"{field.m2m_reverse_field_name()}__assurance_case_id": case_id}
+            )
+            .exclude(**{f"{child}__assurance_case_id": case_id})
+            .values_list(child, f"{child}__assurance_case")
+            .distinct()
+        )
+        item_type = ITEM_TYPE_NAMES[model]
+        for pk, other_case_id in links:
+            changes.append((other_case_id, item_type, pk, CaseChange.Action.UPDATED))
+    return changes
+
+
+def _move_shared_items(case_id):
+    """
+    For delete_case, move the EvidentialClaims and Evidence of a case which also
+    have parents in other cases to the case of the first of those parents (the one
+    with the lowest id), which is the case they would be in had they been linked to
+    it first.
+
+    Params
+    ======
+    case_id: id of the AssuranceCase being deleted
+
+    Returns
+    =======
+    list of the changes to the other cases, as taken by record_case_changes
+    """
+    changes = []
+    # EvidentialClaims first, since they are the parents of Evidence.
+    for model, parents_field in (
+        (EvidentialClaim, "property_claim"),
+        (Evidence, "evidential_claim"),
+    ):
+        field = model._meta.get_field(parents_field)
+        parent = field.m2m_reverse_field_name()
+        other_links = field.remote_field.through.objects.filter(
+            **{field.m2m_field_name(): OuterRef("pk")}
+        ).exclude(**{f"{parent}__assurance_case_id": case_id})
+        first_case = other_links.order_by(parent).values(f"{parent}__assurance_case")
+        shared = model.objects.filter(Exists(other_links), assurance_case_id=case_id)
+        item_type = ITEM_TYPE_NAMES[model]
+        for pk, new_case_id in shared.annotate(
+            new_case_id=Subquery(first_case[:1])
+        ).values_list("pk", "new_case_id"):
+            # Logged as created in their new case, as when moved by a save.
+            changes.append((new_case_id, item_type, pk, CaseChange.Action.CREATED))
+        shared.update(assurance_case_id=Subquery(first_case[:1]))
+    return changes
+
+
+def delete_case_later(case):
+    """
+    Hide a case straight away, and delete it with delete_case in a background
+    thread, once the current transaction is committed. Cases left hidden, e.g. by a
+    restart of the server, are deleted by the purge_deleted_cases command.
+
+    Params
+    ======
+    case: AssuranceCase instance
+    """
+    AssuranceCase.all_objects.filter(pk=case.pk).update(deleted_date=timezone.now())
+    invalidate_case_trees([case.pk])
+    thread = threading.Thread(target=_delete_case_in_thread, args=[case.pk])
+    transaction.on_commit(thread.start)
+
+
+def _delete_case_in_thread(case_id):
+    try:
+        delete_case(case_id)
+    finally:
+        # The connections of this thread.
+        connections.close_all()
+
+
+# Header of the requests of an editor, with the lock_uuid of the edit lock it holds.
+CASE_LOCK_HEADER = "X-Case-Lock"
+
+
+def acquire_case_lock(case, lock_uuid, user, force=False):
+    """
+    Take the edit lock on a case for CASE_LOCK_TTL seconds, unless another editor
+    holds it. Taking a lock already held by lock_uuid renews it.
+
+    Params
+    ======
+    case: AssuranceCase instance
+    lock_uuid: id of the editor, e.g. of a browser tab
+    user: EAPUser taking the lock, or None
+    force: whether to take the lock even if another editor holds it
+
+    Returns
+    =======
+    (CaseLock, bool): the lock on the case, and whether it is held by lock_uuid
+    """
+    now = timezone.now()
+    expires_date = now + timedelta(seconds=settings.CASE_LOCK_TTL)
+    leases = CaseLock.objects.filter(assurance_case=case)
+    if not force:
+        leases = leases.filter(Q(lock_uuid=lock_uuid) | Q(expires_date__lte=now))
+    with transaction.atomic():
+        # A conditional UPDATE, or an INSERT, so that two editors can't both take
+        # the lock.
+        acquired = bool(
+            leases.update(lock_uuid=lock_uuid, user=user, expires_date=expires_date)
+        )
+        if not acquired:
+            try:
+                with transaction.atomic():
+                    CaseLock.objects.create(
+                        assurance_case=case,
+                        lock_uuid=lock_uuid,
+                        user=user,
+                        expires_date=expires_date,
+                    )
+                acquired = True
+            except IntegrityError:
+                # Held by another editor.
+                pass
+        lease = CaseLock.objects.get(assurance_case=case)
+        if acquired:
+            _set_case_lock_uuid(case, lock_uuid)
+    return lease, acquired
+
+
+def renew_case_lock(case, lock_uuid):
+    """
+    Extend the edit lock held by lock_uuid on a case, to CASE_LOCK_TTL seconds from
+    now.
+
+    Returns
+    =======
+    datetime when the lock now expires, or None if lock_uuid doesn't hold the lock
+    """
+    expires_date = timezone.now() + timedelta(seconds=settings.CASE_LOCK_TTL)
+    leases = CaseLock.objects.filter(assurance_case=case, lock_uuid=lock_uuid)
+    if leases.update(expires_date=expires_date):
+        return expires_date
+    return None
+
+
+def release_case_lock(case, lock_uuid, expired_before=None):
+    """
+    Release the edit lock held by lock_uuid on a case, if it does hold it.
+
+    Params
+    ======
+    case: AssuranceCase instance
+    lock_uuid: id of the editor holding the lock
+    expired_before: if given, only release the lock if it expired by then
+
+    Returns
+    =======
+    bool, whether the lock was released
+    """
+    leases = CaseLock.objects.filter(assurance_case=case, lock_uuid=lock_uuid)
+    if expired_before is not None:
+        leases = leases.filter(expires_date__lte=expired_before)
+    with transaction.atomic():
+        released = bool(leases.delete()[0])
+        if released:
+            _set_case_lock_uuid(case, None)
+    return released
+
+
+def expire_case_locks():
+    """
+    Release every expired edit lock, so that clients stop showing their cases as
+    being edited. Also clears the lock_uuid of the cases without an unexpired lock,
+    e.g. those locked before CaseLock existed.
+
+    Returns
+    =======
+    int, the number of locks released
+    """
+    now = timezone.now()
+    expired = CaseLock.objects.filter(expires_date__lte=now)
+    released = sum(
+        release_case_lock(lease.assurance_case, lease.lock_uuid, expired_before=now)
+        for lease in expired.select_related("assurance_case")
+    )
+    unexpired = CaseLock.objects.filter(
+        assurance_case=OuterRef("pk"), expires_date__gt=now
+    )
+    stale = AssuranceCase.objects.filter(lock_uuid__isnull=False).exclude(
+        Exists(unexpired)
+    )
+    for case_id in stale.values_list("pk", flat=True):
+        with transaction.atomic():
+            # Unless locked in the meantime.
+            case = stale.select_for_update().filter(pk=case_id).first()
+            if case is not None:
+                _set_case_lock_uuid(case, None)
+                released += 1
+    return released
+
+
+def _set_case_lock_uuid(case, lock_uuid):
+    # Saved only when it changes, since each save bumps the version of the case
+    # (and publishes a "lock" event, see signals.py).
+    if case.lock_uuid != lock_uuid:
+        case.lock_uuid = lock_uuid
+        case.save(update_fields=["lock_uuid"])
+
+
+def is_case_locked(request, *case_ids):
+    """
+    See if any of some cases is being edited by someone other than the sender of
+    the request, i.e. has an edit lock that hasn't expired, other than the one in
+    the X-Case-Lock header of the request. A single query, on the primary key of
+    CaseLock.
+
+    Params
+    ======
+    request: the request making changes to the cases
+    case_ids: ids of AssuranceCases, or None for items not in a case
+
+    Returns
+    =======
+    bool
+    """
+    case_ids = {case_id for case_id in case_ids if case_id is not None}
+    if not case_ids:
+        return False
+    leases = CaseLock.objects.filter(
+        assurance_case_id__in=case_ids, expires_date__gt=timezone.now()
+    )
+    lock_uuid = request.headers.get(CASE_LOCK_HEADER)
+    if lock_uuid:
+        leases = leases.exclude(lock_uuid=lock_uuid)
+    return leases.exists()
+
+
+def get_case_ids(validated_data):
+    """
+    Find the cases of the items (and cases) that the validated data of a serializer
+    links to, e.g. the cases of the new parents of an item.
+
+    Returns
+    =======
+    set of ids of AssuranceCases
+    """
+    case_ids = set()
+    for value in validated_data.values():
+        for obj in value if isinstance(value, list) else [value]:
+            if isinstance(obj, AssuranceCase):
+                case_ids.add(obj.pk)
+            elif isinstance(obj, CaseItem):
+                case_ids.add(obj.assurance_case_id)
+    return case_ids
+
+
+def run_batch(request, operations):
+    """
+    Make, change or delete several items (or change cases) in a single transaction,
+    in order, stopping at the first operation that fails, in which case nothing is
+    saved. The permissions and the edit lock of each case are checked once.
+
+    Params
+    ======
+    request: the request of the batch, whose user must be allowed to edit the cases
+    operations: list of dicts, each with a `method` ("POST", "PUT" or "DELETE"), a
+        `type` (a key of TYPE_DICT), the `id` of the item for PUT and DELETE, its
+        `data` for POST and PUT, and optionally, for PUT, the `version` it was
+        changed from (as in an If-Match header)
+
+    Returns
+    =======
+    (int, list): HTTP status of the batch (that of the operation that failed, if
+    any), and the results of the operations run, each a dict with a `status` and
+    the `data` that the same request to the item's own view would have got
+    """
+    case_statuses = {}
+
+    def check_cases(case_ids):
+        for case_id in case_ids:
+            if case_id is None:
+                continue
+            if case_id not in case_statuses:
+                case = AssuranceCase.objects.filter(pk=case_id).first()
+                status = None
+                if case is None:
+                    # Hidden while being deleted, or gone since.
+                    status = 404
+                elif get_case_permissions(case, request.user) not in ["manage", "edit"]:
+                    status = 403
+                elif is_case_locked(request, case_id):
+                    status = 423
+                case_statuses[case_id] = status
+            if case_statuses[case_id] is not None:
+                return case_statuses[case_id]
+        return None
+
+    results = []
+    with transaction.atomic():
+        for operation in operations:
+            status, data = _run_operation(operation, check_cases)
+            results.append({"status": status, "data": data})
+            if status >= 400:
+                transaction.set_rollback(True)
+                return status, results
+    return 200, results
+
+
+def _run_operation(operation, check_cases):
+    """Run an operation of a batch, see run_batch. Returns (status, data)."""
+    if not isinstance(operation, dict):
+        return 400, {"non_field_errors": ["Operations should be objects."]}
+    method = operation.get("method")
+    item_type = operation.get("type")
+    if item_type not in TYPE_DICT:
+        return 400, {"type": [f"Unknown type {item_type}."]}
+    model = TYPE_DICT[item_type]["model"]
+    # Cases are made and deleted by their own views.
+    allowed = ("PUT",) if model is AssuranceCase else ("POST", "PUT", "DELETE")
+    if method not in allowed:
+        return 405, {"method": [f"Should be one of {', '.join(allowed)}."]}
+    data = operation.get("data", {})
+    if method != "DELETE" and not isinstance(data, dict):
+        return 400, {"data": ["Should be an object."]}
+    serializer_class = TYPE_DICT[item_type]["serializer"]
+    obj = None
+    if method in ("PUT", "DELETE"):
+        try:
+            obj = model.objects.get(pk=operation.get("id"))
+        except (model.DoesNotExist, ValueError, TypeError):
+            return 404, None
+        case_id = obj.pk if model is AssuranceCase else obj.assurance_case_id
+    if method == "DELETE":
+        status = check_cases([case_id])
+        if status is not None:
+            return status, None
+        obj.delete()
+        return 204, None
+    if obj is None:
+        serializer = serializer_class(data=data)
+    else:
+        serializer = serializer_class(obj, data=data, partial=True)
+    if not serializer.is_valid():
+        return 400, serializer.errors
+    case_ids = get_case_ids(serializer.validated_data)
+    if obj is not None:
+        case_ids.add(case_id)
+    status = check_cases(case_ids)
+    if status is not None:
+        return status, None
+    save_kwargs = {}
+    if obj is not None:
+        save_kwargs["expected_version"] = operation.get("version")
+        if not isinstance(save_kwargs["expected_version"], (int, type(None))):
+            return 400, {"version": ["Should be an integer."]}
+    try:
+        obj = serializer.save(**save_kwargs)
+    except VersionConflict:
+        return 412, None
+    data = serializer.data
+    if model is not AssuranceCase:
+        data["shape"] = obj.shape.name
+    return 201 if method == "POST" else 200, data
 
 
 def get_case_permissions(case, user):
@@ -234,32 +1764,55 @@ def get_case_permissions(case, user):
        "view": if user is a member of a group that has view rights on the case
     None otherwise.
     """
-    if (not case.owner) or (case.owner == user):
+    if (not case.owner_id) or (case.owner_id == user.id):
         # case has no owner - anyone can view it, or user is owner
         return "manage"
+    # now check groups, in the database
+    cases = AssuranceCase.objects.filter(pk=case.pk)
+    cases = cases.annotate(permissions=case_permissions_expression(user))
+    return cases.values_list("permissions", flat=True).first()
 
-    # now check groups
-    try:
-        user_groups = user.all_groups.get_queryset()
-        edit_groups = case.edit_groups.get_queryset()
-        # check intersection of two lists
-        if set(edit_groups) & set(user_groups):
-            return "edit"
-        view_groups = case.view_groups.get_queryset()
-        if set(view_groups) & set(user_groups):
-            return "view"
-    except EAPGroup.DoesNotExist:
-        # no group found for user or for case
-        pass
-    except AttributeError:
-        # probably AnonymousUser
-        pass
-    return None
+
+def case_permissions_expression(user):
+    """
+    SQL expression for the permissions of the user on an AssuranceCase, to be used
+    in an annotation of a queryset of AssuranceCases. See get_case_permissions for
+    the possible values.
+
+    Parameters:
+    ===========
+    user: EAPUser instance, as returned by request.user
+
+    Returns:
+    ========
+    django.db.models.Case expression
+    """
+    if not user.is_authenticated:
+        # AnonymousUser, only allowed on cases with no owner.
+        return Case(
+            When(owner__isnull=True, then=Value("manage")),
+            default=None,
+            output_field=CharField(),
+        )
+    user_groups = EAPGroup.objects.filter(member=user)
+    return Case(
+        When(Q(owner__isnull=True) | Q(owner=user), then=Value("manage")),
+        When(
+            Exists(user_groups.filter(editable_cases=OuterRef("pk"))),
+            then=Value("edit"),
+        ),
+        When(
+            Exists(user_groups.filter(viewable_cases=OuterRef("pk"))),
+            then=Value("view"),
+        ),
+        default=None,
+        output_field=CharField(),
+    )
 
 
 def get_allowed_cases(user):
     """
-    get a list of AssuranceCases that the user is allowed to view or edit.
+    get the AssuranceCases that the user is allowed to view or edit.
 
     Parameters:
     ===========
@@ -267,12 +1820,14 @@ def get_allowed_cases(user):
 
     Returns:
     ========
-    list of AssuranceCase instances.
+    queryset of AssuranceCase instances, each with a `permissions` attribute as
+    returned by get_case_permissions.
     """
-    all_cases = AssuranceCase.objects.all()
-    # if get_case_permissions returns anything other than None, include in allowed_cases
-    allowed_cases = [case for case in all_cases if get_case_permissions(case, user)]
-    return allowed_cases
+    cases = AssuranceCase.objects.annotate(
+        permissions=case_permissions_expression(user)
+    )
+    # only include cases where the user has any permissions
+    return cases.filter(permissions__isnull=False).order_by("id")
 
 
 def can_view_group(group, user, level="member"):
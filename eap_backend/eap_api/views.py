@@ -1,4 +1,6 @@
-from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.parsers import JSONParser
 from rest_framework.decorators import api_view
@@ -13,6 +15,9 @@ from .models import (
     EvidentialClaim,
     Evidence,
 )
+from .events import publish_case_event
+from .metrics import render_metrics
+from .pool import render_pool_metrics
 from .serializers import (
     EAPUserSerializer,
     EAPGroupSerializer,
@@ -27,12 +32,34 @@ from .serializers import (
 from .view_utils import (
     filter_by_case_id,
     make_summary,
-    get_json_tree,
+    paginate,
+    set_next_page_headers,
+    get_goal_trees,
+    get_case_tree,
+    spool_case_tree,
+    get_case_cache_stats,
+    get_case_changes,
+    get_claim_ancestors,
     save_json_tree,
+    save_json_stream,
+    clone_case,
+    delete_case,
+    delete_case_later,
     get_case_permissions,
     get_allowed_cases,
     can_view_group,
     get_allowed_groups,
+    get_case_etag,
+    save_if_match,
+    is_case_locked,
+    get_case_ids,
+    acquire_case_lock,
+    renew_case_lock,
+    release_case_lock,
+    run_batch,
+    MAX_BATCH_SIZE,
+    get_not_modified_response,
+    set_case_cache_headers,
     TYPE_DICT,
 )
 
@@ -43,9 +70,10 @@ def user_list(request):
     List all users, or make a new user
     """
     if request.method == "GET":
-        users = EAPUser.objects.all()
+        users, next_cursor = paginate(EAPUser.objects.all(), request)
         serializer = EAPUserSerializer(users, many=True)
-        return JsonResponse(serializer.data, safe=False)
+        response = JsonResponse(serializer.data, safe=False)
+        return set_next_page_headers(response, request, next_cursor)
     elif request.method == "POST":
         data = JSONParser().parse(request)
         serializer = EAPUserSerializer(data=data)
@@ -143,15 +171,27 @@ def case_list(request):
     """
     if request.method == "GET":
         cases = get_allowed_cases(request.user)
-        serializer = AssuranceCaseSerializer(cases, many=True)
-        summaries = make_summary(serializer.data)
-        return JsonResponse(summaries, safe=False)
+        cases, next_cursor = paginate(cases.values("id", "name"), request)
+        summaries = make_summary(cases)
+        response = JsonResponse(summaries, safe=False)
+        return set_next_page_headers(response, request, next_cursor)
     elif request.method == "POST":
         data = JSONParser().parse(request)
         data["owner"] = request.user.id
         return save_json_tree(data, "assurance_case")
 
 
+@csrf_exempt
+@api_view(["POST"])
+def case_import(request):
+    """
+    Make a new case from the JSON of a whole case tree, as for a POST to case_list,
+    parsed and written as it's uploaded, so that large cases take little memory
+    to import
+    """
+    return save_json_stream(request, "assurance_case", {"owner": request.user.id})
+
+
 @csrf_exempt
 @api_view(["GET", "POST", "PUT", "DELETE"])
 def case_detail(request, pk):
@@ -166,28 +206,195 @@ def case_detail(request, pk):
     if not permissions:
         return HttpResponse(status=403)
     if request.method == "GET":
-        serializer = AssuranceCaseSerializer(case)
-        case_data = serializer.data
-        goals = get_json_tree(case_data["goals"], "goals")
-        case_data["goals"] = goals
-        case_data["permissions"] = permissions
-        return JsonResponse(case_data)
+        etag = get_case_etag(case, permissions)
+        not_modified = get_not_modified_response(request, case, etag)
+        if not_modified:
+            return not_modified
+        case_data = dict(get_case_tree(case), permissions=permissions)
+        return set_case_cache_headers(JsonResponse(case_data), case, etag)
     elif request.method == "PUT":
         if permissions not in ["manage", "edit"]:
             return HttpResponse(status=403)
         data = JSONParser().parse(request)
         serializer = AssuranceCaseSerializer(case, data=data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            etag = get_case_etag(case, permissions)
+            error = save_if_match(request, serializer, etag)
+            if error:
+                return error
             return JsonResponse(serializer.data)
         return JsonResponse(serializer.errors, status=400)
     elif request.method == "DELETE":
         if permissions not in ["manage", "edit"]:
             return HttpResponse(status=403)
-        case.delete()
+        # Items are deleted without signals, so tell the open editors once.
+        publish_case_event(case.pk, "deleted", type="assurance_case", id=case.pk)
+        if request.GET.get("defer") == "true":
+            delete_case_later(case)
+            return HttpResponse(status=202)
+        delete_case(case.pk)
+        return HttpResponse(status=204)
+
+
+@csrf_exempt
+@api_view(["POST", "PUT", "DELETE"])
+def case_lock(request, pk):
+    """
+    Take (POST), renew (PUT) or release (DELETE) the edit lock on an AssuranceCase,
+    for the editor with the `lock_uuid` in the payload
+    """
+    try:
+        case = AssuranceCase.objects.get(pk=pk)
+    except AssuranceCase.DoesNotExist:
+        return HttpResponse(status=404)
+    if get_case_permissions(case, request.user) not in ["manage", "edit"]:
+        return HttpResponse(status=403)
+    lock_uuid = request.data.get("lock_uuid")
+    if not isinstance(lock_uuid, str) or not lock_uuid:
+        return JsonResponse({"lock_uuid": ["This field is required."]}, status=400)
+    if request.method == "POST":
+        user = request.user if request.user.is_authenticated else None
+        force = request.data.get("force") is True
+        lease, acquired = acquire_case_lock(case, lock_uuid, user, force=force)
+        data = {
+            "lock_uuid": lease.lock_uuid,
+            "expires_date": lease.expires_date,
+            "ttl": settings.CASE_LOCK_TTL,
+        }
+        return JsonResponse(data, status=200 if acquired else 423)
+    elif request.method == "PUT":
+        expires_date = renew_case_lock(case, lock_uuid)
+        if expires_date is None:
+            return HttpResponse(status=409)
+        data = {
+            "lock_uuid": lock_uuid,
+            "expires_date": expires_date,
+            "ttl": settings.CASE_LOCK_TTL,
+        }
+        return JsonResponse(data)
+    elif request.method == "DELETE":
+        release_case_lock(case, lock_uuid)
         return HttpResponse(status=204)
 
 
+@csrf_exempt
+@api_view(["POST"])
+def case_clone(request, pk):
+    """
+    Make a copy of an AssuranceCase and all its items, owned by the user
+    """
+    try:
+        case = AssuranceCase.objects.get(pk=pk)
+    except AssuranceCase.DoesNotExist:
+        return HttpResponse(status=404)
+    if not get_case_permissions(case, request.user):
+        return HttpResponse(status=403)
+    owner = request.user if request.user.is_authenticated else None
+    new_case = clone_case(case, owner)
+    return JsonResponse({"name": new_case.name, "id": new_case.id}, status=201)
+
+
+@api_view(["GET"])
+def case_export(request, pk):
+    """
+    Retrieve the full JSON of an AssuranceCase, the same as case_detail, as a file
+    written a batch of items at a time, so that large cases take little memory to
+    export
+    """
+    try:
+        case = AssuranceCase.objects.get(pk=pk)
+    except AssuranceCase.DoesNotExist:
+        return HttpResponse(status=404)
+    permissions = get_case_permissions(case, request.user)
+    if not permissions:
+        return HttpResponse(status=403)
+    return FileResponse(
+        spool_case_tree(case, permissions),
+        as_attachment=True,
+        filename=f"case-{case.pk}.json",
+        content_type="application/json",
+    )
+
+
+@csrf_exempt
+@api_view(["GET"])
+def case_changes(request, pk):
+    """
+    Retrieve the items of an AssuranceCase created, updated or deleted since the
+    version of the case given as `since`, so that clients can catch up without
+    fetching the whole case again
+    """
+    try:
+        case = AssuranceCase.objects.get(pk=pk)
+    except AssuranceCase.DoesNotExist:
+        return HttpResponse(status=404)
+    if not get_case_permissions(case, request.user):
+        return HttpResponse(status=403)
+    try:
+        since = int(request.GET["since"])
+    except (KeyError, ValueError):
+        return JsonResponse({"since": ["A version number is required."]}, status=400)
+    changes = get_case_changes(case, since)
+    if changes is None:
+        # The changes since then are unknown, fetch the whole case instead.
+        return HttpResponse(status=410)
+    return JsonResponse(changes)
+
+
+@api_view(["GET"])
+def case_cache_stats(request):
+    """
+    Retrieve the numbers of hits and misses of the cache of the JSON of cases, for
+    monitoring. Only available to staff.
+    """
+    if not request.user.is_staff:
+        return HttpResponse(status=403)
+    return JsonResponse(get_case_cache_stats())
+
+
+@api_view(["GET"])
+def metrics(request):
+    """
+    Retrieve the request metrics of this server process, the counts of the cache
+    of cases and those of the pools of database connections, in the Prometheus
+    text format. Only available to staff.
+    """
+    if not request.user.is_staff:
+        return HttpResponse(status=403)
+    cache_lines = []
+    for outcome, count in get_case_cache_stats().items():
+        name = f"eap_case_cache_{outcome}_total"
+        cache_lines += [f"# TYPE {name} counter", f"{name} {count}"]
+    return HttpResponse(
+        render_metrics(cache_lines + render_pool_metrics()),
+        content_type="text/plain; version=0.0.4",
+    )
+
+
+def health(request):
+    """
+    Health check for load balancers and containers: 200 if the server is up and
+    every database answers, 503 otherwise
+    """
+    try:
+        for connection in connections.all():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+    except DatabaseError:
+        return JsonResponse({"status": "unavailable"}, status=503)
+    return JsonResponse({"status": "ok"})
+
+
+@csrf_exempt
+def case_events(request, pk):
+    """
+    Stream the changes to an AssuranceCase as server-sent events. Under ASGI the
+    stream is served by eap_api.events.CaseEventsMiddleware before getting here, so
+    this only answers when running under WSGI, which can't hold streams open.
+    """
+    return HttpResponse(status=501)
+
+
 @csrf_exempt
 def goal_list(request):
     """
@@ -196,15 +403,18 @@ def goal_list(request):
     if request.method == "GET":
         goals = TopLevelNormativeGoal.objects.all()
         goals = filter_by_case_id(goals, request)
-        serializer = TopLevelNormativeGoalSerializer(goals, many=True)
-        summaries = make_summary(serializer.data)
-        return JsonResponse(summaries, safe=False)
+        goals, next_cursor = paginate(goals.values("id", "name"), request)
+        summaries = make_summary(goals)
+        response = JsonResponse(summaries, safe=False)
+        return set_next_page_headers(response, request, next_cursor)
     elif request.method == "POST":
         data = JSONParser().parse(request)
         assurance_case_id = AssuranceCase.objects.get(id=data["assurance_case_id"])
         data["assurance_case"] = assurance_case_id
         serializer = TopLevelNormativeGoalSerializer(data=data)
         if serializer.is_valid():
+            if is_case_locked(request, *get_case_ids(serializer.validated_data)):
+                return HttpResponse(status=423)
             serializer.save()
             summary = make_summary(serializer.data)
             return JsonResponse(summary, status=201)
@@ -217,29 +427,39 @@ def goal_detail(request, pk):
     Retrieve, update, or delete a TopLevelNormativeGoal, by primary key
     """
     try:
-        goal = TopLevelNormativeGoal.objects.get(pk=pk)
+        goal = TopLevelNormativeGoal.objects.select_related("assurance_case").get(pk=pk)
         shape = goal.shape.name
     except TopLevelNormativeGoal.DoesNotExist:
         return HttpResponse(status=404)
 
     if request.method == "GET":
-        serializer = TopLevelNormativeGoalSerializer(goal)
-        data = serializer.data
-        # replace IDs for children with full JSON objects
-        for key in ["context", "system_description", "property_claims"]:
-            data[key] = get_json_tree(data[key], key)
+        case = goal.assurance_case
+        etag = get_case_etag(case, "goal", goal.pk)
+        not_modified = get_not_modified_response(request, case, etag)
+        if not_modified:
+            return not_modified
+        # full JSON for the goal, with IDs for children replaced by their JSON
+        (data,) = get_goal_trees(TopLevelNormativeGoal.objects.filter(pk=pk))
         data["shape"] = shape
-        return JsonResponse(data)
+        return set_case_cache_headers(JsonResponse(data), case, etag)
     elif request.method == "PUT":
         data = JSONParser().parse(request)
         serializer = TopLevelNormativeGoalSerializer(goal, data=data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            case_ids = get_case_ids(serializer.validated_data)
+            if is_case_locked(request, goal.assurance_case_id, *case_ids):
+                return HttpResponse(status=423)
+            etag = get_case_etag(goal.assurance_case, "goal", goal.pk)
+            error = save_if_match(request, serializer, etag)
+            if error:
+                return error
             data = serializer.data
             data["shape"] = shape
             return JsonResponse(data)
         return JsonResponse(serializer.errors, status=400)
     elif request.method == "DELETE":
+        if is_case_locked(request, goal.assurance_case_id):
+            return HttpResponse(status=423)
         goal.delete()
         return HttpResponse(status=204)
 
@@ -252,13 +472,16 @@ def context_list(request):
     if request.method == "GET":
         contexts = Context.objects.all()
         contexts = filter_by_case_id(contexts, request)
-        serializer = ContextSerializer(contexts, many=True)
-        summaries = make_summary(serializer.data)
-        return JsonResponse(summaries, safe=False)
+        contexts, next_cursor = paginate(contexts.values("id", "name"), request)
+        summaries = make_summary(contexts)
+        response = JsonResponse(summaries, safe=False)
+        return set_next_page_headers(response, request, next_cursor)
     elif request.method == "POST":
         data = JSONParser().parse(request)
         serializer = ContextSerializer(data=data)
         if serializer.is_valid():
+            if is_case_locked(request, *get_case_ids(serializer.validated_data)):
+                return HttpResponse(status=423)
             serializer.save()
             summary = make_summary(serializer.data)
             return JsonResponse(summary, status=201)
@@ -285,12 +508,19 @@ def context_detail(request, pk):
         data = JSONParser().parse(request)
         serializer = ContextSerializer(context, data=data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            case_ids = get_case_ids(serializer.validated_data)
+            if is_case_locked(request, context.assurance_case_id, *case_ids):
+                return HttpResponse(status=423)
+            error = save_if_match(request, serializer)
+            if error:
+                return error
             data = serializer.data
             data["shape"] = shape
             return JsonResponse(data)
         return JsonResponse(serializer.errors, status=400)
     elif request.method == "DELETE":
+        if is_case_locked(request, context.assurance_case_id):
+            return HttpResponse(status=423)
         context.delete()
         return HttpResponse(status=204)
 
@@ -303,13 +533,16 @@ def description_list(request):
     if request.method == "GET":
         descriptions = SystemDescription.objects.all()
         descriptions = filter_by_case_id(descriptions, request)
-        serializer = SystemDescriptionSerializer(descriptions, many=True)
-        summaries = make_summary(serializer.data)
-        return JsonResponse(summaries, safe=False)
+        descriptions, next_cursor = paginate(descriptions.values("id", "name"), request)
+        summaries = make_summary(descriptions)
+        response = JsonResponse(summaries, safe=False)
+        return set_next_page_headers(response, request, next_cursor)
     elif request.method == "POST":
         data = JSONParser().parse(request)
         serializer = SystemDescriptionSerializer(data=data)
         if serializer.is_valid():
+            if is_case_locked(request, *get_case_ids(serializer.validated_data)):
+                return HttpResponse(status=423)
             serializer.save()
             summary = make_summary(serializer.data)
             return JsonResponse(summary, status=201)
@@ -336,12 +569,19 @@ def description_detail(request, pk):
         data = JSONParser().parse(request)
         serializer = SystemDescriptionSerializer(description, data=data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            case_ids = get_case_ids(serializer.validated_data)
+            if is_case_locked(request, description.assurance_case_id, *case_ids):
+                return HttpResponse(status=423)
+            error = save_if_match(request, serializer)
+            if error:
+                return error
             data = serializer.data
             data["shape"] = shape
             return JsonResponse(data)
         return JsonResponse(serializer.errors, status=400)
     elif request.method == "DELETE":
+        if is_case_locked(request, description.assurance_case_id):
+            return HttpResponse(status=423)
         description.delete()
         return HttpResponse(status=204)
 
@@ -354,13 +594,16 @@ def property_claim_list(request):
     if request.method == "GET":
         claims = PropertyClaim.objects.all()
         claims = filter_by_case_id(claims, request)
-        serializer = PropertyClaimSerializer(claims, many=True)
-        summaries = make_summary(serializer.data)
-        return JsonResponse(summaries, safe=False)
+        claims, next_cursor = paginate(claims.values("id", "name"), request)
+        summaries = make_summary(claims)
+        response = JsonResponse(summaries, safe=False)
+        return set_next_page_headers(response, request, next_cursor)
     elif request.method == "POST":
         data = JSONParser().parse(request)
         serializer = PropertyClaimSerializer(data=data)
         if serializer.is_valid():
+            if is_case_locked(request, *get_case_ids(serializer.validated_data)):
+                return HttpResponse(status=423)
             serializer.save()
             summary = make_summary(serializer.data)
             return JsonResponse(summary, status=201)
@@ -387,16 +630,63 @@ def property_claim_detail(request, pk):
         data = JSONParser().parse(request)
         serializer = PropertyClaimSerializer(claim, data=data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            case_ids = get_case_ids(serializer.validated_data)
+            if is_case_locked(request, claim.assurance_case_id, *case_ids):
+                return HttpResponse(status=423)
+            error = save_if_match(request, serializer)
+            if error:
+                return error
             data = serializer.data
             data["shape"] = shape
             return JsonResponse(data)
         return JsonResponse(serializer.errors, status=400)
     elif request.method == "DELETE":
+        if is_case_locked(request, claim.assurance_case_id):
+            return HttpResponse(status=423)
         claim.delete()
         return HttpResponse(status=204)
 
 
+@csrf_exempt
+def property_claim_move(request, pk):
+    """
+    Move a PropertyClaim, along with everything under it, under another goal or
+    PropertyClaim, given by either `goal_id` or `property_claim_id`
+    """
+    if request.method != "POST":
+        return HttpResponse(status=405)
+    try:
+        claim = PropertyClaim.objects.get(pk=pk)
+    except PropertyClaim.DoesNotExist:
+        return HttpResponse(status=404)
+    data = JSONParser().parse(request)
+    targets = {
+        field: data[field]
+        for field in ("goal_id", "property_claim_id")
+        if data.get(field) is not None
+    }
+    if len(targets) != 1:
+        message = "Exactly one of goal_id and property_claim_id is required."
+        return JsonResponse({"non_field_errors": [message]}, status=400)
+    ((field, target_id),) = targets.items()
+    model = TopLevelNormativeGoal if field == "goal_id" else PropertyClaim
+    try:
+        target = model.objects.get(pk=target_id)
+    except (model.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({field: [f"No item with id {target_id}."]}, status=400)
+    if is_case_locked(request, claim.assurance_case_id, target.assurance_case_id):
+        return HttpResponse(status=423)
+    claim.goal = target if model is TopLevelNormativeGoal else None
+    claim.property_claim = target if model is PropertyClaim else None
+    try:
+        claim.save()
+    except ValueError as error:
+        return JsonResponse({field: [str(error)]}, status=400)
+    data = PropertyClaimSerializer(claim).data
+    data["shape"] = claim.shape.name
+    return JsonResponse(data)
+
+
 @csrf_exempt
 def evidential_claim_list(request):
     """
@@ -405,13 +695,18 @@ def evidential_claim_list(request):
     if request.method == "GET":
         evidential_claims = EvidentialClaim.objects.all()
         evidential_claims = filter_by_case_id(evidential_claims, request)
-        serializer = EvidentialClaimSerializer(evidential_claims, many=True)
-        summaries = make_summary(serializer.data)
-        return JsonResponse(summaries, safe=False)
+        evidential_claims, next_cursor = paginate(
+            evidential_claims.values("id", "name"), request
+        )
+        summaries = make_summary(evidential_claims)
+        response = JsonResponse(summaries, safe=False)
+        return set_next_page_headers(response, request, next_cursor)
     elif request.method == "POST":
         data = JSONParser().parse(request)
         serializer = EvidentialClaimSerializer(data=data)
         if serializer.is_valid():
+            if is_case_locked(request, *get_case_ids(serializer.validated_data)):
+                return HttpResponse(status=423)
             serializer.save()
             summary = make_summary(serializer.data)
             return JsonResponse(summary, status=201)
@@ -440,12 +735,19 @@ def evidential_claim_detail(request, pk):
             evidential_claim, data=data, partial=True
         )
         if serializer.is_valid():
-            serializer.save()
+            case_ids = get_case_ids(serializer.validated_data)
+            if is_case_locked(request, evidential_claim.assurance_case_id, *case_ids):
+                return HttpResponse(status=423)
+            error = save_if_match(request, serializer)
+            if error:
+                return error
             data = serializer.data
             data["shape"] = shape
             return JsonResponse(data)
         return JsonResponse(serializer.errors, status=400)
     elif request.method == "DELETE":
+        if is_case_locked(request, evidential_claim.assurance_case_id):
+            return HttpResponse(status=423)
         evidential_claim.delete()
         return HttpResponse(status=204)
 
@@ -458,13 +760,16 @@ def evidence_list(request):
     if request.method == "GET":
         evidences = Evidence.objects.all()
         evidences = filter_by_case_id(evidences, request)
-        serializer = EvidenceSerializer(evidences, many=True)
-        summaries = make_summary(serializer.data)
-        return JsonResponse(summaries, safe=False)
+        evidences, next_cursor = paginate(evidences.values("id", "name"), request)
+        summaries = make_summary(evidences)
+        response = JsonResponse(summaries, safe=False)
+        return set_next_page_headers(response, request, next_cursor)
     elif request.method == "POST":
         data = JSONParser().parse(request)
         serializer = EvidenceSerializer(data=data)
         if serializer.is_valid():
+            if is_case_locked(request, *get_case_ids(serializer.validated_data)):
+                return HttpResponse(status=423)
             serializer.save()
             summary = make_summary(serializer.data)
             return JsonResponse(summary, status=201)
@@ -491,22 +796,59 @@ def evidence_detail(request, pk):
         data = JSONParser().parse(request)
         serializer = EvidenceSerializer(evidence, data=data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            case_ids = get_case_ids(serializer.validated_data)
+            if is_case_locked(request, evidence.assurance_case_id, *case_ids):
+                return HttpResponse(status=423)
+            error = save_if_match(request, serializer)
+            if error:
+                return error
             data = serializer.data
             data["shape"] = shape
             return JsonResponse(data)
         return JsonResponse(serializer.errors, status=400)
     elif request.method == "DELETE":
+        if is_case_locked(request, evidence.assurance_case_id):
+            return HttpResponse(status=423)
         evidence.delete()
         return HttpResponse(status=204)
 
 
+@csrf_exempt
+@api_view(["POST"])
+def batch(request):
+    """
+    Make, change or delete several items in one request, and in one transaction,
+    given a list of `operations`, see run_batch
+    """
+    operations = (
+        request.data.get("operations") if isinstance(request.data, dict) else None
+    )
+    if not isinstance(operations, list):
+        message = "A list of operations is required."
+        return JsonResponse({"operations": [message]}, status=400)
+    if len(operations) > MAX_BATCH_SIZE:
+        message = f"At most {MAX_BATCH_SIZE} operations are allowed."
+        return JsonResponse({"operations": [message]}, status=400)
+    status, results = run_batch(request, operations)
+    return JsonResponse({"results": results}, status=status)
+
+
 @csrf_exempt
 def parents(request, item_type, pk):
-    """Return all the parents of an item."""
+    """
+    Return all the parents of an item. For PropertyClaims, if the `ancestors`
+    parameter is "true", return every item above the claim instead, from its goal
+    down to its parent.
+    """
     if request.method != "GET":
         return HttpResponse(status=404)
-    item = TYPE_DICT[item_type]["model"].objects.get(pk=pk)
+    model = TYPE_DICT[item_type]["model"]
+    try:
+        item = model.objects.get(pk=pk)
+    except model.DoesNotExist:
+        return HttpResponse(status=404)
+    if model is PropertyClaim and request.GET.get("ancestors") == "true":
+        return JsonResponse(get_claim_ancestors(item), safe=False)
     parent_types = TYPE_DICT[item_type]["parent_types"]
     parents_data = []
     for parent_type, many in parent_types:
@@ -514,5 +856,8 @@ def parents(request, item_type, pk):
         parent = getattr(item, parent_type)
         if parent is None:
             continue
-        parents_data += serializer_class(parent, many=many).data
+        if many:
+            parents_data += serializer_class(parent, many=True).data
+        else:
+            parents_data.append(serializer_class(parent).data)
     return JsonResponse(parents_data, safe=False)
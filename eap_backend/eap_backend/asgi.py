@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "eap_backend.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after setting up Django, since it uses the models.
+from eap_api.events import CaseEventsMiddleware  # noqa: E402
+
+# Serve the streams of events of cases, which need to stay open, outside Django.
+application = CaseEventsMiddleware(django_application)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 import os
 import sys
 from pathlib import Path
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -64,6 +65,11 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Per-request metrics: Server-Timing headers, and histograms by URL name served at
+# /api/metrics/. Off by default, since every query is timed.
+if os.environ.get("REQUEST_METRICS") == "1":
+    MIDDLEWARE.insert(0, "eap_api.metrics.RequestMetricsMiddleware")
+
 if "CORS_ORIGIN_WHITELIST" in os.environ.keys():
     CORS_ORIGIN_WHITELIST = os.environ["CORS_ORIGIN_WHITELIST"].split(",")
 else:
@@ -73,6 +79,22 @@ else:
         "http://localhost:8080",
     )
 
+# Let the frontend read the pointers to the next pages of the list views.
+CORS_EXPOSE_HEADERS = ["Link", "X-Next-Cursor"]
+# Let the frontend send the versions of items (see If-Match in API_docs.md), and
+# the lock it holds on the case being edited.
+CORS_ALLOW_HEADERS = list(default_headers) + ["if-match", "x-case-lock"]
+
+# Under ASGI (see asgi.py), serve the views polled by the frontend as async views,
+# run in a pool of ASYNC_VIEW_THREADS threads, each with its own database
+# connection, rather than one request at a time. See eap_api/async_views.py.
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS") == "1"
+ASYNC_VIEW_THREADS = int(os.environ.get("ASYNC_VIEW_THREADS", 32))
+
+# Seconds that an edit lock on a case lasts, unless it is renewed. Editors renew
+# their locks well before then, see CaseContainer.js.
+CASE_LOCK_TTL = int(os.environ.get("CASE_LOCK_TTL", 60))
+
 ROOT_URLCONF = "eap_backend.urls"
 
 
@@ -131,17 +153,90 @@ else:
             }
         }
     else:
-        # use Postgres for production server, configured via environment vars
+        # use Postgres for production server, configured via environment vars.
+        # Connections are kept for CONN_MAX_AGE seconds and checked before reuse,
+        # or, with DBPOOLSIZE set, shared by the threads of each process through a
+        # pool of that many connections, see eap_api/postgresql/base.py.
+        DB_POOL_SIZE = int(os.environ.get("DBPOOLSIZE", 0))
         DATABASES = {
             "default": {
-                "ENGINE": "django.db.backends.postgresql",
+                "ENGINE": "eap_api.postgresql",
                 "HOST": os.environ["DBHOST"],
                 "NAME": os.environ["DBNAME"],
                 "USER": os.environ["DBUSER"],
                 "PASSWORD": os.environ["DBPASSWORD"],
+                "CONN_MAX_AGE": int(
+                    os.environ.get("CONN_MAX_AGE", 0 if DB_POOL_SIZE else 60)
+                ),
+                "CONN_HEALTH_CHECKS": os.environ.get("CONN_HEALTH_CHECKS", "1") == "1",
+                "POOL": {
+                    "MAX_SIZE": DB_POOL_SIZE,
+                    "TIMEOUT": float(os.environ.get("DBPOOLTIMEOUT", 10)),
+                }
+                if DB_POOL_SIZE
+                else None,
             }
         }
 
+        # Read replicas of the Postgres database, with the same settings other than
+        # their hosts, e.g. DBREPLICAHOSTS=replica1.example.com,replica2.example.com,
+        # see eap_api/routers.py.
+        for i, host in enumerate(os.environ.get("DBREPLICAHOSTS", "").split(",")):
+            if host:
+                DATABASES[f"replica{i + 1}"] = dict(DATABASES["default"], HOST=host)
+
+READ_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["eap_api.routers.ReplicaRouter"]
+# The views whose GET requests read from the replicas, and how long each client
+# keeps reading from the primary after a write, to see its own changes.
+REPLICA_VIEWS = [
+    "case_list",
+    "case_detail",
+    "goal_list",
+    "goal_detail",
+    "context_list",
+    "context_detail",
+    "description_list",
+    "description_detail",
+    "property_claim_list",
+    "property_claim_detail",
+    "evidential_claim_list",
+    "evidential_claim_detail",
+    "evidence_list",
+    "evidence_detail",
+    "parents",
+]
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 10))
+if READ_REPLICAS:
+    MIDDLEWARE.append("eap_api.routers.ReplicaMiddleware")
+
+# Live feed of the changes to cases, see eap_api/events.py. With Postgres, send
+# the changes through the database so that they reach every server process.
+if DATABASES["default"]["ENGINE"] == "eap_api.postgresql":
+    EVENTS_BROADCASTER = "eap_api.events.PostgresBroadcaster"
+else:
+    EVENTS_BROADCASTER = "eap_api.events.InMemoryBroadcaster"
+
+
+# Cache of the full JSON of every case, see get_case_tree in eap_api/view_utils.py.
+# In memory by default, which is per server process. Any other Django cache backend
+# can be plugged in through the environment, e.g.
+# django.core.cache.backends.filebased.FileBasedCache with a directory as the
+# location, or a Redis backend such as django_redis.cache.RedisCache with a
+# redis:// URL, to share the cache between processes.
+CASE_CACHE = "cases"
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    CASE_CACHE: {
+        "BACKEND": os.environ.get(
+            "CASE_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CASE_CACHE_LOCATION", "cases"),
+        # Entries are dropped whenever their case changes.
+        "TIMEOUT": None,
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
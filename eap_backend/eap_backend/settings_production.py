@@ -0,0 +1,55 @@
+"""
+Settings for running the backend in production, with run_production.sh: the
+settings of settings.py, tuned for serving many requests.
+
+Configured through environment variables, as settings.py is, plus:
+* SECRET_KEY (required): the secret key of the deployment, since the one in
+  settings.py is public.
+* ALLOWED_HOSTS (required): comma separated host names the backend is served at.
+  localhost is allowed as well, for the HEALTHCHECK of the Docker image.
+* CONN_MAX_AGE: seconds to keep each database connection open for, and reuse
+  between requests (60 by default), rather than connecting for each request.
+* ASYNC_VIEWS: "1" to serve the polled views as async views, off by default (see
+  the benchmarks in the README).
+
+The server fails to start if a required variable is missing.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+
+def _required(name):
+    value = os.environ.get(name, "").strip()
+    if not value:
+        raise ImproperlyConfigured(
+            f"Set the {name} environment variable, see settings_production.py."
+        )
+    return value
+
+
+# Also stops Django keeping every query of every request in memory.
+DEBUG = False
+
+SECRET_KEY = _required("SECRET_KEY")
+ALLOWED_HOSTS = _required("ALLOWED_HOSTS").split(",") + ["localhost"]
+
+# Already set for Postgres, see settings.py.
+for database in DATABASES.values():
+    database.setdefault("CONN_MAX_AGE", int(os.environ.get("CONN_MAX_AGE", 60)))
+
+# Off by default: the async views were slower in the benchmarks of the README,
+# with SQLite and with Postgres, and may only pay off when the views wait on a
+# database over the network. The workers of gunicorn.conf.py serve requests
+# concurrently instead.
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "0") == "1"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "root": {"handlers": ["console"], "level": "WARNING"},
+}
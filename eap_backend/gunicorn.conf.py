@@ -0,0 +1,56 @@
+"""
+Configuration of gunicorn, the application server of run_production.sh:
+WEB_CONCURRENCY processes, each serving eap_backend.asgi with uvicorn, and
+running the async views, if on, in a pool of ASYNC_VIEW_THREADS threads (see
+eap_api/async_views.py).
+
+Each process can hold a database connection per thread of its pool, plus one, so
+keep WEB_CONCURRENCY * (ASYNC_VIEW_THREADS + 1) within the connections allowed by
+the database.
+
+Under ASGI, each process runs the synchronous views one at a time, so a slow
+request (e.g. exporting a large case) holds up the others of its process. With
+Postgres (DBHOST set), as in docker-compose.yml, there are two processes per CPU
+by default. Several processes need Postgres: with SQLite they contend for the one
+database file, and the events of the open editors of a case (see
+eap_api/events.py) are only sent between processes through Postgres, so there is
+one process by default with SQLite.
+
+Requests are logged to stdout, with the tokens in their query strings hidden (see
+post_worker_init).
+"""
+import logging
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(
+    os.environ.get(
+        "WEB_CONCURRENCY",
+        2 * multiprocessing.cpu_count() if "DBHOST" in os.environ else 1,
+    )
+)
+if workers > 1 and "DBHOST" not in os.environ:
+    raise RuntimeError(
+        f"WEB_CONCURRENCY is {workers}, but several worker processes need "
+        "Postgres (DBHOST), see gunicorn.conf.py."
+    )
+worker_class = "uvicorn.workers.UvicornWorker"
+# Slow requests (e.g. importing large cases) are killed after this many seconds.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+# Restart the processes now and then, in case of leaks, not all at once.
+max_requests = 10000
+max_requests_jitter = 1000
+accesslog = "-"
+
+
+def post_worker_init(worker):
+    # The access log of the uvicorn workers has the full path of each request,
+    # including the tokens of the streams of events, see eap_api/events.py. Django
+    # is set up by now, with the application loaded.
+    from eap_api.events import RedactTokens
+
+    for name in ("uvicorn.access", "gunicorn.access"):
+        logging.getLogger(name).addFilter(RedactTokens())
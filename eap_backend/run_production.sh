@@ -0,0 +1,7 @@
+#!/bin/sh
+# Run the backend in production: migrate the database, then serve the API with
+# gunicorn (see gunicorn.conf.py) and the settings of settings_production.py.
+set -e
+export DJANGO_SETTINGS_MODULE="${DJANGO_SETTINGS_MODULE:-eap_backend.settings_production}"
+python manage.py migrate --noinput
+exec gunicorn -c gunicorn.conf.py eap_backend.asgi:application
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import threading
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.test import (
+    Client,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from eap_backend.asgi import application
+from eap_api import async_views, views
+from eap_api.metrics import RequestMetricsMiddleware
+from eap_api.models import AssuranceCase, TopLevelNormativeGoal
+from .constants_tests import CASE1_INFO, GOAL_INFO
+
+
+@override_settings(ASYNC_VIEW_THREADS=0)
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        self.case = AssuranceCase.objects.create(**CASE1_INFO)
+        self.goal = TopLevelNormativeGoal.objects.create(
+            **dict(GOAL_INFO, assurance_case_id=self.case.pk)
+        )
+        self.factory = RequestFactory()
+
+    def test_same_responses(self):
+        for name, kwargs in [
+            ("case_list", {}),
+            ("case_detail", {"pk": self.case.pk}),
+            ("goal_list", {}),
+            ("goal_detail", {"pk": self.goal.pk}),
+            ("parents", {"item_type": "goal", "pk": self.goal.pk}),
+        ]:
+            async_view = getattr(async_views, name)
+            self.assertTrue(asyncio.iscoroutinefunction(async_view))
+            self.assertTrue(async_view.csrf_exempt)
+            response = async_to_sync(async_view)(self.factory.get("/"), **kwargs)
+            expected = getattr(views, name)(self.factory.get("/"), **kwargs)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, expected.content)
+
+
+@override_settings(ASYNC_VIEW_THREADS=4)
+class AsyncViewsPoolTest(TransactionTestCase):
+    def setUp(self):
+        self.case = AssuranceCase.objects.create(**CASE1_INFO)
+        self.factory = RequestFactory()
+        async_views._pool = None
+
+    def tearDown(self):
+        if async_views._pool is not None:
+            async_views._pool.shutdown()
+            async_views._pool = None
+
+    def test_concurrent_requests(self):
+        # Only passed once 4 requests are being handled at the same time.
+        barrier = threading.Barrier(4, timeout=10)
+        thread_names = set()
+
+        def get_case_tree(case):
+            thread_names.add(threading.current_thread().name)
+            barrier.wait()
+            return {"id": case.pk}
+
+        async def get_case(request):
+            return await async_views.case_detail(request, pk=self.case.pk)
+
+        async def get_cases():
+            middleware = RequestMetricsMiddleware(get_case)
+            requests = [middleware(self.factory.get("/")) for _ in range(4)]
+            return await asyncio.gather(*requests)
+
+        with mock.patch.object(views, "get_case_tree", get_case_tree):
+            responses = async_to_sync(get_cases)()
+        self.assertEqual([r.status_code for r in responses], [200] * 4)
+        self.assertEqual(len(thread_names), 4)
+        self.assertTrue(all(name.startswith("eap-view") for name in thread_names))
+        # The queries made in the threads of the pool are counted.
+        for response in responses:
+            self.assertNotIn('queries;desc="0"', response["Server-Timing"])
+
+
+def asgi_get(path):
+    """Make a GET request through the ASGI application, returning its messages."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "query_string": b"",
+        "headers": [],
+        "server": ("testserver", 80),
+    }
+    messages = []
+
+    async def run():
+        inbox = asyncio.Queue()
+        await inbox.put({"type": "http.request", "body": b""})
+
+        async def send(message):
+            messages.append(message)
+
+        await application(scope, inbox.get, send)
+
+    async_to_sync(run)()
+    return messages
+
+
+class AsgiExportTest(TransactionTestCase):
+    # The ASGI handler sends the request signals, which close the connection, so
+    # outside of the transaction of a TestCase.
+
+    def test_case_export(self):
+        case = AssuranceCase.objects.create(**CASE1_INFO)
+        for _ in range(3):
+            TopLevelNormativeGoal.objects.create(
+                **dict(GOAL_INFO, assurance_case_id=case.pk)
+            )
+        path = f"/api/cases/{case.pk}/export/"
+        with mock.patch("eap_api.view_utils.EXPORT_BATCH_SIZE", 1):
+            messages = asgi_get(path)
+        self.assertEqual(messages[0]["status"], 200)
+        # sent in full, and ended
+        self.assertFalse(messages[-1].get("more_body", False))
+        content = b"".join(message.get("body", b"") for message in messages[1:])
+        expected = Client().get(f"/api/cases/{case.pk}/").json()
+        self.assertEqual(json.loads(content), expected)
@@ -0,0 +1,77 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import LiveServerTestCase, TestCase
+from eap_api.benchmark import (
+    make_case,
+    make_case_json,
+    percentile,
+    run_load,
+    run_query_plans,
+)
+from eap_api.models import (
+    AssuranceCase,
+    EAPUser,
+    PropertyClaim,
+    EvidentialClaim,
+    Evidence,
+)
+
+
+class BenchmarkTest(TestCase):
+    def test_make_case(self):
+        case_json = make_case_json(
+            goals=2, depth=3, fan_out=2, evidential_claims=2, evidence=3
+        )
+        case_id = make_case(case_json, shared_by=4)
+        claims = PropertyClaim.objects.filter(assurance_case_id=case_id)
+        self.assertEqual(claims.count(), 2 * (2 + 4 + 8))
+        self.assertEqual(claims.filter(level=3).count(), 2 * 8)
+        evidential_claims = EvidentialClaim.objects.filter(assurance_case_id=case_id)
+        self.assertEqual(evidential_claims.count(), 2 * 8 * 2)
+        for evidential_claim in evidential_claims:
+            self.assertEqual(evidential_claim.property_claim.count(), 4)
+        evidence = Evidence.objects.filter(assurance_case_id=case_id)
+        self.assertEqual(evidence.count(), 2 * 8 * 2 * 3)
+
+    def test_percentile(self):
+        times = list(range(1, 101))
+        self.assertEqual(percentile(times, 50), 50)
+        self.assertEqual(percentile(times, 95), 95)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            "benchmark", "--cases=2", "--depth=2", "--fan-out=2", "--runs=2", stdout=out
+        )
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("Benchmarks on sqlite"))
+        names = [line.split("  ")[0] for line in lines[2:]]
+        self.assertIn("case_detail (uncached)", names)
+        self.assertIn("import (save_json_tree)", names)
+        self.assertIn("parents (evidence)", names)
+        self.assertIn("EvidentialClaims of PropertyClaims", names)
+        self.assertNotIn("NOT USED", out.getvalue())
+        # nothing is left behind
+        self.assertFalse(AssuranceCase.objects.exists())
+
+    def test_query_plans(self):
+        results = run_query_plans(depth=2, fan_out=2)
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertTrue(result["used"], f"{result['name']}: {result['plan']}")
+        self.assertFalse(AssuranceCase.objects.exists())
+
+
+class LoadTest(LiveServerTestCase):
+    def test_run_load(self):
+        result = run_load(
+            self.live_server_url, concurrency=2, duration=0.5, depth=1, fan_out=2
+        )
+        self.assertGreater(result["requests"], 0)
+        self.assertEqual(result["errors"], 0)
+        self.assertGreater(result["throughput"], 0)
+        self.assertLessEqual(result["p50"], result["p95"])
+        # nothing is left behind
+        self.assertFalse(AssuranceCase.objects.exists())
+        self.assertFalse(EAPUser.objects.exists())
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import logging
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase, Client
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from eap_api.events import CaseEventsMiddleware, PostgresBroadcaster, RedactTokens
+from eap_api.models import (
+    AssuranceCase,
+    TopLevelNormativeGoal,
+    Context,
+    EAPUser,
+)
+from .constants_tests import (
+    CASE1_INFO,
+    GOAL_INFO,
+    CONTEXT_INFO,
+    USER1_INFO,
+    USER2_INFO,
+)
+
+
+async def not_found_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 404, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+class CaseEventsStreamTest(TestCase):
+    def setUp(self):
+        self.user = EAPUser.objects.create(**USER1_INFO)
+        self.case = AssuranceCase.objects.create(**CASE1_INFO, owner=self.user)
+        self.goal = TopLevelNormativeGoal.objects.create(**GOAL_INFO)
+        self.token = Token.objects.create(user=self.user)
+        self.path = f"/api/cases/{self.case.pk}/events/"
+
+    def stream(self, path, changes=None, query_string=b"", method="GET", auth=True):
+        """
+        Open a stream through the ASGI application, make `changes` once it has
+        started, then disconnect.
+
+        Returns the status code of the response and its body.
+        """
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": path,
+            "query_string": query_string,
+            "headers": [],
+        }
+        if auth:
+            token_header = (b"authorization", f"Token {self.token.key}".encode())
+            scope["headers"].append(token_header)
+        messages = []
+
+        def make_changes():
+            with self.captureOnCommitCallbacks(execute=True):
+                changes()
+
+        async def run():
+            inbox = asyncio.Queue()
+            started = asyncio.Event()
+
+            async def send(message):
+                messages.append(message)
+                if message.get("body", b"").startswith(b": connected"):
+                    started.set()
+
+            app = CaseEventsMiddleware(not_found_app)
+            task = asyncio.ensure_future(app(scope, inbox.get, send))
+            await asyncio.wait(
+                {task, asyncio.ensure_future(started.wait())},
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if started.is_set():
+                if changes is not None:
+                    await sync_to_async(make_changes)()
+                # let the events through
+                for _ in range(10):
+                    await asyncio.sleep(0.01)
+                await inbox.put({"type": "http.disconnect"})
+            await task
+
+        async_to_sync(run)()
+        body = b"".join(m.get("body", b"") for m in messages[1:])
+        return messages[0]["status"], body.decode()
+
+    def parse_events(self, body):
+        events = []
+        for chunk in body.split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in chunk.split("\n") if line)
+            if "event" in fields:
+                data = json.loads(fields["data"])
+                self.assertEqual(fields["event"], data["event"])
+                events.append(data)
+        return events
+
+    def test_item_events(self):
+        def changes():
+            context = Context.objects.create(**CONTEXT_INFO)
+            self.goal.name = "new name"
+            self.goal.save()
+            context.delete()
+
+        status, body = self.stream(self.path, changes)
+        self.assertEqual(status, 200)
+        self.assertTrue(body.startswith(": connected"))
+        self.assertEqual(
+            self.parse_events(body),
+            [
+                {"event": "created", "type": "context", "id": 1, "version": 3},
+                {"event": "updated", "type": "goal", "id": self.goal.pk, "version": 4},
+                {"event": "deleted", "type": "context", "id": 1, "version": 5},
+            ],
+        )
+
+    def test_lock_events(self):
+        def changes():
+            self.case.lock_uuid = "abc"
+            self.case.save()
+            self.case.name = "new name"
+            self.case.save()
+
+        status, body = self.stream(self.path, changes)
+        events = self.parse_events(body)
+        self.assertEqual(
+            [(e["event"], e["version"]) for e in events],
+            [("updated", 3), ("lock", 3), ("updated", 4)],
+        )
+        self.assertEqual(events[1]["lock_uuid"], "abc")
+
+    def test_case_deleted_event(self):
+        def changes():
+            client = Client(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+            client.delete(reverse("case_detail", kwargs={"pk": self.case.pk}))
+
+        status, body = self.stream(self.path, changes)
+        self.assertEqual(
+            self.parse_events(body),
+            [{"event": "deleted", "type": "assurance_case", "id": self.case.pk}],
+        )
+
+    def test_no_events_from_other_cases(self):
+        other_case = AssuranceCase.objects.create(**CASE1_INFO, owner=self.user)
+
+        def changes():
+            TopLevelNormativeGoal.objects.create(
+                **dict(GOAL_INFO, assurance_case_id=other_case.pk)
+            )
+
+        status, body = self.stream(self.path, changes)
+        self.assertEqual(self.parse_events(body), [])
+
+    def test_permissions(self):
+        other_user = EAPUser.objects.create(**USER2_INFO)
+        self.case.owner = other_user
+        self.case.save()
+        status, body = self.stream(self.path)
+        self.assertEqual(status, 403)
+        # the token can also be given in the query string
+        self.token = Token.objects.create(user=other_user)
+        status, body = self.stream(
+            self.path, query_string=f"token={self.token.key}".encode(), auth=False
+        )
+        self.assertEqual(status, 200)
+        status, body = self.stream(self.path, method="POST")
+        self.assertEqual(status, 405)
+        status, body = self.stream("/api/cases/100/events/")
+        self.assertEqual(status, 404)
+
+    def test_connections_closed_around_access_check(self):
+        # as the request signals would, before and after the queries
+        with mock.patch("eap_api.events.close_old_connections") as close:
+            status, body = self.stream("/api/cases/100/events/")
+        self.assertEqual(status, 404)
+        self.assertEqual(close.call_count, 2)
+
+    def test_other_paths_passed_on(self):
+        status, body = self.stream("/api/cases/")
+        self.assertEqual(status, 404)
+
+    def test_not_available_under_wsgi(self):
+        response = self.client.get(reverse("case_events", kwargs={"pk": self.case.pk}))
+        self.assertEqual(response.status_code, 501)
+
+
+class StopListening(Exception):
+    pass
+
+
+class PostgresBroadcasterTest(TestCase):
+    def test_listen_reconnects(self):
+        broadcaster = PostgresBroadcaster()
+        connections = []
+        sleeps = []
+
+        def connect():
+            connections.append(mock.Mock())
+            if len(connections) <= 3:
+                raise OSError("connection refused")
+            return connections[-1]
+
+        def receive(conn):
+            raise OSError("connection lost")
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 5:
+                raise StopListening
+
+        patch = mock.patch.object
+        with patch(broadcaster, "_connect", connect), patch(
+            broadcaster, "_receive", receive
+        ), patch(broadcaster, "close_streams") as close_streams:
+            with mock.patch("eap_api.events.time.sleep", sleep), self.assertLogs(
+                "eap_api.events", "ERROR"
+            ), self.assertRaises(StopListening):
+                broadcaster._listen()
+        # longer waits after each failure to connect, back to the shortest once
+        # connected
+        self.assertEqual(sleeps, [1, 2, 4, 1, 1])
+        self.assertTrue(connections[3].close.called)
+        # the events sent while reconnecting were missed
+        self.assertEqual(close_streams.call_count, 1)
+
+    def test_tokens_redacted_from_logs(self):
+        record = logging.LogRecord(
+            "uvicorn.access",
+            logging.INFO,
+            "",
+            0,
+            '%s - "%s %s HTTP/%s" %d',
+            ("127.0.0.1", "GET", "/api/cases/1/events/?token=abc&x=1", "1.1", 200),
+            None,
+        )
+        self.assertTrue(RedactTokens().filter(record))
+        self.assertEqual(
+            record.getMessage(),
+            '127.0.0.1 - "GET /api/cases/1/events/?token=[redacted]&x=1 HTTP/1.1" 200',
+        )
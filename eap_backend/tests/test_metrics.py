@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from eap_api.metrics import HISTOGRAMS
+from eap_api.models import (
+    AssuranceCase,
+    TopLevelNormativeGoal,
+    EAPUser,
+)
+from .constants_tests import (
+    CASE1_INFO,
+    GOAL_INFO,
+    USER1_INFO,
+    USER2_INFO,
+)
+
+
+@override_settings(
+    MIDDLEWARE=["eap_api.metrics.RequestMetricsMiddleware"] + settings.MIDDLEWARE
+)
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        for histogram in HISTOGRAMS.values():
+            histogram._series.clear()
+        self.case = AssuranceCase.objects.create(**CASE1_INFO)
+        self.goal = TopLevelNormativeGoal.objects.create(**GOAL_INFO)
+        user = EAPUser.objects.create(**USER1_INFO, is_staff=True)
+        token = Token.objects.create(user=user)
+        self.staff_client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def test_server_timing(self):
+        response_get = self.client.get(
+            reverse("goal_detail", kwargs={"pk": self.goal.pk})
+        )
+        timings = {}
+        for timing in response_get["Server-Timing"].split(", "):
+            name, value = timing.split(";")
+            timings[name] = value
+        self.assertEqual(set(timings), {"db", "queries", "serializer", "total", "size"})
+        self.assertTrue(timings["db"].startswith("dur="))
+        self.assertEqual(timings["size"], f'desc="{len(response_get.content)}"')
+        self.assertNotEqual(timings["queries"], 'desc="0"')
+
+    def test_histograms(self):
+        url = reverse("case_detail", kwargs={"pk": self.case.pk})
+        self.client.get(url)
+        self.client.get(url)
+        response_get = self.staff_client.get(reverse("metrics"))
+        self.assertEqual(response_get.status_code, 200)
+        self.assertTrue(response_get["Content-Type"].startswith("text/plain"))
+        lines = response_get.content.decode().splitlines()
+        self.assertIn('eap_request_duration_seconds_count{view="case_detail"} 2', lines)
+        self.assertIn(
+            'eap_request_queries_bucket{view="case_detail",le="+Inf"} 2', lines
+        )
+        self.assertIn("# TYPE eap_response_size_bytes histogram", lines)
+        self.assertIn("# TYPE eap_case_cache_misses_total counter", lines)
+
+    def test_staff_only(self):
+        response_get = self.client.get(reverse("metrics"))
+        self.assertIn(response_get.status_code, (401, 403))
+        user = EAPUser.objects.create(**USER2_INFO)
+        token = Token.objects.create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.assertEqual(client.get(reverse("metrics")).status_code, 403)
@@ -5,10 +5,12 @@ https://docs.djangoproject.com/en/3.2/topics/testing/tools/"""
 from django.test import TestCase
 from .constants_tests import (
     CASE1_INFO,
+    CASE2_INFO,
     GOAL_INFO,
     CONTEXT_INFO,
     DESCRIPTION_INFO,
     PROPERTYCLAIM1_INFO,
+    PROPERTYCLAIM2_INFO,
     EVIDENTIALCLAIM1_INFO,
     EVIDENCE1_INFO_NO_ID,
     USER1_INFO,
@@ -26,6 +28,7 @@ from eap_api.models import (
     Evidence,
     EAPUser,
     EAPGroup,
+    CaseChange,
 )
 
 
@@ -286,3 +289,165 @@ class GroupCase(TestCase):
             test_entry.editable_cases.get_queryset()[0].name, test_casename
         )
         self.assertEqual(len(test_entry.viewable_cases.get_queryset()), 0)
+
+
+class CaseIdTestCase(TestCase):
+    """
+    creates a small tree of items and tests that they all know which
+    AssuranceCase they are in, including after being moved to another case
+    """
+
+    def setUp(self):
+        self.case1 = AssuranceCase.objects.create(**CASE1_INFO)
+        self.case2 = AssuranceCase.objects.create(**CASE2_INFO)
+        self.goal = TopLevelNormativeGoal.objects.create(**GOAL_INFO)
+        self.context = Context.objects.create(**CONTEXT_INFO)
+        self.pclaim1 = PropertyClaim.objects.create(**PROPERTYCLAIM1_INFO)
+        self.pclaim2 = PropertyClaim.objects.create(
+            **dict(PROPERTYCLAIM2_INFO, goal_id=None), property_claim=self.pclaim1
+        )
+        self.eclaim = EvidentialClaim.objects.create(**EVIDENTIALCLAIM1_INFO)
+        self.eclaim.property_claim.set([self.pclaim2])
+        self.evidence = Evidence.objects.create(**EVIDENCE1_INFO_NO_ID)
+        self.evidence.evidential_claim.set([self.eclaim])
+
+    def assert_case_of_items(self, case):
+        for model in (Context, PropertyClaim, EvidentialClaim, Evidence):
+            for item in model.objects.all():
+                self.assertEqual(item.assurance_case_id, case.id)
+
+    def test_case_id_on_creation(self):
+        self.assert_case_of_items(self.case1)
+
+    def test_case_id_after_moving_goal(self):
+        goal = TopLevelNormativeGoal.objects.get(pk=self.goal.pk)
+        goal.assurance_case = self.case2
+        goal.save()
+        self.assert_case_of_items(self.case2)
+
+    def test_case_id_after_moving_claim(self):
+        goal2 = TopLevelNormativeGoal.objects.create(
+            **dict(GOAL_INFO, assurance_case_id=self.case2.id)
+        )
+        pclaim1 = PropertyClaim.objects.get(pk=self.pclaim1.pk)
+        pclaim1.goal = goal2
+        pclaim1.save()
+        self.assertEqual(Context.objects.get().assurance_case_id, self.case1.id)
+        for model in (PropertyClaim, EvidentialClaim, Evidence):
+            for item in model.objects.all():
+                self.assertEqual(item.assurance_case_id, self.case2.id)
+
+    def test_case_id_after_changing_evidential_claim_parents(self):
+        self.eclaim.property_claim.clear()
+        self.assertIsNone(EvidentialClaim.objects.get().assurance_case_id)
+        self.assertIsNone(Evidence.objects.get().assurance_case_id)
+        self.pclaim1.evidential_claims.add(self.eclaim)
+        self.assert_case_of_items(self.case1)
+
+    def test_case_id_after_deleting_owner(self):
+        owner = EAPUser.objects.create(**USER1_INFO)
+        AssuranceCase.objects.filter(pk=self.case1.pk).update(owner=owner)
+        # the evidential claim is also under a claim of the other case
+        goal2 = TopLevelNormativeGoal.objects.create(
+            **dict(GOAL_INFO, assurance_case_id=self.case2.id)
+        )
+        pclaim3 = PropertyClaim.objects.create(
+            **dict(PROPERTYCLAIM1_INFO, goal_id=goal2.id)
+        )
+        self.eclaim.property_claim.add(pclaim3)
+        # and another one, with its evidence, is only in the deleted case
+        eclaim2 = EvidentialClaim.objects.create(**EVIDENTIALCLAIM1_INFO)
+        eclaim2.property_claim.set([self.pclaim1])
+        evidence2 = Evidence.objects.create(**EVIDENCE1_INFO_NO_ID)
+        evidence2.evidential_claim.set([eclaim2])
+        self.assertEqual(
+            EvidentialClaim.objects.get(pk=self.eclaim.pk).assurance_case_id,
+            self.case1.id,
+        )
+        owner.delete()
+        self.assertFalse(AssuranceCase.objects.filter(pk=self.case1.pk).exists())
+        self.assertEqual(
+            list(EvidentialClaim.objects.values_list("pk", "assurance_case_id")),
+            [(self.eclaim.pk, self.case2.pk)],
+        )
+        self.assertEqual(
+            list(Evidence.objects.values_list("pk", "assurance_case_id")),
+            [(self.evidence.pk, self.case2.pk)],
+        )
+        self.assertEqual(list(self.eclaim.property_claim.all()), [pclaim3])
+        # logged as created in the other case
+        created = CaseChange.objects.filter(
+            assurance_case=self.case2, action=CaseChange.Action.CREATED
+        ).values_list("item_type", "item_id")
+        self.assertIn(("evidential_claim", self.eclaim.pk), created)
+        self.assertIn(("evidence", self.evidence.pk), created)
+
+
+class PropertyClaimTreeTestCase(TestCase):
+    """
+    creates a few levels of nested PropertyClaims and tests the queries over
+    their hierarchy
+    """
+
+    def setUp(self):
+        AssuranceCase.objects.create(**CASE1_INFO)
+        self.goal = TopLevelNormativeGoal.objects.create(**GOAL_INFO)
+        self.other_goal = TopLevelNormativeGoal.objects.create(**GOAL_INFO)
+        self.claim1 = PropertyClaim.objects.create(**PROPERTYCLAIM1_INFO)
+        claim_info = dict(PROPERTYCLAIM2_INFO, goal_id=None)
+        self.claim2 = PropertyClaim.objects.create(
+            **claim_info, property_claim=self.claim1
+        )
+        self.claim2b = PropertyClaim.objects.create(
+            **claim_info, property_claim=self.claim1
+        )
+        self.claim3 = PropertyClaim.objects.create(
+            **claim_info, property_claim=self.claim2
+        )
+        self.other_claim = PropertyClaim.objects.create(
+            **dict(PROPERTYCLAIM1_INFO, goal_id=self.other_goal.id)
+        )
+
+    def test_subtree(self):
+        with self.assertNumQueries(1):
+            claims = set(PropertyClaim.objects.subtree(claim_ids=[self.claim1.id]))
+        self.assertEqual(claims, {self.claim1, self.claim2, self.claim2b, self.claim3})
+        claims = PropertyClaim.objects.subtree(goal_ids=[self.goal.id])
+        self.assertEqual(
+            set(claims), {self.claim1, self.claim2, self.claim2b, self.claim3}
+        )
+        claims = PropertyClaim.objects.subtree(
+            goal_ids=[self.other_goal.id], claim_ids=[self.claim2.id]
+        )
+        self.assertEqual(set(claims), {self.other_claim, self.claim2, self.claim3})
+        self.assertFalse(PropertyClaim.objects.subtree())
+
+    def test_ancestors(self):
+        with self.assertNumQueries(1):
+            claims = list(PropertyClaim.objects.ancestors(self.claim3.id))
+        self.assertEqual(claims, [self.claim1, self.claim2])
+        self.assertFalse(PropertyClaim.objects.ancestors(self.claim1.id))
+
+    def test_depth(self):
+        with self.assertNumQueries(1):
+            depth = PropertyClaim.objects.subtree(goal_ids=[self.goal.id]).depth()
+        self.assertEqual(depth, 3)
+        claims = PropertyClaim.objects.subtree(claim_ids=[self.claim2.id])
+        self.assertEqual(claims.depth(), 2)
+        self.assertEqual(PropertyClaim.objects.subtree().depth(), 0)
+
+    def test_depth_stale_levels(self):
+        # Stored levels of older claims may be wrong.
+        PropertyClaim.objects.filter(pk=self.claim3.pk).update(level=1)
+        PropertyClaim.objects.filter(pk=self.claim2b.pk).update(level=7)
+        claims = PropertyClaim.objects.subtree(goal_ids=[self.goal.id])
+        self.assertEqual(claims.depth(), 3)
+        self.assertEqual(
+            claims.depths(),
+            {
+                self.claim1.pk: 1,
+                self.claim2.pk: 2,
+                self.claim2b.pk: 2,
+                self.claim3.pk: 3,
+            },
+        )
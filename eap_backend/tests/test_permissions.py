@@ -1,11 +1,15 @@
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.authtoken.models import Token
 import json
 from eap_api.models import (
+    AssuranceCase,
     EAPUser,
     EAPGroup,
 )
+from eap_api.view_utils import get_allowed_cases
 
 from .constants_tests import (
     CASE1_INFO,
@@ -47,6 +51,8 @@ class CasePermissionsTest(TestCase):
         group2.member.set([user1.id, user2.id])
         group3 = EAPGroup.objects.create(**GROUP3_INFO, owner_id=user3.id)
         group3.member.set([user2.id, user3.id])
+        self.users = (user1, user2, user3)
+        self.groups = (group1, group2, group3)
         token1, created = Token.objects.get_or_create(user=user1)
         token2, created = Token.objects.get_or_create(user=user2)
         token3, created = Token.objects.get_or_create(user=user3)
@@ -188,3 +194,43 @@ class CasePermissionsTest(TestCase):
         # user3 should be able to delete it.
         delete_detail3 = self.client3.delete(reverse("case_detail", kwargs={"pk": 1}))
         self.assertEqual(delete_detail3.status_code, 204)
+
+    def test_allowed_cases_permissions(self):
+        """
+        Each user should get the right permission level on every case, as a
+        single query however many cases and groups there are.
+        """
+        user1, user2, user3 = self.users
+        group1, group2, group3 = self.groups
+        case1 = AssuranceCase.objects.create(**CASE1_INFO, owner=user1)
+        case1.edit_groups.set([group1])
+        case2 = AssuranceCase.objects.create(**CASE2_INFO, owner=user2)
+        case2.view_groups.set([group2])
+        case3 = AssuranceCase.objects.create(**CASE3_INFO, owner=user3)
+        case3.view_groups.set([group1, group3])
+        case3.edit_groups.set([group3])
+        unowned = AssuranceCase.objects.create(**CASE1_INFO)
+        expected = {
+            user1: {case1: "manage", case2: "view", case3: "view", unowned: "manage"},
+            user2: {case2: "manage", case3: "edit", unowned: "manage"},
+            user3: {case1: "edit", case3: "manage", unowned: "manage"},
+        }
+        for user, expected_permissions in expected.items():
+            with self.assertNumQueries(1):
+                permissions = {
+                    case: case.permissions for case in get_allowed_cases(user)
+                }
+            self.assertEqual(permissions, expected_permissions)
+
+    def test_case_list_constant_queries(self):
+        user1, user2, user3 = self.users
+        group1, group2, group3 = self.groups
+        AssuranceCase.objects.create(**CASE1_INFO, owner=user1)
+        with CaptureQueriesContext(connection) as few_cases_queries:
+            self.client1.get(reverse("case_list"))
+        for _ in range(5):
+            case = AssuranceCase.objects.create(**CASE2_INFO, owner=user2)
+            case.view_groups.set([group2, group3])
+        with self.assertNumQueries(len(few_cases_queries)):
+            response_get = self.client1.get(reverse("case_list"))
+        self.assertEqual(len(response_get.json()), 6)
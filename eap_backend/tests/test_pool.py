@@ -0,0 +1,98 @@
+import threading
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from eap_api import pool as pool_module
+from eap_api.models import EAPUser
+from eap_api.pool import ConnectionPool, PoolTimeout, get_pool
+from .constants_tests import USER1_INFO
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(TestCase):
+    def setUp(self):
+        self.opened = []
+
+    def connect(self):
+        connection = FakeConnection(len(self.opened))
+        self.opened.append(connection)
+        return connection
+
+    def test_reuse(self):
+        pool = ConnectionPool("test", max_size=2)
+        first = pool.get(self.connect)
+        second = pool.get(self.connect)
+        self.assertEqual(pool.stats()["in_use"], 2)
+        pool.put(first)
+        pool.put(second)
+        # The most recently used connection is reused first.
+        self.assertIs(pool.get(self.connect), second)
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(pool.stats()["size"], 2)
+        self.assertEqual(pool.stats()["idle"], 1)
+
+    def test_timeout(self):
+        pool = ConnectionPool("test", max_size=1, timeout=0.05)
+        pool.get(self.connect)
+        with self.assertRaises(PoolTimeout):
+            pool.get(self.connect)
+        stats = pool.stats()
+        self.assertEqual((stats["waits"], stats["timeouts"]), (1, 1))
+        self.assertGreater(stats["wait_seconds"], 0)
+
+    def test_wait(self):
+        pool = ConnectionPool("test", max_size=1, timeout=10)
+        connection = pool.get(self.connect)
+        timer = threading.Timer(0.05, pool.put, [connection])
+        timer.start()
+        self.assertIs(pool.get(self.connect), connection)
+        timer.join()
+        self.assertEqual(pool.stats()["waits"], 1)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_broken_connections_dropped(self):
+        pool = ConnectionPool(
+            "test", max_size=1, check=lambda connection: connection.number > 0
+        )
+        first = pool.get(self.connect)
+        pool.put(first)
+        # Fails the check, so is closed and replaced.
+        second = pool.get(self.connect)
+        self.assertTrue(first.closed)
+        self.assertEqual(second.number, 1)
+        pool.put(second, broken=True)
+        self.assertTrue(second.closed)
+        self.assertEqual(pool.stats()["size"], 0)
+
+    def test_failed_connect(self):
+        pool = ConnectionPool("test", max_size=1)
+
+        def connect():
+            raise OSError
+
+        with self.assertRaises(OSError):
+            pool.get(connect)
+        self.assertEqual(pool.stats()["size"], 0)
+        pool.get(self.connect)
+
+    def test_metrics(self):
+        user = EAPUser.objects.create(**USER1_INFO, is_staff=True)
+        token = Token.objects.create(user=user)
+        pool = get_pool("test-metrics", max_size=3)
+        self.addCleanup(pool_module._pools.pop, "test-metrics")
+        pool.get(self.connect)
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION=f"Token {token.key}"
+        )
+        text = response.content.decode()
+        self.assertIn('eap_db_pool_max_size{database="test-metrics"} 3', text)
+        self.assertIn('eap_db_pool_in_use{database="test-metrics"} 1', text)
+        self.assertIn('eap_db_pool_waits_total{database="test-metrics"} 0', text)
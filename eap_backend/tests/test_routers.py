@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.urls import resolve
+from eap_api.models import AssuranceCase
+from eap_api.routers import ReplicaMiddleware, ReplicaRouter
+
+
+@override_settings(READ_REPLICAS=["replica1"])
+class ReplicaRoutingTest(TransactionTestCase):
+    def setUp(self):
+        caches[settings.CASE_CACHE].clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def route(self, method, path, token="a"):
+        """Make a request through ReplicaMiddleware, returning the read database."""
+        request = self.factory.generic(
+            method, path, HTTP_AUTHORIZATION=f"Token {token}"
+        )
+        request.resolver_match = resolve(path)
+        read_from = []
+
+        def get_response(request):
+            middleware.process_view(request, None, (), {})
+            read_from.append(self.router.db_for_read(AssuranceCase))
+            return None
+
+        middleware = ReplicaMiddleware(get_response)
+        middleware(request)
+        return read_from[0]
+
+    def test_read_views(self):
+        self.assertEqual(self.route("GET", "/api/cases/1/"), "replica1")
+        self.assertEqual(self.route("GET", "/api/parents/goal/1"), "replica1")
+        self.assertEqual(self.route("GET", "/api/cases/1/changes/"), "default")
+        self.assertEqual(self.route("PUT", "/api/cases/1/"), "default")
+        # Outside of requests.
+        self.assertEqual(self.router.db_for_read(AssuranceCase), "default")
+        self.assertEqual(self.router.db_for_write(AssuranceCase), "default")
+
+    def test_read_your_writes(self):
+        self.route("POST", "/api/goals/", token="a")
+        self.assertEqual(self.route("GET", "/api/cases/1/", token="a"), "default")
+        self.assertEqual(self.route("GET", "/api/cases/1/", token="b"), "replica1")
+        with override_settings(REPLICA_PIN_SECONDS=0):
+            self.route("PUT", "/api/goals/1/", token="c")
+        self.assertEqual(self.route("GET", "/api/cases/1/", token="c"), "replica1")
+
+    def test_transactions(self):
+        request = self.factory.get("/api/cases/1/")
+        request.resolver_match = resolve("/api/cases/1/")
+
+        def get_response(request):
+            middleware.process_view(request, None, (), {})
+            with transaction.atomic():
+                return self.router.db_for_read(AssuranceCase)
+
+        middleware = ReplicaMiddleware(get_response)
+        self.assertEqual(middleware(request), "default")
+
+    @override_settings(READ_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(self.route("GET", "/api/cases/1/"), "default")
+        self.assertTrue(self.router.allow_migrate("default", "eap_api"))
@@ -1,7 +1,13 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import OperationalError, connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.authtoken.models import Token
 from eap_api.views import make_summary
+from eap_api import view_utils
 from eap_api.models import (
     AssuranceCase,
     TopLevelNormativeGoal,
@@ -12,6 +18,8 @@ from eap_api.models import (
     Evidence,
     EAPUser,
     EAPGroup,
+    CaseChange,
+    CaseLock,
 )
 from eap_api.serializers import (
     AssuranceCaseSerializer,
@@ -24,7 +32,10 @@ from eap_api.serializers import (
     EAPUserSerializer,
     EAPGroupSerializer,
 )
+import datetime
 import json
+from io import StringIO
+from unittest import mock
 from .constants_tests import (
     CASE1_INFO,
     GOAL_INFO,
@@ -34,6 +45,7 @@ from .constants_tests import (
     PROPERTYCLAIM2_INFO,
     EVIDENTIALCLAIM1_INFO,
     USER1_INFO,
+    USER2_INFO,
     GROUP1_INFO,
     # for many-to-many relations, need to NOT have
     # e.g. evidential_claim_id in the JSON
@@ -72,6 +84,239 @@ class CaseViewTest(TestCase):
         response_get = self.client.get(reverse("case_list"))
         self.assertEqual(len(response_get.json()), 2)
 
+    def make_case_tree(self, width):
+        """JSON for a case with `width` items of each type under each parent."""
+
+        def items(info, **children):
+            return [dict(info, **children) for _ in range(width)]
+
+        claim_info = dict(PROPERTYCLAIM1_INFO, goal_id=None)
+        evidential_claims = items(
+            EVIDENTIALCLAIM1_INFO, evidence=items(EVIDENCE1_INFO_NO_ID)
+        )
+        case_tree = dict(
+            CASE1_INFO,
+            goals=items(
+                GOAL_INFO,
+                context=items(CONTEXT_INFO),
+                system_description=items(DESCRIPTION_INFO),
+                property_claims=items(
+                    claim_info,
+                    evidential_claims=evidential_claims,
+                    property_claims=items(
+                        claim_info, evidential_claims=evidential_claims
+                    ),
+                ),
+            ),
+        )
+        # don't share the nested dicts
+        return json.loads(json.dumps(case_tree))
+
+    def test_case_list_view_post_tree(self):
+        with CaptureQueriesContext(connection) as small_case_queries:
+            response_post = self.client.post(
+                reverse("case_list"),
+                data=json.dumps(self.make_case_tree(1)),
+                content_type="application/json",
+            )
+        self.assertEqual(response_post.status_code, 201)
+        # the number of queries doesn't grow with the number of items
+        with self.assertNumQueries(len(small_case_queries)):
+            response_post = self.client.post(
+                reverse("case_list"),
+                data=json.dumps(self.make_case_tree(2)),
+                content_type="application/json",
+            )
+        self.assertEqual(response_post.status_code, 201)
+        response_get = self.client.get(
+            reverse("case_detail", kwargs={"pk": response_post.json()["id"]})
+        )
+        goals = response_get.json()["goals"]
+        self.assertEqual(len(goals), 2)
+        self.assertEqual(goals[0]["name"], GOAL_INFO["name"])
+        self.assertEqual(len(goals[1]["context"]), 2)
+        self.assertEqual(len(goals[1]["system_description"]), 2)
+        claim = goals[1]["property_claims"][1]["property_claims"][0]
+        self.assertEqual(claim["level"], 2)
+        self.assertEqual(len(claim["evidential_claims"]), 2)
+        self.assertEqual(len(claim["evidential_claims"][1]["evidence"]), 2)
+        self.assertEqual(PropertyClaim.objects.filter(level=2).count(), 1 + 8)
+        # every item knows its case
+        for model in (Context, PropertyClaim, EvidentialClaim, Evidence):
+            self.assertFalse(model.objects.filter(assurance_case=None).exists())
+
+    def test_case_list_view_post_invalid_tree(self):
+        data = self.make_case_tree(2)
+        del data["goals"][0]["keywords"]
+        data["goals"][1]["property_claims"][0]["property_claims"][1]["name"] = ""
+        response_post = self.client.post(
+            reverse("case_list"),
+            data=json.dumps(data),
+            content_type="application/json",
+        )
+        self.assertEqual(response_post.status_code, 400)
+        # every error is reported, and nothing is written
+        self.assertEqual(
+            set(response_post.json()),
+            {
+                "assurance_case.goals[0]",
+                "assurance_case.goals[1].property_claims[0].property_claims[1]",
+            },
+        )
+        self.assertIn("keywords", response_post.json()["assurance_case.goals[0]"])
+        self.assertEqual(AssuranceCase.objects.count(), 1)
+        self.assertEqual(TopLevelNormativeGoal.objects.count(), 0)
+
+    def without_ids(self, data):
+        """The JSON of a case tree, without anything that depends on the ids."""
+        if isinstance(data, list):
+            return [self.without_ids(item) for item in data]
+        return {
+            key: self.without_ids(value) if isinstance(value, list) else value
+            for key, value in data.items()
+            if not key.endswith("id") and key not in ("created_date", "version")
+        }
+
+    def test_case_import(self):
+        response_post = self.client.post(
+            reverse("case_list"),
+            data=json.dumps(self.make_case_tree(2)),
+            content_type="application/json",
+        )
+        case_url = reverse("case_detail", kwargs={"pk": response_post.json()["id"]})
+        case_data = self.client.get(case_url).json()
+        # import it back, in small batches
+        with mock.patch("eap_api.view_utils.IMPORT_BATCH_SIZE", 3):
+            response_import = self.client.post(
+                reverse("case_import"),
+                data=json.dumps(case_data),
+                content_type="application/json",
+            )
+        self.assertEqual(response_import.status_code, 201)
+        imported_url = reverse(
+            "case_detail", kwargs={"pk": response_import.json()["id"]}
+        )
+        imported_data = self.client.get(imported_url).json()
+        self.assertEqual(self.without_ids(imported_data), self.without_ids(case_data))
+        claim = imported_data["goals"][1]["property_claims"][1]["property_claims"][0]
+        self.assertEqual(claim["level"], 2)
+
+    def test_case_import_invalid(self):
+        data = self.make_case_tree(2)
+        data["goals"][1]["property_claims"][0]["property_claims"][1]["name"] = ""
+        data["goals"][1]["context"] = {}
+        with mock.patch("eap_api.view_utils.IMPORT_BATCH_SIZE", 3):
+            response_import = self.client.post(
+                reverse("case_import"),
+                data=json.dumps(data),
+                content_type="application/json",
+            )
+        self.assertEqual(response_import.status_code, 400)
+        self.assertEqual(
+            set(response_import.json()),
+            {
+                "assurance_case.goals[1].context",
+                "assurance_case.goals[1].property_claims[0].property_claims[1]",
+            },
+        )
+        # the batches written before the errors are rolled back
+        self.assertEqual(AssuranceCase.objects.count(), 1)
+        self.assertEqual(TopLevelNormativeGoal.objects.count(), 0)
+        # fields after the children can't be used
+        data = self.make_case_tree(1)
+        data["goals"][0]["keywords"] = data["goals"][0].pop("keywords")
+        response_import = self.client.post(
+            reverse("case_import"),
+            data=json.dumps(data),
+            content_type="application/json",
+        )
+        self.assertEqual(response_import.status_code, 400)
+        self.assertIn("keywords", response_import.json()["assurance_case.goals[0]"])
+        response_import = self.client.post(
+            reverse("case_import"), data='{"name": ', content_type="application/json"
+        )
+        self.assertEqual(response_import.status_code, 400)
+        self.assertEqual(AssuranceCase.objects.count(), 1)
+
+    def test_case_clone(self):
+        response_post = self.client.post(
+            reverse("case_list"),
+            data=json.dumps(self.make_case_tree(1)),
+            content_type="application/json",
+        )
+        case_id = response_post.json()["id"]
+        # share an EvidentialClaim and an Evidence between two parents
+        claims = PropertyClaim.objects.filter(assurance_case_id=case_id)
+        eclaim = EvidentialClaim.objects.filter(assurance_case_id=case_id).first()
+        eclaim.property_claim.set(claims)
+        evidence = Evidence.objects.filter(assurance_case_id=case_id).first()
+        evidence.evidential_claim.set(
+            EvidentialClaim.objects.filter(assurance_case_id=case_id)
+        )
+        case_data = self.client.get(
+            reverse("case_detail", kwargs={"pk": case_id})
+        ).json()
+        with CaptureQueriesContext(connection) as queries:
+            response_clone = self.client.post(
+                reverse("case_clone", kwargs={"pk": case_id})
+            )
+        query_count = len(queries)
+        self.assertEqual(response_clone.status_code, 201)
+        clone_id = response_clone.json()["id"]
+        self.assertNotEqual(clone_id, case_id)
+        clone_data = self.client.get(
+            reverse("case_detail", kwargs={"pk": clone_id})
+        ).json()
+        self.assertEqual(self.without_ids(clone_data), self.without_ids(case_data))
+        # the sharing is kept, between the copies
+        for model in (PropertyClaim, EvidentialClaim, Evidence):
+            self.assertEqual(
+                model.objects.filter(assurance_case_id=clone_id).count(),
+                model.objects.filter(assurance_case_id=case_id).count(),
+            )
+        clone_claims = PropertyClaim.objects.filter(assurance_case_id=clone_id)
+        shared = EvidentialClaim.objects.filter(
+            assurance_case_id=clone_id, property_claim=clone_claims[1]
+        ).filter(property_claim=clone_claims[0])
+        self.assertEqual(shared.count(), 1)
+        self.assertEqual(
+            set(shared[0].property_claim.values_list("id", flat=True)),
+            set(clone_claims.values_list("id", flat=True)),
+        )
+        # the number of queries doesn't grow with the number of items
+        response_post = self.client.post(
+            reverse("case_list"),
+            data=json.dumps(self.make_case_tree(2)),
+            content_type="application/json",
+        )
+        with self.assertNumQueries(query_count):
+            self.client.post(
+                reverse("case_clone", kwargs={"pk": response_post.json()["id"]})
+            )
+        response_clone = self.client.post(reverse("case_clone", kwargs={"pk": 100}))
+        self.assertEqual(response_clone.status_code, 404)
+
+    def test_case_clone_stale_levels(self):
+        response_post = self.client.post(
+            reverse("case_list"),
+            data=json.dumps(self.make_case_tree(1)),
+            content_type="application/json",
+        )
+        case_id = response_post.json()["id"]
+        claims = PropertyClaim.objects.filter(assurance_case_id=case_id)
+        # A claim under another one, but stored as if at the top level.
+        child = claims.filter(property_claim__isnull=False).latest("id")
+        PropertyClaim.objects.filter(pk=child.pk).update(level=1)
+        response_clone = self.client.post(reverse("case_clone", kwargs={"pk": case_id}))
+        self.assertEqual(response_clone.status_code, 201)
+        clone_claims = PropertyClaim.objects.filter(
+            assurance_case_id=response_clone.json()["id"]
+        )
+        self.assertEqual(clone_claims.count(), claims.count())
+        for claim in clone_claims.select_related("property_claim"):
+            parent_level = claim.property_claim.level if claim.property_claim else 0
+            self.assertEqual(claim.level, parent_level + 1)
+
     def test_case_list_view_get(self):
         response_get = self.client.get(reverse("case_list"))
         self.assertEqual(response_get.status_code, 200)
@@ -95,6 +340,48 @@ class CaseViewTest(TestCase):
         self.assertEqual(response_put.status_code, 200)
         self.assertEqual(response_put.json()["name"], self.update["name"])
 
+    def test_case_detail_view_put_if_match(self):
+        url = reverse("case_detail", kwargs={"pk": self.case1.pk})
+        response_get = self.client.get(url)
+        version = response_get.json()["version"]
+        etag = response_get["ETag"]
+        stale = {"name": "TestAC_stale"}
+        for update, if_match, status in [
+            (self.update, f'"{version}"', 200),
+            (stale, f'"{version}"', 412),
+            (stale, etag, 412),
+            (stale, "not a version", 400),
+        ]:
+            response_put = self.client.put(
+                url,
+                data=json.dumps(update),
+                content_type="application/json",
+                HTTP_IF_MATCH=if_match,
+            )
+            self.assertEqual(response_put.status_code, status)
+        self.assertIn("detail", response_put.json())
+        self.case1.refresh_from_db()
+        self.assertEqual(self.case1.name, self.update["name"])
+        self.assertEqual(self.case1.version, version + 1)
+        # The ETag the client got with the case works as well.
+        response_put = self.client.put(
+            url,
+            data=json.dumps(self.update),
+            content_type="application/json",
+            HTTP_IF_MATCH=self.client.get(url)["ETag"],
+        )
+        self.assertEqual(response_put.status_code, 200)
+        # A weak ETag can't match, even if it is the current one, so is rejected
+        # rather than taken as a conflict.
+        response_put = self.client.put(
+            url,
+            data=json.dumps(stale),
+            content_type="application/json",
+            HTTP_IF_MATCH="W/" + self.client.get(url)["ETag"],
+        )
+        self.assertEqual(response_put.status_code, 400)
+        self.assertIn("weak ETag", response_put.json()["detail"])
+
     def test_case_delete_with_standard_permission(self):
         url = reverse("case_detail", kwargs={"pk": self.case1.pk})
         self.client.delete(url)
@@ -102,6 +389,130 @@ class CaseViewTest(TestCase):
         response_get = self.client.get(reverse("case_list"))
         self.assertEqual(len(response_get.json()), 0)
 
+    def post_case_tree(self, width):
+        response_post = self.client.post(
+            reverse("case_list"),
+            data=json.dumps(self.make_case_tree(width)),
+            content_type="application/json",
+        )
+        return response_post.json()["id"]
+
+    def test_case_delete_whole_tree(self):
+        small_case_id = self.post_case_tree(1)
+        case_id = self.post_case_tree(2)
+        kept_case_id = self.post_case_tree(1)
+        kept_claim = PropertyClaim.objects.filter(assurance_case_id=kept_case_id)[0]
+        kept_eclaim = EvidentialClaim.objects.filter(assurance_case_id=kept_case_id)[0]
+        # evidential claims of the deleted cases also under a claim of the kept case
+        shared_eclaims = [
+            EvidentialClaim.objects.filter(assurance_case_id=small_case_id)[0],
+            EvidentialClaim.objects.filter(assurance_case_id=case_id).last(),
+        ]
+        for eclaim in shared_eclaims:
+            eclaim.property_claim.add(kept_claim)
+        # and one of the kept case under a claim of a deleted one
+        claim = PropertyClaim.objects.filter(assurance_case_id=case_id).first()
+        kept_eclaim.property_claim.add(claim)
+        with CaptureQueriesContext(connection) as small_case_queries:
+            self.client.delete(reverse("case_detail", kwargs={"pk": small_case_id}))
+        query_count = len(small_case_queries)
+        self.assertFalse(AssuranceCase.all_objects.filter(pk=small_case_id).exists())
+        # the number of queries doesn't grow with the number of items
+        with self.assertNumQueries(query_count):
+            response_delete = self.client.delete(
+                reverse("case_detail", kwargs={"pk": case_id})
+            )
+        self.assertEqual(response_delete.status_code, 204)
+        for model in (
+            TopLevelNormativeGoal,
+            Context,
+            SystemDescription,
+            PropertyClaim,
+            EvidentialClaim,
+            Evidence,
+            CaseChange,
+        ):
+            self.assertFalse(
+                model.objects.filter(
+                    assurance_case_id__in=[small_case_id, case_id]
+                ).exists()
+            )
+        # the shared items moved to the kept case, with their evidence
+        created = set(
+            CaseChange.objects.filter(
+                assurance_case_id=kept_case_id, action=CaseChange.Action.CREATED
+            ).values_list("item_type", "item_id")
+        )
+        for eclaim in shared_eclaims:
+            eclaim.refresh_from_db()
+            self.assertEqual(eclaim.assurance_case_id, kept_case_id)
+            self.assertEqual(list(eclaim.property_claim.all()), [kept_claim])
+            for evidence in eclaim.evidence.all():
+                self.assertEqual(evidence.assurance_case_id, kept_case_id)
+            self.assertIn(("evidential_claim", eclaim.pk), created)
+        self.assertEqual(
+            EvidentialClaim.objects.filter(assurance_case_id=kept_case_id).count(), 4
+        )
+        self.assertEqual(kept_eclaim.property_claim.count(), 1)
+        self.assertEqual(AssuranceCase.all_objects.count(), 2)
+
+    def test_case_delete_unlinks_other_cases(self):
+        kept_case_id = self.post_case_tree(1)
+        case_id = self.post_case_tree(1)
+        # items of the kept case, also under items of the deleted case, which stay
+        # in the kept case, where their first parents are
+        kept_eclaim = EvidentialClaim.objects.filter(assurance_case_id=kept_case_id)[0]
+        kept_eclaim.property_claim.add(
+            PropertyClaim.objects.filter(assurance_case_id=case_id)[0]
+        )
+        kept_evidence = Evidence.objects.filter(assurance_case_id=kept_case_id)[0]
+        kept_evidence.evidential_claim.add(
+            EvidentialClaim.objects.filter(assurance_case_id=case_id)[0]
+        )
+        kept_url = reverse("case_detail", kwargs={"pk": kept_case_id})
+        version = self.client.get(kept_url).json()["version"]
+        response_delete = self.client.delete(
+            reverse("case_detail", kwargs={"pk": case_id})
+        )
+        self.assertEqual(response_delete.status_code, 204)
+        self.assertEqual(kept_eclaim.property_claim.count(), 1)
+        self.assertEqual(kept_evidence.evidential_claim.count(), 1)
+        # a new version of the kept case, with the unlinked items logged as updated
+        changes = CaseChange.objects.filter(
+            assurance_case_id=kept_case_id, version__gt=version
+        )
+        self.assertEqual(
+            set(changes.values_list("version", "item_type", "item_id", "action")),
+            {
+                (version + 1, "evidential_claim", kept_eclaim.pk, "updated"),
+                (version + 1, "evidence", kept_evidence.pk, "updated"),
+            },
+        )
+        # and its JSON made again
+        response_get = self.client.get(kept_url)
+        self.assertEqual(response_get.json()["version"], version + 1)
+
+    def test_case_delete_deferred(self):
+        case_id = self.post_case_tree(1)
+        url = reverse("case_detail", kwargs={"pk": case_id})
+        # without running the on commit callbacks, which start the thread
+        with self.captureOnCommitCallbacks():
+            response_delete = self.client.delete(url + "?defer=true")
+        self.assertEqual(response_delete.status_code, 202)
+        self.assertTrue(AssuranceCase.all_objects.filter(pk=case_id).exists())
+        # hidden straight away
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response_get = self.client.get(reverse("case_list"))
+        self.assertEqual([case["id"] for case in response_get.json()], [self.case1.pk])
+        self.assertTrue(PropertyClaim.objects.filter(assurance_case_id=case_id))
+        # the background thread wasn't started, so the cases left behind are
+        # deleted by the command
+        out = StringIO()
+        call_command("purge_deleted_cases", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Deleted 1 cases.")
+        self.assertFalse(PropertyClaim.objects.filter(assurance_case_id=case_id))
+        self.assertFalse(AssuranceCase.all_objects.filter(pk=case_id).exists())
+
 
 class GoalViewTest(TestCase):
     def setUp(self):
@@ -140,6 +551,47 @@ class GoalViewTest(TestCase):
         self.assertEqual(response_put.status_code, 200)
         self.assertEqual(response_put.json()["name"], self.update["name"])
 
+    def test_goal_detail_view_put_if_match(self):
+        url = reverse("goal_detail", kwargs={"pk": self.goal.pk})
+        self.assertEqual(self.client.get(url).json()["version"], 1)
+        response_put = self.client.put(
+            url,
+            data=json.dumps(self.update),
+            content_type="application/json",
+            HTTP_IF_MATCH='"1"',
+        )
+        self.assertEqual(response_put.status_code, 200)
+        self.assertEqual(response_put.json()["version"], 2)
+        # Another editor's changes, made to the version they loaded.
+        response_put = self.client.put(
+            url,
+            data=json.dumps({"name": "TestGoal_stale"}),
+            content_type="application/json",
+            HTTP_IF_MATCH='"1"',
+        )
+        self.assertEqual(response_put.status_code, 412)
+        self.goal.refresh_from_db()
+        self.assertEqual(self.goal.name, self.update["name"])
+        self.assertEqual(self.goal.version, 2)
+        # Without If-Match, changes are made whatever the version.
+        response_put = self.client.put(
+            url,
+            data=json.dumps({"name": "TestGoal_forced"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response_put.json()["version"], 3)
+        # With the ETag sent with the goal, which changes with its case.
+        etag = self.client.get(url)["ETag"]
+        for if_match, status in [(etag, 200), (etag, 412), ("not a version", 400)]:
+            response_put = self.client.put(
+                url,
+                data=json.dumps({"name": "TestGoal_etag"}),
+                content_type="application/json",
+                HTTP_IF_MATCH=if_match,
+            )
+            self.assertEqual(response_put.status_code, status)
+        self.assertIn("detail", response_put.json())
+
     def test_goal_delete_with_standard_permission(self):
         url = reverse("goal_detail", kwargs={"pk": self.goal.pk})
         self.client.delete(url)
@@ -284,6 +736,58 @@ class PropertyClaimViewTest(TestCase):
         self.assertEqual(response_put.status_code, 200)
         self.assertEqual(response_put.json()["name"], self.update["name"])
 
+    def move(self, claim, **target):
+        return self.client.post(
+            reverse("property_claim_move", kwargs={"pk": claim.pk}),
+            data=json.dumps(target),
+            content_type="application/json",
+        )
+
+    def test_property_claim_move(self):
+        parent = self.pclaim1
+        subtree = [parent]
+        for _ in range(3):
+            parent = PropertyClaim.objects.create(
+                **dict(PROPERTYCLAIM2_INFO, goal_id=None), property_claim=parent
+            )
+            subtree.append(parent)
+        with CaptureQueriesContext(connection) as queries:
+            response_post = self.move(self.pclaim1, property_claim_id=self.pclaim2.pk)
+        query_count = len(queries)
+        self.assertEqual(response_post.status_code, 200)
+        self.assertEqual(response_post.json()["level"], 2)
+        self.assertEqual(response_post.json()["property_claim_id"], self.pclaim2.pk)
+        levels = PropertyClaim.objects.filter(pk__in=[c.pk for c in subtree])
+        self.assertEqual(list(levels.values_list("level", flat=True)), [2, 3, 4, 5])
+        self.move(self.pclaim1, goal_id=self.goal.pk)
+        self.assertEqual(list(levels.values_list("level", flat=True)), [1, 2, 3, 4])
+        # the whole subtree is updated in bulk, however deep it is
+        PropertyClaim.objects.create(
+            **dict(PROPERTYCLAIM2_INFO, goal_id=None), property_claim=subtree[-1]
+        )
+        with self.assertNumQueries(query_count):
+            self.move(self.pclaim1, property_claim_id=self.pclaim2.pk)
+        self.assertEqual(PropertyClaim.objects.order_by("-level")[0].level, 6)
+
+    def test_property_claim_move_invalid(self):
+        child = PropertyClaim.objects.create(
+            **dict(PROPERTYCLAIM2_INFO, goal_id=None), property_claim=self.pclaim1
+        )
+        response_post = self.move(self.pclaim1, property_claim_id=child.pk)
+        self.assertEqual(response_post.status_code, 400)
+        self.assertIn("property_claim_id", response_post.json())
+        response_post = self.move(self.pclaim1, property_claim_id=self.pclaim1.pk)
+        self.assertEqual(response_post.status_code, 400)
+        response_post = self.move(
+            child, goal_id=self.goal.pk, property_claim_id=self.pclaim2.pk
+        )
+        self.assertEqual(response_post.status_code, 400)
+        response_post = self.move(child, goal_id=100)
+        self.assertEqual(response_post.status_code, 400)
+        child.refresh_from_db()
+        self.assertEqual(child.property_claim_id, self.pclaim1.pk)
+        self.assertEqual(child.level, 2)
+
     def test_property_claim_delete_with_standard_permission(self):
         url = reverse("property_claim_detail", kwargs={"pk": self.pclaim1.pk})
         self.client.delete(url)
@@ -291,6 +795,50 @@ class PropertyClaimViewTest(TestCase):
         self.assertEqual(len(response_get.json()), 1)
 
 
+class ParentsViewTest(TestCase):
+    def setUp(self):
+        AssuranceCase.objects.create(**CASE1_INFO)
+        self.goal = TopLevelNormativeGoal.objects.create(**GOAL_INFO)
+        parent = PropertyClaim.objects.create(**PROPERTYCLAIM1_INFO)
+        self.claims = [parent]
+        for _ in range(3):
+            parent = PropertyClaim.objects.create(
+                **dict(PROPERTYCLAIM2_INFO, goal_id=None), property_claim=parent
+            )
+            self.claims.append(parent)
+
+    def test_parents_view_get(self):
+        url = reverse("parents", kwargs={"item_type": "property_claim", "pk": 2})
+        response_get = self.client.get(url)
+        self.assertEqual(response_get.status_code, 200)
+        self.assertEqual(
+            response_get.json(), [PropertyClaimSerializer(self.claims[0]).data]
+        )
+        url = reverse("parents", kwargs={"item_type": "property_claim", "pk": 1})
+        response_get = self.client.get(url)
+        self.assertEqual(response_get.json()[0]["id"], self.goal.id)
+        url = reverse("parents", kwargs={"item_type": "property_claim", "pk": 100})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_parents_view_get_ancestors(self):
+        claim = self.claims[-1]
+        url = reverse("parents", kwargs={"item_type": "property_claim", "pk": claim.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response_get = self.client.get(url, {"ancestors": "true"})
+        self.assertEqual(response_get.status_code, 200)
+        self.assertEqual(
+            [(item["type"], item["id"]) for item in response_get.json()],
+            [("TopLevelNormativeGoal", self.goal.id)]
+            + [("PropertyClaim", parent.id) for parent in self.claims[:-1]],
+        )
+        # the number of queries doesn't depend on the depth of the claim
+        claim = self.claims[1]
+        url = reverse("parents", kwargs={"item_type": "property_claim", "pk": claim.pk})
+        with self.assertNumQueries(len(queries)):
+            response_get = self.client.get(url, {"ancestors": "true"})
+        self.assertEqual(len(response_get.json()), 2)
+
+
 class EvidentialClaimViewTest(TestCase):
     def setUp(self):
         # Mock Entries to be modified and tested
@@ -371,6 +919,17 @@ class EvidenceViewTest(TestCase):
         self.assertEqual(response_get.json(), make_summary(self.serializer.data))
         self.assertEqual(len(response_get.json()), 2)
 
+    def test_evidence_list_view_get_by_case(self):
+        other_case = AssuranceCase.objects.create(**CASE1_INFO)
+        response_get = self.client.get(
+            reverse("evidence_list"), {"case_id": self.case.id}
+        )
+        self.assertEqual(response_get.json(), make_summary(self.serializer.data))
+        response_get = self.client.get(
+            reverse("evidence_list"), {"case_id": other_case.id}
+        )
+        self.assertEqual(response_get.json(), [])
+
     def test_evidence_detail_view_get(self):
         response_get = self.client.get(
             reverse("evidence_detail", kwargs={"pk": self.evidence1.pk})
@@ -458,6 +1017,635 @@ class FullCaseDetailViewTest(TestCase):
             2,
         )
 
+    def test_full_case_detail_view_get_constant_queries(self):
+        url = reverse("case_detail", kwargs={"pk": self.case.pk})
+        with CaptureQueriesContext(connection) as small_case_queries:
+            self.client.get(url)
+        # make the case bigger and deeper, and check the query count doesn't grow
+        parent = self.pclaim
+        for _ in range(3):
+            claim_info = dict(PROPERTYCLAIM2_INFO, goal_id=None)
+            parent = PropertyClaim.objects.create(
+                **claim_info, property_claim_id=parent.id
+            )
+            eclaim = EvidentialClaim.objects.create(**EVIDENTIALCLAIM1_INFO)
+            eclaim.property_claim.set([parent, self.pclaim])
+            evidence = Evidence.objects.create(**EVIDENCE1_INFO_NO_ID)
+            evidence.evidential_claim.set([eclaim, self.eclaim])
+        with self.assertNumQueries(len(small_case_queries)):
+            response_get = self.client.get(url)
+        response_data = response_get.json()
+        claim = response_data["goals"][0]["property_claims"][0]
+        self.assertEqual(len(claim["evidential_claims"]), 4)
+        for _ in range(3):
+            claim = claim["property_claims"][0]
+            self.assertEqual(len(claim["evidential_claims"]), 1)
+            self.assertEqual(len(claim["evidential_claims"][0]["evidence"]), 1)
+        self.assertEqual(claim["level"], 4)
+
+    def test_case_export(self):
+        parent = self.pclaim
+        for _ in range(3):
+            claim_info = dict(PROPERTYCLAIM2_INFO, goal_id=None)
+            parent = PropertyClaim.objects.create(
+                **claim_info, property_claim_id=parent.id
+            )
+            eclaim = EvidentialClaim.objects.create(**EVIDENTIALCLAIM1_INFO)
+            eclaim.property_claim.set([parent, self.pclaim])
+        response_get = self.client.get(
+            reverse("case_detail", kwargs={"pk": self.case.pk})
+        )
+        url = reverse("case_export", kwargs={"pk": self.case.pk})
+        # the same JSON, however many batches it's written in
+        for batch_size in (500, 3, 1):
+            with mock.patch("eap_api.view_utils.EXPORT_BATCH_SIZE", batch_size):
+                response_export = self.client.get(url)
+                self.assertEqual(response_export.status_code, 200)
+                self.assertTrue(response_export.streaming)
+                content = b"".join(response_export.streaming_content)
+            self.assertEqual(json.loads(content), response_get.json())
+        self.assertEqual(
+            response_export["Content-Disposition"],
+            f'attachment; filename="case-{self.case.pk}.json"',
+        )
+        response_export = self.client.get(reverse("case_export", kwargs={"pk": 100}))
+        self.assertEqual(response_export.status_code, 404)
+
+
+class ConditionalGetViewTest(TestCase):
+    def setUp(self):
+        self.case = AssuranceCase.objects.create(**CASE1_INFO)
+        self.goal = TopLevelNormativeGoal.objects.create(**GOAL_INFO)
+        self.context = Context.objects.create(**CONTEXT_INFO)
+        self.pclaim = PropertyClaim.objects.create(**PROPERTYCLAIM1_INFO)
+        self.eclaim = EvidentialClaim.objects.create(**EVIDENTIALCLAIM1_INFO)
+        self.eclaim.property_claim.set([self.pclaim])
+        self.url = reverse("case_detail", kwargs={"pk": self.case.pk})
+
+    def assert_changed(self, etag, change):
+        """Check that `change` makes the cached copy of the case stale."""
+        change()
+        response_get = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response_get.status_code, 200)
+        self.assertNotEqual(response_get["ETag"], etag)
+        return response_get["ETag"]
+
+    def test_case_detail_not_modified(self):
+        response_get = self.client.get(self.url)
+        self.assertEqual(response_get.status_code, 200)
+        etag = response_get["ETag"]
+        self.assertIn("Last-Modified", response_get)
+        with CaptureQueriesContext(connection) as queries:
+            response_get = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response_get.status_code, 304)
+        self.assertEqual(response_get["ETag"], etag)
+        # only the case itself should have been looked at
+        self.assertEqual(len(queries), 1)
+        response_get = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response_get["Last-Modified"]
+        )
+        self.assertEqual(response_get.status_code, 304)
+
+    def test_case_detail_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        etag = self.assert_changed(
+            etag,
+            lambda: self.client.put(
+                reverse("context_detail", kwargs={"pk": self.context.pk}),
+                data=json.dumps({"name": "new name"}),
+                content_type="application/json",
+            ),
+        )
+        etag = self.assert_changed(
+            etag,
+            lambda: self.client.put(
+                self.url,
+                data=json.dumps({"name": "new name"}),
+                content_type="application/json",
+            ),
+        )
+        evidence = Evidence.objects.create(**EVIDENCE1_INFO_NO_ID)
+        etag = self.assert_changed(
+            etag, lambda: evidence.evidential_claim.set([self.eclaim])
+        )
+        etag = self.assert_changed(etag, lambda: self.pclaim.evidential_claims.clear())
+        self.assert_changed(
+            etag,
+            lambda: self.client.delete(
+                reverse("context_detail", kwargs={"pk": self.context.pk})
+            ),
+        )
+
+    def test_goal_detail_not_modified(self):
+        url = reverse("goal_detail", kwargs={"pk": self.goal.pk})
+        etag = self.client.get(url)["ETag"]
+        response_get = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response_get.status_code, 304)
+        self.pclaim.name = "new name"
+        self.pclaim.save()
+        response_get = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response_get.status_code, 200)
+        self.assertEqual(response_get.json()["property_claims"][0]["name"], "new name")
+
+
+class CaseCacheTest(TestCase):
+    def setUp(self):
+        caches[settings.CASE_CACHE].clear()
+        self.case = AssuranceCase.objects.create(**CASE1_INFO)
+        self.goal = TopLevelNormativeGoal.objects.create(**GOAL_INFO)
+        self.context = Context.objects.create(**CONTEXT_INFO)
+        self.url = reverse("case_detail", kwargs={"pk": self.case.pk})
+        user = EAPUser.objects.create(**USER1_INFO, is_staff=True)
+        token = Token.objects.create(user=user)
+        self.staff_client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def get_stats(self):
+        response_get = self.staff_client.get(reverse("case_cache_stats"))
+        self.assertEqual(response_get.status_code, 200)
+        return response_get.json()
+
+    def test_case_detail_cached(self):
+        with CaptureQueriesContext(connection) as miss_queries:
+            response_miss = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as hit_queries:
+            response_hit = self.client.get(self.url)
+        self.assertEqual(response_hit.json(), response_miss.json())
+        # only the case itself should have been looked at
+        self.assertEqual(len(hit_queries), 1)
+        self.assertLess(len(hit_queries), len(miss_queries))
+        self.assertEqual(self.get_stats(), {"hits": 1, "misses": 1})
+
+    def test_case_detail_cache_invalidated(self):
+        self.client.get(self.url)
+        self.client.put(
+            reverse("context_detail", kwargs={"pk": self.context.pk}),
+            data=json.dumps({"name": "new name"}),
+            content_type="application/json",
+        )
+        response_get = self.client.get(self.url)
+        context = response_get.json()["goals"][0]["context"][0]
+        self.assertEqual(context["name"], "new name")
+        self.context.delete()
+        response_get = self.client.get(self.url)
+        self.assertEqual(response_get.json()["goals"][0]["context"], [])
+        self.assertEqual(self.get_stats(), {"hits": 0, "misses": 3})
+
+    def test_case_cache_stats_staff_only(self):
+        response_get = self.client.get(reverse("case_cache_stats"))
+        self.assertEqual(response_get.status_code, 403)
+
+
+class CaseLockViewTest(TestCase):
+    def setUp(self):
+        self.case = AssuranceCase.objects.create(**CASE1_INFO)
+        self.goal = TopLevelNormativeGoal.objects.create(
+            **dict(GOAL_INFO, assurance_case_id=self.case.pk)
+        )
+        self.lock_url = reverse("case_lock", kwargs={"pk": self.case.pk})
+
+    def lock(self, method, lock_uuid, **data):
+        return getattr(self.client, method)(
+            self.lock_url,
+            data=json.dumps(dict(data, lock_uuid=lock_uuid)),
+            content_type="application/json",
+        )
+
+    def expire_locks(self):
+        past = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+        CaseLock.objects.update(expires_date=past)
+
+    def test_case_lock(self):
+        response = self.lock("post", "tab-a")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["lock_uuid"], "tab-a")
+        self.assertEqual(response.json()["ttl"], settings.CASE_LOCK_TTL)
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.lock_uuid, "tab-a")
+        # Held by another editor.
+        response = self.lock("post", "tab-b")
+        self.assertEqual(response.status_code, 423)
+        self.assertEqual(response.json()["lock_uuid"], "tab-a")
+        self.assertEqual(self.lock("put", "tab-b").status_code, 409)
+        # Renewed, without changing the case.
+        version = self.case.version
+        expires_date = CaseLock.objects.get().expires_date
+        self.assertEqual(self.lock("put", "tab-a").status_code, 200)
+        self.assertEqual(self.lock("post", "tab-a").status_code, 200)
+        self.assertGreater(CaseLock.objects.get().expires_date, expires_date)
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.version, version)
+        # Only released by its holder.
+        self.assertEqual(self.lock("delete", "tab-b").status_code, 204)
+        self.assertEqual(CaseLock.objects.get().lock_uuid, "tab-a")
+        self.assertEqual(self.lock("delete", "tab-a").status_code, 204)
+        self.assertFalse(CaseLock.objects.exists())
+        self.case.refresh_from_db()
+        self.assertIsNone(self.case.lock_uuid)
+        self.assertEqual(self.lock("post", "tab-b").status_code, 200)
+
+    def test_case_lock_taken_over(self):
+        self.lock("post", "tab-a")
+        self.assertEqual(self.lock("post", "tab-b", force=True).status_code, 200)
+        self.assertEqual(self.lock("put", "tab-a").status_code, 409)
+        self.expire_locks()
+        self.assertEqual(self.lock("post", "tab-a").status_code, 200)
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.lock_uuid, "tab-a")
+
+    def test_case_lock_invalid(self):
+        self.assertEqual(self.lock("post", None).status_code, 400)
+        url = reverse("case_lock", kwargs={"pk": self.case.pk + 1})
+        self.assertEqual(self.client.post(url).status_code, 404)
+        # Not set by a PUT of the case any more.
+        response = self.client.put(
+            reverse("case_detail", kwargs={"pk": self.case.pk}),
+            data=json.dumps({"lock_uuid": "tab-a"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(CaseLock.objects.exists())
+        self.case.refresh_from_db()
+        self.assertIsNone(self.case.lock_uuid)
+
+    def test_item_writes_locked(self):
+        self.lock("post", "tab-a")
+        goal_url = reverse("goal_detail", kwargs={"pk": self.goal.pk})
+        update = json.dumps({"name": "Locked"})
+        context = json.dumps(dict(CONTEXT_INFO, goal_id=self.goal.pk))
+
+        def write(**headers):
+            return [
+                self.client.put(
+                    goal_url, update, content_type="application/json", **headers
+                ).status_code,
+                self.client.post(
+                    reverse("context_list"),
+                    context,
+                    content_type="application/json",
+                    **headers,
+                ).status_code,
+            ]
+
+        self.assertEqual(write(), [423, 423])
+        self.assertEqual(write(HTTP_X_CASE_LOCK="tab-b"), [423, 423])
+        self.assertEqual(self.client.delete(goal_url).status_code, 423)
+        self.goal.refresh_from_db()
+        self.assertEqual(self.goal.name, GOAL_INFO["name"])
+        self.assertFalse(Context.objects.exists())
+        # By the holder of the lock, or by anyone once the lock has expired.
+        self.assertEqual(write(HTTP_X_CASE_LOCK="tab-a"), [200, 201])
+        self.expire_locks()
+        self.assertEqual(write(), [200, 201])
+        self.assertEqual(self.client.delete(goal_url).status_code, 204)
+
+    def test_expire_case_locks(self):
+        self.lock("post", "tab-a")
+        other_case = AssuranceCase.objects.create(**CASE1_INFO)
+        self.expire_locks()
+        other_url = reverse("case_lock", kwargs={"pk": other_case.pk})
+        self.client.post(
+            other_url,
+            data=json.dumps({"lock_uuid": "tab-b"}),
+            content_type="application/json",
+        )
+        # locked before leases were kept, so without one
+        old_case = AssuranceCase.objects.create(**dict(CASE1_INFO, lock_uuid="tab-c"))
+        out = StringIO()
+        call_command("expire_case_locks", stdout=out)
+        self.assertIn("Released 2 expired locks.", out.getvalue())
+        self.case.refresh_from_db()
+        other_case.refresh_from_db()
+        old_case.refresh_from_db()
+        self.assertIsNone(self.case.lock_uuid)
+        self.assertEqual(other_case.lock_uuid, "tab-b")
+        self.assertIsNone(old_case.lock_uuid)
+        self.assertEqual(
+            list(CaseLock.objects.values_list("lock_uuid", flat=True)), ["tab-b"]
+        )
+
+
+class BatchViewTest(TestCase):
+    def setUp(self):
+        self.user = EAPUser.objects.create(**USER1_INFO)
+        token = Token.objects.create(user=self.user)
+        self.client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.case = AssuranceCase.objects.create(**CASE1_INFO, owner=self.user)
+        self.goal = TopLevelNormativeGoal.objects.create(
+            **dict(GOAL_INFO, assurance_case_id=self.case.pk)
+        )
+        self.claim = PropertyClaim.objects.create(
+            **dict(PROPERTYCLAIM1_INFO, goal_id=self.goal.pk)
+        )
+
+    def batch(self, *operations, **headers):
+        return self.client.post(
+            reverse("batch"),
+            data=json.dumps({"operations": operations}),
+            content_type="application/json",
+            **headers,
+        )
+
+    def test_batch(self):
+        context = dict(CONTEXT_INFO, goal_id=self.goal.pk)
+        evidential_claim = dict(EVIDENTIALCLAIM1_INFO, property_claim_id=[])
+        with mock.patch.object(
+            view_utils,
+            "get_case_permissions",
+            wraps=view_utils.get_case_permissions,
+        ) as get_case_permissions:
+            response = self.batch(
+                {"method": "POST", "type": "context", "data": context},
+                {
+                    "method": "PUT",
+                    "type": "goal",
+                    "id": self.goal.pk,
+                    "version": 1,
+                    "data": {"name": "Batched"},
+                },
+                {
+                    "method": "POST",
+                    "type": "evidential_claim",
+                    "data": evidential_claim,
+                },
+                {"method": "DELETE", "type": "property_claim", "id": self.claim.pk},
+                {"method": "PUT", "type": "assurance_case", "id": self.case.pk},
+            )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([r["status"] for r in results], [201, 200, 201, 204, 200])
+        self.assertEqual(results[0]["data"]["name"], CONTEXT_INFO["name"])
+        self.assertEqual(results[1]["data"]["version"], 2)
+        self.assertEqual(results[1]["data"]["shape"], "RECTANGLE")
+        self.assertEqual(Context.objects.get().pk, results[0]["data"]["id"])
+        self.assertEqual(TopLevelNormativeGoal.objects.get().name, "Batched")
+        self.assertFalse(PropertyClaim.objects.exists())
+        # Once for the case, the evidential claim not being in any.
+        self.assertEqual(get_case_permissions.call_count, 1)
+
+    def test_batch_rolled_back(self):
+        context = dict(CONTEXT_INFO, goal_id=self.goal.pk)
+        for operation, status in [
+            ({"method": "PUT", "type": "goal", "id": self.goal.pk, "version": 2}, 412),
+            ({"method": "PUT", "type": "goal", "id": self.goal.pk + 1}, 404),
+            ({"method": "PUT", "type": "goal", "id": self.goal.pk, "data": []}, 400),
+            ({"method": "POST", "type": "context", "data": {}}, 400),
+            ({"method": "PATCH", "type": "goal", "id": self.goal.pk}, 405),
+            ({"method": "DELETE", "type": "assurance_case", "id": self.case.pk}, 405),
+            ({"method": "DELETE", "type": "case", "id": self.case.pk}, 400),
+        ]:
+            response = self.batch(
+                {"method": "POST", "type": "context", "data": context},
+                {"method": "DELETE", "type": "property_claim", "id": self.claim.pk},
+                operation,
+                {"method": "DELETE", "type": "goal", "id": self.goal.pk},
+            )
+            self.assertEqual(response.status_code, status)
+            results = response.json()["results"]
+            self.assertEqual([r["status"] for r in results], [201, 204, status])
+            self.assertFalse(Context.objects.exists())
+            self.assertTrue(PropertyClaim.objects.exists())
+            self.assertTrue(TopLevelNormativeGoal.objects.exists())
+        response = self.client.post(
+            reverse("batch"),
+            data={"operations": "all"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_not_allowed(self):
+        other_user = EAPUser.objects.create(**USER2_INFO)
+        other_case = AssuranceCase.objects.create(**CASE1_INFO, owner=other_user)
+        response = self.batch(
+            {"method": "PUT", "type": "goal", "id": self.goal.pk, "data": {}},
+            {"method": "PUT", "type": "assurance_case", "id": other_case.pk},
+        )
+        self.assertEqual(response.status_code, 403)
+        # Moved to a case the user can't edit.
+        response = self.batch(
+            {
+                "method": "PUT",
+                "type": "goal",
+                "id": self.goal.pk,
+                "data": {"assurance_case_id": other_case.pk},
+            },
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(
+            TopLevelNormativeGoal.objects.get().assurance_case_id, self.case.pk
+        )
+        # Edit locked by someone else.
+        self.client.post(
+            reverse("case_lock", kwargs={"pk": self.case.pk}),
+            data={"lock_uuid": "tab-a"},
+            content_type="application/json",
+        )
+        operation = {"method": "DELETE", "type": "goal", "id": self.goal.pk}
+        self.assertEqual(self.batch(operation).status_code, 423)
+        self.assertEqual(
+            self.batch(operation, HTTP_X_CASE_LOCK="tab-a").status_code, 200
+        )
+
+    def test_batch_hidden_case(self):
+        # The items of a case waiting to be deleted are gone as far as users know.
+        AssuranceCase.all_objects.filter(pk=self.case.pk).update(
+            deleted_date=datetime.datetime.now(datetime.timezone.utc)
+        )
+        response = self.batch(
+            {"method": "PUT", "type": "goal", "id": self.goal.pk, "data": {}},
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["results"], [{"status": 404, "data": None}])
+
+
+class HealthViewTest(TestCase):
+    def test_health(self):
+        response_get = self.client.get(reverse("health"))
+        self.assertEqual(response_get.status_code, 200)
+        self.assertEqual(response_get.json(), {"status": "ok"})
+
+    def test_health_database_down(self):
+        with mock.patch(
+            "django.db.backends.utils.CursorWrapper.execute",
+            side_effect=OperationalError("down"),
+        ):
+            response_get = self.client.get(reverse("health"))
+        self.assertEqual(response_get.status_code, 503)
+
+
+class CaseChangesViewTest(TestCase):
+    def setUp(self):
+        self.case = AssuranceCase.objects.create(**CASE1_INFO)
+        self.goal = TopLevelNormativeGoal.objects.create(**GOAL_INFO)
+        self.context = Context.objects.create(**CONTEXT_INFO)
+        self.pclaim = PropertyClaim.objects.create(**PROPERTYCLAIM1_INFO)
+        self.eclaim = EvidentialClaim.objects.create(**EVIDENTIALCLAIM1_INFO)
+        self.eclaim.property_claim.set([self.pclaim])
+        self.url = reverse("case_changes", kwargs={"pk": self.case.pk})
+
+    def get_changes(self, since):
+        response_get = self.client.get(self.url, {"since": since})
+        self.assertEqual(response_get.status_code, 200)
+        return response_get.json()
+
+    def test_case_changes(self):
+        version = self.client.get(
+            reverse("case_detail", kwargs={"pk": self.case.pk})
+        ).json()["version"]
+        self.assertEqual(
+            self.get_changes(version),
+            {"version": version, "created": {}, "updated": {}, "deleted": {}},
+        )
+        self.client.put(
+            reverse("context_detail", kwargs={"pk": self.context.pk}),
+            data=json.dumps({"name": "new name"}),
+            content_type="application/json",
+        )
+        description = SystemDescription.objects.create(**DESCRIPTION_INFO)
+        Context.objects.create(**CONTEXT_INFO).delete()
+        evidence = Evidence.objects.create(**EVIDENCE1_INFO_NO_ID)
+        evidence.evidential_claim.set([self.eclaim])
+        changes = self.get_changes(version)
+        self.assertEqual(changes["version"], version + 6)
+        self.assertEqual(
+            changes["created"],
+            {
+                "system_description": [SystemDescriptionSerializer(description).data],
+                "evidence": [EvidenceSerializer(evidence).data],
+            },
+        )
+        self.assertEqual(set(changes["updated"]), {"context", "evidential_claim"})
+        self.assertEqual(changes["updated"]["context"][0]["name"], "new name")
+        self.assertEqual(
+            changes["updated"]["evidential_claim"][0]["evidence"], [evidence.pk]
+        )
+        self.assertEqual(changes["deleted"], {})
+        context_pk = self.context.pk
+        self.context.delete()
+        changes = self.get_changes(changes["version"])
+        self.assertEqual(changes["deleted"], {"context": [context_pk]})
+        self.assertEqual(changes["created"], {})
+        self.assertEqual(changes["updated"], {})
+
+    def test_case_changes_unknown(self):
+        response_get = self.client.get(self.url)
+        self.assertEqual(response_get.status_code, 400)
+        response_get = self.client.get(self.url, {"since": "latest"})
+        self.assertEqual(response_get.status_code, 400)
+        self.case.refresh_from_db()
+        response_get = self.client.get(self.url, {"since": self.case.version + 1})
+        self.assertEqual(response_get.status_code, 410)
+        # cases start at version 1, which isn't in the log
+        response_get = self.client.get(self.url, {"since": 0})
+        self.assertEqual(response_get.status_code, 410)
+        response_get = self.client.get(
+            reverse("case_changes", kwargs={"pk": 100}), {"since": 1}
+        )
+        self.assertEqual(response_get.status_code, 404)
+
+    def test_case_changes_gaps(self):
+        # a case never logged, at version 1, without the changes from version 0
+        new_case = AssuranceCase.objects.create(**CASE1_INFO)
+        url = reverse("case_changes", kwargs={"pk": new_case.pk})
+        self.assertEqual(self.client.get(url, {"since": 0}).status_code, 410)
+        self.assertEqual(self.client.get(url, {"since": 1}).status_code, 200)
+        # a version bumped without logging the change
+        self.case.refresh_from_db()
+        version = self.case.version
+        AssuranceCase.objects.filter(pk=self.case.pk).update(version=version + 1)
+        response_get = self.client.get(self.url, {"since": version})
+        self.assertEqual(response_get.status_code, 410)
+        # nor with changes logged after it
+        Context.objects.create(**CONTEXT_INFO)
+        response_get = self.client.get(self.url, {"since": version})
+        self.assertEqual(response_get.status_code, 410)
+        self.assertEqual(self.get_changes(version + 1)["version"], version + 2)
+
+    def test_case_changes_moved_items(self):
+        other_case = AssuranceCase.objects.create(**CASE1_INFO)
+        self.case.refresh_from_db()
+        version = self.case.version
+        self.goal.assurance_case = other_case
+        self.goal.save()
+        changes = self.get_changes(version)
+        self.assertEqual(
+            changes["deleted"],
+            {
+                "goal": [self.goal.pk],
+                "context": [self.context.pk],
+                "property_claim": [self.pclaim.pk],
+                "evidential_claim": [self.eclaim.pk],
+            },
+        )
+        url = reverse("case_changes", kwargs={"pk": other_case.pk})
+        changes = self.client.get(url, {"since": 1}).json()
+        self.assertEqual(
+            {item_type: len(items) for item_type, items in changes["created"].items()},
+            {"goal": 1, "context": 1, "property_claim": 1, "evidential_claim": 1},
+        )
+        # the log of a case goes with it
+        other_case_pk = other_case.pk
+        other_case.delete()
+        self.assertFalse(CaseChange.objects.filter(assurance_case_id=other_case_pk))
+
+
+class ListPaginationTest(TestCase):
+    def setUp(self):
+        AssuranceCase.objects.create(**CASE1_INFO)
+        TopLevelNormativeGoal.objects.create(**GOAL_INFO)
+        self.contexts = [Context.objects.create(**CONTEXT_INFO) for _ in range(5)]
+
+    def test_list_pages(self):
+        url = reverse("context_list")
+        response_get = self.client.get(url, {"limit": 2, "case_id": 1})
+        self.assertEqual(response_get.status_code, 200)
+        self.assertEqual(
+            [item["id"] for item in response_get.json()],
+            [context.id for context in self.contexts[:2]],
+        )
+        self.assertEqual(response_get["X-Next-Cursor"], str(self.contexts[1].id))
+        ids = [item["id"] for item in response_get.json()]
+        while "Link" in response_get:
+            next_url = response_get["Link"].split(">")[0].lstrip("<")
+            self.assertIn("case_id=1", next_url)
+            response_get = self.client.get(next_url)
+            ids += [item["id"] for item in response_get.json()]
+        self.assertEqual(ids, [context.id for context in self.contexts])
+        self.assertNotIn("X-Next-Cursor", response_get)
+
+    def test_list_pages_constant_queries(self):
+        url = reverse("evidence_list")
+        for _ in range(4):
+            evidence = Evidence.objects.create(**EVIDENCE1_INFO_NO_ID)
+        with self.assertNumQueries(1):
+            response_get = self.client.get(url, {"limit": 1})
+        with self.assertNumQueries(1):
+            response_get = self.client.get(
+                url, {"limit": 2, "cursor": response_get["X-Next-Cursor"]}
+            )
+        self.assertEqual(response_get.json()[-1]["id"], evidence.id - 1)
+
+    def test_list_pages_without_limit(self):
+        response_get = self.client.get(reverse("case_list"))
+        self.assertEqual(len(response_get.json()), 1)
+        self.assertNotIn("Link", response_get)
+        url = reverse("context_list")
+        with mock.patch("eap_api.view_utils.MAX_PAGE_SIZE", 2):
+            # every item, for the clients that don't follow the cursors
+            response_get = self.client.get(url, {"case_id": 1})
+            self.assertEqual(len(response_get.json()), 5)
+            self.assertNotIn("Link", response_get)
+            # pages, if asked for
+            response_get = self.client.get(url, {"cursor": 0})
+            self.assertEqual(len(response_get.json()), 2)
+            self.assertIn("Link", response_get)
+
+    def test_list_pages_invalid(self):
+        url = reverse("goal_list")
+        self.assertEqual(self.client.get(url, {"limit": 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"cursor": "abc"}).status_code, 400)
+        response_get = self.client.get(reverse("case_list"), {"cursor": "abc"})
+        self.assertEqual(response_get.status_code, 400)
+
 
 class UserViewNoAuthTest(TestCase):
     def setUp(self):
@@ -65,6 +65,10 @@ class CaseContainer extends Component {
         });
         this.setState({ loading: false });
       }
+      if (this.inEditMode() && !this.heartbeat) {
+        // Still holding the lock from before a reload of the page.
+        this.resumeEditing();
+      }
     }
   };
 
@@ -86,6 +90,44 @@ class CaseContainer extends Component {
     return fetch(backendURL, requestOptions);
   }
 
+  submitLockChange(method, body = {}) {
+    // Take (POST), renew (PUT) or release (DELETE) the edit lock on the current case,
+    // for this browser tab.
+    const id = this.state.assurance_case.id;
+    const backendURL = `${getBaseURL()}/cases/${id}/lock/`;
+    body["lock_uuid"] = this.state.session_id;
+    const requestOptions = {
+      method: method,
+      headers: {
+        Authorization: `Token ${localStorage.getItem("token")}`,
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify(body),
+      // Let the release go through when the tab is closing.
+      keepalive: method === "DELETE",
+    };
+    return fetch(backendURL, requestOptions);
+  }
+
+  startHeartbeat(ttl) {
+    // Renew the edit lock well before it expires, for as long as we are editing. If
+    // it has been lost, e.g. taken over by someone else, stop editing.
+    this.stopHeartbeat();
+    this.heartbeat = setInterval(() => {
+      this.submitLockChange("PUT").then((response) => {
+        if (response.status !== 200) {
+          this.stopHeartbeat();
+          this.updateView();
+        }
+      });
+    }, (ttl * 1000) / 3);
+  }
+
+  stopHeartbeat() {
+    clearInterval(this.heartbeat);
+    this.heartbeat = null;
+  }
+
   deleteCurrentCase() {
     const id = this.state.assurance_case.id;
     const backendURL = `${getBaseURL()}/cases/${id}/`;
@@ -156,8 +198,9 @@ class CaseContainer extends Component {
   cleanup() {
     clearInterval(this.timer);
     this.timer = null;
+    this.stopHeartbeat();
     if (this.state.assurance_case.lock_uuid === this.state.session_id) {
-      this.submitCaseChange("lock_uuid", null);
+      this.submitLockChange("DELETE");
     }
   }
 
@@ -437,34 +480,41 @@ class CaseContainer extends Component {
   }
 
   enableEditing() {
-    if (!this.state.assurance_case.lock_uuid) {
-      this.submitCaseChange("lock_uuid", this.state.session_id).then(
-        (response) => {
-          this.updateView();
-        }
-      );
-    } else if (this.state.assurance_case.lock_uuid !== this.state.session_id) {
-      // override!
+    this.submitLockChange("POST").then(async (response) => {
       if (
+        response.status === 423 &&
         window.confirm(
           "Are you sure?  You might be overwriting someone's work..."
         )
       ) {
-        this.submitCaseChange("lock_uuid", this.state.session_id).then(
-          (response) => {
-            this.updateView();
-          }
-        );
+        // override!
+        response = await this.submitLockChange("POST", { force: true });
       }
-    }
+      if (response.status === 200) {
+        const lock = await response.json();
+        this.startHeartbeat(lock.ttl);
+      }
+      this.updateView();
+    });
+  }
+
+  resumeEditing() {
+    this.heartbeat = true;
+    this.submitLockChange("PUT").then(async (response) => {
+      if (response.status === 200) {
+        const lock = await response.json();
+        this.startHeartbeat(lock.ttl);
+      } else {
+        this.heartbeat = null;
+      }
+    });
   }
 
   disableEditing() {
-    if (this.state.assurance_case.lock_uuid) {
-      this.submitCaseChange("lock_uuid", null).then((response) => {
-        this.updateView();
-      });
-    }
+    this.stopHeartbeat();
+    this.submitLockChange("DELETE").then((response) => {
+      this.updateView();
+    });
   }
 
   inEditMode() {
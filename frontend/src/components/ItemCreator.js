@@ -64,6 +64,7 @@ function ItemCreator(props) {
       method: "POST",
       headers: {
         Authorization: `Token ${localStorage.getItem("token")}`,
+        "X-Case-Lock": window.sessionStorage.getItem("session_id"),
         "Content-Type": "application/json",
       },
       body: JSON.stringify(request_body),
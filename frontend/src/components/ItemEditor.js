@@ -57,6 +57,7 @@ function ItemEditor(props) {
       method: "DELETE",
       headers: {
         Authorization: `Token ${localStorage.getItem("token")}`,
+        "X-Case-Lock": window.sessionStorage.getItem("session_id"),
         "Content-Type": "application/json",
       },
       body: JSON.stringify({}),
@@ -90,6 +91,7 @@ function ItemEditor(props) {
       method: "PUT",
       headers: {
         Authorization: `Token ${localStorage.getItem("token")}`,
+        "X-Case-Lock": window.sessionStorage.getItem("session_id"),
         "Content-Type": "application/json",
       },
       body: JSON.stringify(request_body),
@@ -117,6 +119,7 @@ function ItemEditor(props) {
         method: "PUT",
         headers: {
           Authorization: `Token ${localStorage.getItem("token")}`,
+          "X-Case-Lock": window.sessionStorage.getItem("session_id"),
           "Content-Type": "application/json",
         },
         body: JSON.stringify(current),
@@ -156,6 +159,7 @@ function ItemEditor(props) {
         method: "PUT",
         headers: {
           Authorization: `Token ${localStorage.getItem("token")}`,
+          "X-Case-Lock": window.sessionStorage.getItem("session_id"),
           "Content-Type": "application/json",
         },
         body: JSON.stringify(current),